@@ -0,0 +1,168 @@
+import math
+from typing import Callable, Dict, Optional, Tuple
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf-flat", "ivf-pq", "hnsw")
+INDEX_OPTIONS = ("nlist", "pq_m", "pq_bits", "hnsw_m", "ef_construction", "nprobe", "ef_search", "storage", "rerank")
+# Vector encodings for the flat index; everything but float32 is compressed and can be reranked
+STORAGE_TYPES = ("float32", "fp16", "int8", "binary")
+SCALAR_QUANTIZERS = {"fp16": "QT_fp16", "int8": "QT_8bit"}
+# IVF indexes without an explicit nprobe probe this fraction of their lists (1 list gave recall@10 ~0.3)
+NPROBE_FRACTION = 8
+
+
+def index_config(
+  index_type: str = "flat",
+  nlist: Optional[int] = None,
+  pq_m: int = 8,
+  pq_bits: int = 8,
+  hnsw_m: int = 32,
+  ef_construction: int = 40,
+  nprobe: Optional[int] = None,
+  ef_search: Optional[int] = None,
+  storage: str = "float32",
+  rerank: int = 4,
+) -> Dict:
+  """
+  Describe a FAISS index. Build-time options (nlist, pq_m, pq_bits, hnsw_m,
+  ef_construction) only apply to the matching index type; nprobe/ef_search are
+  query-time knobs that can be changed after loading.
+
+  `storage` compresses the vectors of a flat index to fp16, int8 (scalar
+  quantization) or sign bits ("binary", Hamming search). Compressed indexes fetch
+  `rerank` times more candidates and rescore them against the full-precision
+  vectors kept on disk; rerank=0 returns the compressed scores as they are.
+  """
+  if index_type not in INDEX_TYPES:
+    raise ValueError(f"Unknown index type '{index_type}', expected one of {', '.join(INDEX_TYPES)}")
+  if storage not in STORAGE_TYPES:
+    raise ValueError(f"Unknown storage '{storage}', expected one of {', '.join(STORAGE_TYPES)}")
+  if storage != "float32" and index_type != "flat":
+    raise ValueError("Quantized storage is only supported for the flat index type")
+
+  return {
+    "type": index_type,
+    "nlist": nlist,
+    "pq_m": pq_m,
+    "pq_bits": pq_bits,
+    "hnsw_m": hnsw_m,
+    "ef_construction": ef_construction,
+    "nprobe": nprobe,
+    "ef_search": ef_search,
+    "storage": storage,
+    "rerank": rerank,
+  }
+
+
+def is_compressed(config: Dict) -> bool:
+  return config.get("storage", "float32") != "float32" or config["type"] == "ivf-pq"
+
+
+def binarize(embeddings: np.ndarray) -> np.ndarray:
+  """Pack the sign bit of every dimension, as stored by the binary index"""
+  return np.packbits(embeddings > 0, axis=1)
+
+
+def bytes_per_vector(config: Dict, dimension: int) -> float:
+  """Size of one stored vector code, excluding index overhead such as HNSW links"""
+  if config["type"] == "ivf-pq":
+    return config["pq_m"] * config["pq_bits"] / 8
+  return {"float32": 4.0, "fp16": 2.0, "int8": 1.0, "binary": 1 / 8}[config.get("storage", "float32")] * dimension
+
+
+def create_index(embeddings: np.ndarray, config: Dict):
+  """Build, train (where needed) and fill an inner-product index over normalized embeddings"""
+  n, dimension = embeddings.shape
+  index_type = config["type"]
+
+  if index_type == "flat" and config["storage"] == "binary":
+    index = faiss.IndexBinaryFlat(dimension)
+    index.add(binarize(embeddings))
+    return index
+  elif index_type == "flat" and config["storage"] in SCALAR_QUANTIZERS:
+    quantizer_type = getattr(faiss.ScalarQuantizer, SCALAR_QUANTIZERS[config["storage"]])
+    index = faiss.IndexScalarQuantizer(dimension, quantizer_type, faiss.METRIC_INNER_PRODUCT)
+    index.train(embeddings)
+  elif index_type == "flat":
+    index = faiss.IndexFlatIP(dimension)  # Inner product for normalized vectors = cosine similarity
+  elif index_type == "hnsw":
+    index = faiss.IndexHNSWFlat(dimension, config["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = config["ef_construction"]
+  else:
+    # Rule of thumb: ~4 * sqrt(n) lists, but never more lists than training points
+    nlist = config["nlist"] or max(1, int(4 * math.sqrt(n)))
+    nlist = min(nlist, n)
+    config["nlist"] = nlist
+    quantizer = faiss.IndexFlatIP(dimension)
+    if index_type == "ivf-flat":
+      index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+    else:
+      if dimension % config["pq_m"]:
+        raise ValueError(f"pq_m={config['pq_m']} must divide the embedding dimension {dimension}")
+      # Each PQ codebook needs at least 2**pq_bits training points
+      pq_bits = min(config["pq_bits"], max(1, int(math.log2(n))))
+      if pq_bits < config["pq_bits"]:
+        print(
+          f"⚠️  {n} vectors are too few to train {config['pq_bits']}-bit PQ codebooks, using pq_bits={pq_bits}; "
+          f"index more passages or pass a lower --pq-bits"
+        )
+        config["pq_bits"] = pq_bits
+      index = faiss.IndexIVFPQ(
+        quantizer, dimension, nlist, config["pq_m"], config["pq_bits"], faiss.METRIC_INNER_PRODUCT
+      )
+    index.train(embeddings)
+
+  index.add(embeddings)
+  apply_search_params(index, config)
+  return index
+
+
+def default_nprobe(nlist: int) -> int:
+  return max(1, nlist // NPROBE_FRACTION)
+
+
+def apply_search_params(index: faiss.Index, config: Dict) -> None:
+  """Push the query-time knobs from config onto a built or loaded index"""
+  if config["type"] in ("ivf-flat", "ivf-pq"):
+    ivf = faiss.extract_index_ivf(index)
+    ivf.nprobe = config.get("nprobe") or default_nprobe(ivf.nlist)
+  elif config["type"] == "hnsw" and config.get("ef_search"):
+    index.hnsw.efSearch = config["ef_search"]
+
+
+def mmap_io_flags(index_type: str) -> int:
+  """faiss.read_index flags that map the index's vectors instead of copying them"""
+  if index_type in ("ivf-flat", "ivf-pq"):
+    return faiss.IO_FLAG_MMAP  # Inverted lists
+  # Flat codes (also the storage of HNSW); zero-copy mapping needs faiss >= 1.9
+  return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+
+def measure_recall(
+  search: Callable[[np.ndarray, int], Tuple[np.ndarray, np.ndarray]],
+  embeddings: np.ndarray,
+  k: int = 10,
+  num_queries: int = 1000,
+) -> float:
+  """
+  recall@k of a `search(queries, k) -> (scores, ids)` function against exact search
+  over the same embeddings. Queries are normalized midpoints of random pairs of
+  stored vectors, so they are realistic but never coincide with an indexed vector.
+  """
+  n = len(embeddings)
+  k = min(k, n)
+  rng = np.random.default_rng(0)
+  pairs = rng.integers(0, n, size=(min(num_queries, n), 2))
+  queries = embeddings[pairs[:, 0]] + embeddings[pairs[:, 1]]
+  queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+  queries = queries.astype(np.float32)
+
+  exact = faiss.IndexFlatIP(embeddings.shape[1])
+  exact.add(embeddings)
+  _, truth = exact.search(queries, k)
+  _, found = search(queries, k)
+
+  hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+  return hits / (len(queries) * k)
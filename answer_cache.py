@@ -0,0 +1,131 @@
+import hashlib
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import (
+  Column,
+  Float,
+  Integer,
+  LargeBinary,
+  MetaData,
+  String,
+  Table,
+  Text,
+  create_engine,
+  delete,
+  func,
+  select,
+  update,
+)
+
+
+class AnswerCache:
+  """SQLite-backed cache of LLM answers.
+
+  An entry is only reused when the question was answered from the same
+  retrieved FAQs (same filenames *and* same content) and the new query
+  embedding is within `similarity_threshold` cosine similarity of the cached
+  one. Editing an FAQ changes its content hash, so answers built on the old
+  text stop matching and age out through normal eviction.
+  """
+
+  def __init__(
+    self,
+    path: str = "answer_cache.sqlite",
+    similarity_threshold: float = 0.95,
+    max_entries: int = 10000,
+    ttl: Optional[float] = 7 * 24 * 3600,
+  ):
+    self.similarity_threshold = similarity_threshold
+    self.max_entries = max_entries
+    self.ttl = ttl
+    self.hits = 0
+    self.misses = 0
+    self._lock = threading.Lock()
+
+    self.engine = create_engine(f"sqlite:///{path}")
+    metadata = MetaData()
+    self.answers = Table(
+      "answers",
+      metadata,
+      Column("id", Integer, primary_key=True),
+      Column("faq_key", String(64), index=True, nullable=False),
+      Column("embedding", LargeBinary, nullable=False),
+      Column("question", Text, nullable=False),
+      Column("answer", Text, nullable=False),
+      Column("created_at", Float, nullable=False),
+      Column("last_used", Float, nullable=False, index=True),
+    )
+    metadata.create_all(self.engine)
+
+  @staticmethod
+  def faq_key(faqs: List[Dict]) -> str:
+    """Identity of a retrieved context: FAQ ids plus a hash of their content, in prompt order"""
+    digest = hashlib.sha256()
+    for faq in faqs:
+      content = hashlib.sha256(f"{faq['question']}\n{faq['answer']}".encode("utf-8")).hexdigest()
+      digest.update(f"{faq.get('filename', '')}:{content}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+  def lookup(self, faqs: List[Dict], query_embedding: np.ndarray) -> Optional[str]:
+    """Cached answer for a semantically equivalent question over the same FAQs, if any"""
+    key = self.faq_key(faqs)
+    query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+    now = time.time()
+
+    with self._lock, self.engine.begin() as conn:
+      stmt = select(self.answers.c.id, self.answers.c.embedding, self.answers.c.answer).where(
+        self.answers.c.faq_key == key
+      )
+      if self.ttl is not None:
+        stmt = stmt.where(self.answers.c.created_at >= now - self.ttl)
+
+      best_id, best_answer, best_score = None, None, self.similarity_threshold
+      for row in conn.execute(stmt):
+        score = float(np.dot(np.frombuffer(row.embedding, dtype=np.float32), query))
+        if score >= best_score:
+          best_id, best_answer, best_score = row.id, row.answer, score
+
+      if best_id is None:
+        self.misses += 1
+        return None
+
+      conn.execute(update(self.answers).where(self.answers.c.id == best_id).values(last_used=now))
+      self.hits += 1
+      return best_answer
+
+  def store(self, faqs: List[Dict], query_embedding: np.ndarray, question: str, answer: str) -> None:
+    now = time.time()
+    embedding = np.asarray(query_embedding, dtype=np.float32).reshape(-1).tobytes()
+    with self._lock, self.engine.begin() as conn:
+      conn.execute(
+        self.answers.insert().values(
+          faq_key=self.faq_key(faqs),
+          embedding=embedding,
+          question=question,
+          answer=answer,
+          created_at=now,
+          last_used=now,
+        )
+      )
+      self._evict(conn, now)
+
+  def _evict(self, conn, now: float) -> None:
+    """Drop expired entries, then least recently used ones beyond max_entries"""
+    if self.ttl is not None:
+      conn.execute(delete(self.answers).where(self.answers.c.created_at < now - self.ttl))
+
+    count = conn.execute(select(func.count()).select_from(self.answers)).scalar_one()
+    if count > self.max_entries:
+      oldest = select(self.answers.c.id).order_by(self.answers.c.last_used).limit(count - self.max_entries)
+      conn.execute(delete(self.answers).where(self.answers.c.id.in_(oldest.scalar_subquery())))
+
+  def clear(self) -> None:
+    with self._lock, self.engine.begin() as conn:
+      conn.execute(delete(self.answers))
+
+  def stats(self) -> Dict[str, float]:
+    total = self.hits + self.misses
+    return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
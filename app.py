@@ -1,16 +1,60 @@
 import streamlit as st
 import os
-from rag_service import RAGService
+from faq_processor import RETRIEVAL_MODES
+from metrics import REGISTRY
+from rag_service import RAGService, RetrievalEngine
 
 st.set_page_config(page_title="Shell FAQ Assistant", page_icon="🛢️", layout="wide")
 
 st.title("🛢️ Shell FAQ Assistant")
 st.markdown("Ask me anything about Shell services!")
 
-# Initialize session state
+# Hybrid retrieval is configured per deployment, e.g. FAQ_RETRIEVAL_MODE=rrf FAQ_LEXICAL_FIRST=1
+retrieval_mode = os.getenv("FAQ_RETRIEVAL_MODE", "dense")
+if retrieval_mode not in RETRIEVAL_MODES:
+    st.error(f"❌ FAQ_RETRIEVAL_MODE is '{retrieval_mode}'; expected one of {', '.join(RETRIEVAL_MODES)}")
+    st.stop()
+
+@st.cache_resource(show_spinner="Loading FAQ index and encoder...")
+def get_engine(retrieval_mode, lexical_first):
+    """One encoder, index and answer cache for every session served by this process"""
+    engine = RetrievalEngine(retrieval_mode=retrieval_mode, lexical_first=lexical_first)
+    # Indexes published by `cli.py build` are swapped in by a background thread, so no session waits on a reload
+    engine.watch()
+    return engine
+
+# Shared by all sessions
+engine = get_engine(retrieval_mode, os.getenv("FAQ_LEXICAL_FIRST", "") not in ("", "0"))
+
+# Initialize session state; each session only holds its own LLM client and API key
 if 'rag_service' not in st.session_state:
     st.session_state.rag_service = None
 
+@st.fragment(run_every="5s")
+def metrics_panel():
+    """Per-stage latency, token usage and cache hit rates, refreshed in place"""
+    summary = REGISTRY.summary()
+    if not summary['spans']:
+        st.caption("No questions answered yet")
+        return
+    
+    st.dataframe(
+        [
+            {"Stage": stage, "Calls": stats['count'], "p50 ms": round(stats['p50_ms'], 1), "p95 ms": round(stats['p95_ms'], 1)}
+            for stage, stats in summary['spans'].items()
+        ],
+        hide_index=True,
+        use_container_width=True,
+    )
+    
+    counters = summary['counters']
+    col1, col2 = st.columns(2)
+    col1.metric("Prompt tokens", f"{counters.get('llm_prompt_tokens_total', 0):,.0f}")
+    col2.metric("Completion tokens", f"{counters.get('llm_completion_tokens_total', 0):,.0f}")
+    for name, value in summary['gauges'].items():
+        # Hit and fast-path rates are ratios; other gauges (e.g. shards loaded) are plain values
+        st.metric(name.replace('_', ' ').capitalize(), f"{value:.0%}" if name.endswith('_rate') else f"{value:,.4g}")
+
 # Sidebar for configuration
 with st.sidebar:
     st.header("⚙️ Configuration")
@@ -27,8 +71,8 @@ with st.sidebar:
     if st.button("🚀 Initialize Service", type="primary"):
         if api_key:
             try:
-                with st.spinner("Loading FAQ database and initializing service..."):
-                    st.session_state.rag_service = RAGService(api_key)
+                with st.spinner("Initializing service..."):
+                    st.session_state.rag_service = RAGService(api_key, engine=engine)
                 st.success("✅ Service initialized successfully!")
                 st.balloons()
             except Exception as e:
@@ -42,18 +86,18 @@ with st.sidebar:
     st.subheader("📊 Status")
     if st.session_state.rag_service:
         st.success("🟢 Service: Ready")
-        try:
-            # Show some stats if possible
-            if hasattr(st.session_state.rag_service.faq_processor, 'faqs'):
-                faq_count = len(st.session_state.rag_service.faq_processor.faqs)
-                st.info(f"📚 {faq_count} FAQs loaded")
-        except:
-            pass
+        st.info(f"📚 {len(engine.faq_processor.faqs)} FAQs loaded")
     else:
         st.warning("🟡 Service: Not initialized")
     
     st.divider()
     
+    # Live pipeline metrics
+    st.subheader("⏱️ Performance")
+    metrics_panel()
+    
+    st.divider()
+    
     # Clear conversation
     if st.button("🗑️ Clear Conversation"):
         if "messages" in st.session_state:
@@ -143,41 +187,43 @@ else:
         
         # Generate and display assistant response
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                try:
-                    result = st.session_state.rag_service.answer_question(prompt)
-                    
-                    # Display the answer
-                    st.markdown(result['answer'])
-                    
-                    # Show sources in expandable section
-                    if result['sources']:
-                        with st.expander(f"📚 Sources ({len(result['sources'])})"):
-                            for i, source in enumerate(result['sources'], 1):
-                                st.write(f"**{i}. {source['question']}** (Relevance: {source['score']:.3f})")
-                                
-                                # Show first part of the answer
-                                answer_preview = source['answer'][:300] + "..." if len(source['answer']) > 300 else source['answer']
-                                st.write(answer_preview)
-                                
-                                if i < len(result['sources']):
-                                    st.divider()
-                    
-                    # Add assistant response to chat history
-                    st.session_state.messages.append({
-                        "role": "assistant", 
-                        "content": result['answer'],
-                        "sources": result['sources']
-                    })
-                    
-                except Exception as e:
-                    error_msg = f"I apologize, but I encountered an error: {str(e)}"
-                    st.error(error_msg)
-                    st.session_state.messages.append({
-                        "role": "assistant", 
-                        "content": error_msg,
-                        "sources": []
-                    })
+            try:
+                # Retrieval finishes before the first token, so only it sits behind the spinner
+                with st.spinner("Searching FAQs..."):
+                    # Earlier turns let follow-ups resolve; only a token-bounded summary reaches the LLM
+                    result = st.session_state.rag_service.stream_answer(prompt, st.session_state.messages[:-1])
+                
+                # Display the answer token by token
+                answer = st.write_stream(result['answer_stream'])
+                
+                # Show sources in expandable section
+                if result['sources']:
+                    with st.expander(f"📚 Sources ({len(result['sources'])})"):
+                        for i, source in enumerate(result['sources'], 1):
+                            st.write(f"**{i}. {source['question']}** (Relevance: {source['score']:.3f})")
+                            
+                            # Show first part of the answer
+                            answer_preview = source['answer'][:300] + "..." if len(source['answer']) > 300 else source['answer']
+                            st.write(answer_preview)
+                            
+                            if i < len(result['sources']):
+                                st.divider()
+                
+                # Add assistant response to chat history
+                st.session_state.messages.append({
+                    "role": "assistant", 
+                    "content": answer,
+                    "sources": result['sources']
+                })
+                
+            except Exception as e:
+                error_msg = f"I apologize, but I encountered an error: {str(e)}"
+                st.error(error_msg)
+                st.session_state.messages.append({
+                    "role": "assistant", 
+                    "content": error_msg,
+                    "sources": []
+                })
 
 # Footer
 st.divider()
@@ -0,0 +1,68 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Optional, Sequence
+
+
+class MicroBatcher:
+  """Coalesces concurrent async submissions into batched calls of a blocking function.
+
+  Items submitted within `max_wait` seconds of each other (or until
+  `max_batch_size` is reached) are passed together to `fn`, which runs in
+  `executor` and must return one result per item, in order.
+  """
+
+  def __init__(
+    self,
+    fn: Callable[[List[Any]], Sequence[Any]],
+    max_batch_size: int = 32,
+    max_wait: float = 0.005,
+    executor: Optional[Executor] = None,
+  ):
+    self.fn = fn
+    self.max_batch_size = max_batch_size
+    self.max_wait = max_wait
+    self.executor = executor
+    self._loop: Optional[asyncio.AbstractEventLoop] = None
+    self._pending: List = []
+    self._timer: Optional[asyncio.TimerHandle] = None
+    self._tasks: set = set()
+
+  async def submit(self, item: Any) -> Any:
+    loop = asyncio.get_running_loop()
+    if loop is not self._loop:
+      # Pending state is tied to the loop that created it
+      self._loop, self._pending, self._timer = loop, [], None
+
+    future = loop.create_future()
+    self._pending.append((item, future))
+    if len(self._pending) >= self.max_batch_size:
+      self._flush()
+    elif self._timer is None:
+      self._timer = loop.call_later(self.max_wait, self._flush)
+
+    return await future
+
+  def _flush(self) -> None:
+    if self._timer is not None:
+      self._timer.cancel()
+      self._timer = None
+
+    batch, self._pending = self._pending, []
+    if batch:
+      task = self._loop.create_task(self._run(batch))
+      self._tasks.add(task)
+      task.add_done_callback(self._tasks.discard)
+
+  async def _run(self, batch: List) -> None:
+    items = [item for item, _ in batch]
+    try:
+      results = await asyncio.get_running_loop().run_in_executor(self.executor, self.fn, items)
+    except Exception as e:
+      for _, future in batch:
+        if not future.done():
+          future.set_exception(e)
+      return
+
+    for (_, future), result in zip(batch, results):
+      if not future.done():  # The submitter may have been cancelled
+        future.set_result(result)
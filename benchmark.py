@@ -0,0 +1,125 @@
+import platform
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from ann_index import index_config
+
+DEFAULT_BATCH_SIZES = (1, 8, 32, 128)
+
+
+def parse_index_spec(spec: str) -> Dict:
+  """'TYPE' or 'TYPE:STORAGE' (e.g. 'hnsw', 'flat:int8') as an index config"""
+  index_type, _, storage = spec.partition(":")
+  return index_config(index_type, storage=storage or "float32")
+
+
+def latency_summary(seconds: Sequence[float]) -> Dict[str, float]:
+  ms = np.asarray(seconds) * 1000
+  return {
+    "p50_ms": float(np.percentile(ms, 50)),
+    "p95_ms": float(np.percentile(ms, 95)),
+    "p99_ms": float(np.percentile(ms, 99)),
+    "mean_ms": float(ms.mean()),
+  }
+
+
+def evaluate(processor, queries: List[Dict], top_k: int = 5, mode: Optional[str] = None) -> Dict:
+  """recall@k, MRR and per-query latency of processor.search, one query at a time"""
+  recall, reciprocal_ranks, latencies = [], [], []
+  for query in queries:
+    start = time.perf_counter()
+    results = processor.search(query["query"], top_k=top_k, mode=mode)
+    latencies.append(time.perf_counter() - start)
+
+    # A collapsed duplicate (see dedup.collapse) is found through its canonical FAQ
+    found = [{result.get("filename"), *(alias["filename"] for alias in result.get("aliases", []))} for result in results]
+    relevant = set(query["relevant"])
+    recall.append(len(relevant.intersection(set().union(*found))) / len(relevant))
+    rank = next((i for i, filenames in enumerate(found, 1) if filenames & relevant), None)
+    reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+
+  return {
+    f"recall_at_{top_k}": float(np.mean(recall)),
+    "mrr": float(np.mean(reciprocal_ranks)),
+    "latency": latency_summary(latencies),
+    "qps": len(queries) / sum(latencies),
+  }
+
+
+def measure_throughput(processor, queries: List[Dict], batch_sizes: Sequence[int], top_k: int = 5) -> List[Dict]:
+  """Per-batch latency and queries/second of processor.search_batch (dense retrieval) per batch size"""
+  texts = [query["query"] for query in queries]
+  runs = []
+  for batch_size in batch_sizes:
+    latencies = []
+    for start in range(0, len(texts), batch_size):
+      batch = texts[start : start + batch_size]
+      began = time.perf_counter()
+      processor.search_batch(batch, top_k=top_k, batch_size=batch_size)
+      latencies.append(time.perf_counter() - began)
+    runs.append({"batch_size": batch_size, "batch_latency": latency_summary(latencies), "qps": len(texts) / sum(latencies)})
+  return runs
+
+
+def run_benchmark(
+  processor,
+  queries: List[Dict],
+  index_configs: Optional[List[Dict]] = None,
+  batch_sizes: Sequence[int] = DEFAULT_BATCH_SIZES,
+  top_k: int = 5,
+  mode: Optional[str] = None,
+) -> Dict:
+  """
+  Benchmark a loaded processor under each index config (default: the loaded
+  one). Re-indexing reuses the stored passage vectors, so nothing is re-encoded.
+  Build the processor with cache_size=0, or repeated queries are served from cache.
+  """
+  processor.search(queries[0]["query"], top_k=top_k, mode=mode)  # Load the model before timing
+
+  report = {
+    "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    "platform": platform.platform(),
+    "model_name": processor.model_name,
+    "faqs": len(processor.faqs),
+    "passages": len(processor.passages),
+    "queries": len(queries),
+    "top_k": top_k,
+    "mode": mode or processor.retrieval_mode,
+    "runs": [],
+  }
+  for config in index_configs or [None]:
+    if config is not None:
+      began = time.perf_counter()
+      processor.reindex(config)
+      build_seconds = time.perf_counter() - began
+    else:
+      build_seconds = None
+
+    run = {"index": dict(processor.index_config), "build_seconds": build_seconds}
+    run.update(evaluate(processor, queries, top_k, mode))
+    run["batches"] = measure_throughput(processor, queries, batch_sizes, top_k)
+    report["runs"].append(run)
+  return report
+
+
+def format_report(report: Dict) -> str:
+  """Human-readable summary table of a run_benchmark report"""
+  top_k = report["top_k"]
+  lines = [
+    f"{report['queries']} queries over {report['faqs']} FAQs ({report['passages']} passages), "
+    f"mode={report['mode']}, top_k={top_k}",
+    "",
+    f"{'index':<16}{'recall@' + str(top_k):>10}{'MRR':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'qps':>9}  batched qps",
+  ]
+  for run in report["runs"]:
+    config = run["index"]
+    name = config["type"] + (f":{config['storage']}" if config.get("storage", "float32") != "float32" else "")
+    latency = run["latency"]
+    batched = ", ".join(f"{batch['batch_size']}: {batch['qps']:.0f}" for batch in run["batches"])
+    lines.append(
+      f"{name:<16}{run[f'recall_at_{top_k}']:>10.3f}{run['mrr']:>8.3f}{latency['p50_ms']:>9.2f}"
+      f"{latency['p95_ms']:>9.2f}{latency['p99_ms']:>9.2f}{run['qps']:>9.0f}  {batched}"
+    )
+  return "\n".join(lines)
@@ -0,0 +1,130 @@
+import re
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Keeps product names such as "V-Power", "Go+" and "DYNAFLEX" intact as single terms
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*\+?")
+
+
+def tokenize(text: str) -> List[str]:
+  """Lowercased terms; hyphenated and "+"-suffixed terms also emit their parts"""
+  tokens = []
+  for token in TOKEN_PATTERN.findall(text.lower()):
+    tokens.append(token)
+    base = token.rstrip("+")
+    if base != token:
+      tokens.append(base)
+    if "-" in base:
+      tokens.extend(part for part in base.split("-") if part)
+  return tokens
+
+
+class BM25Index:
+  """
+  Okapi BM25 over an in-memory inverted index with CSR-style postings: the
+  postings of term t are doc_ids/term_freqs[term_offsets[t]:term_offsets[t + 1]].
+  Everything is plain numpy arrays, so it saves to (and loads from) one .npz; the
+  vocabulary is stored the same way, as one UTF-8 blob sliced by byte offsets.
+  """
+
+  def __init__(
+    self,
+    terms: List[str],
+    term_offsets: np.ndarray,
+    doc_ids: np.ndarray,
+    term_freqs: np.ndarray,
+    doc_lengths: np.ndarray,
+    k1: float = 1.5,
+    b: float = 0.75,
+  ):
+    self.terms = terms
+    self.term_offsets = term_offsets
+    self.doc_ids = doc_ids
+    self.term_freqs = term_freqs
+    self.doc_lengths = doc_lengths
+    self.k1 = k1
+    self.b = b
+    self.vocabulary: Dict[str, int] = {term: i for i, term in enumerate(terms)}
+
+    num_docs = len(doc_lengths)
+    doc_freqs = np.diff(term_offsets)
+    self.idf = np.log(1.0 + (num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+    self.avg_doc_length = float(doc_lengths.mean()) if num_docs else 0.0
+
+  @classmethod
+  def build(cls, texts: List[str], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+    postings: Dict[str, Dict[int, int]] = {}
+    doc_lengths = np.zeros(len(texts), dtype=np.float32)
+    for doc_id, text in enumerate(texts):
+      tokens = tokenize(text)
+      doc_lengths[doc_id] = len(tokens)
+      for token in tokens:
+        counts = postings.setdefault(token, {})
+        counts[doc_id] = counts.get(doc_id, 0) + 1
+
+    terms = sorted(postings)
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    for i, term in enumerate(terms):
+      term_offsets[i + 1] = term_offsets[i] + len(postings[term])
+
+    doc_ids = np.empty(term_offsets[-1], dtype=np.int32)
+    term_freqs = np.empty(term_offsets[-1], dtype=np.float32)
+    for i, term in enumerate(terms):
+      start, end = term_offsets[i], term_offsets[i + 1]
+      doc_ids[start:end] = list(postings[term].keys())
+      term_freqs[start:end] = list(postings[term].values())
+
+    return cls(terms, term_offsets, doc_ids, term_freqs, doc_lengths, k1, b)
+
+  def search(self, query: str, top_k: int = 3) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Top documents for a query as (doc_ids, scores, coverage), best first. Coverage is
+    the fraction of distinct query terms each returned document contains.
+    """
+    term_ids = sorted({self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary})
+    num_query_terms = len(set(tokenize(query)))
+    if not term_ids:
+      empty = np.empty(0)
+      return empty.astype(np.int32), empty.astype(np.float32), empty.astype(np.float32)
+
+    scores = np.zeros(len(self.doc_lengths), dtype=np.float32)
+    matched = np.zeros(len(self.doc_lengths), dtype=np.int32)
+    length_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / max(self.avg_doc_length, 1e-9))
+    for term_id in term_ids:
+      start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+      docs, freqs = self.doc_ids[start:end], self.term_freqs[start:end]
+      scores[docs] += self.idf[term_id] * freqs * (self.k1 + 1) / (freqs + length_norm[docs])
+      matched[docs] += 1
+
+    candidates = np.flatnonzero(scores)
+    top_k = min(top_k, len(candidates))
+    best = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]] if top_k else candidates
+    best = best[np.argsort(-scores[best], kind="stable")]
+    return best.astype(np.int32), scores[best], matched[best] / num_query_terms
+
+  def save(self, path: str) -> None:
+    # A fixed-width unicode array would pad every term to the longest one, at 4 bytes per character
+    encoded = [term.encode("utf-8") for term in self.terms]
+    term_bytes = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    term_byte_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(term) for term in encoded], out=term_byte_offsets[1:])
+    with open(path, "wb") as f:
+      np.savez(
+        f,
+        term_bytes=term_bytes,
+        term_byte_offsets=term_byte_offsets,
+        term_offsets=self.term_offsets,
+        doc_ids=self.doc_ids,
+        term_freqs=self.term_freqs,
+        doc_lengths=self.doc_lengths,
+        params=np.array([self.k1, self.b]),
+      )
+
+  @classmethod
+  def load(cls, path: str) -> "BM25Index":
+    with np.load(path, allow_pickle=False) as data:
+      k1, b = data["params"].tolist()
+      blob, offsets = data["term_bytes"].tobytes(), data["term_byte_offsets"]
+      terms = [blob[start:end].decode("utf-8") for start, end in zip(offsets[:-1], offsets[1:])]
+      return cls(terms, data["term_offsets"], data["doc_ids"], data["term_freqs"], data["doc_lengths"], k1, b)
@@ -0,0 +1,46 @@
+from typing import Dict, List, Optional
+
+# all-MiniLM-L6-v2 truncates at 256 word pieces; ~600 characters plus the FAQ title stays under that
+DEFAULT_CHUNK_SIZE = 600
+DEFAULT_CHUNK_OVERLAP = 100
+
+
+def chunking_config(chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE, chunk_overlap: int = DEFAULT_CHUNK_OVERLAP) -> Dict:
+  """Passage settings saved with an index. chunk_size=None or 0 indexes each FAQ as a single passage."""
+  return {"chunk_size": chunk_size or None, "chunk_overlap": chunk_overlap if chunk_size else 0}
+
+
+def split_answer(answer: str, config: Dict) -> List[str]:
+  """Split an FAQ answer into overlapping passages"""
+  if not config["chunk_size"] or len(answer) <= config["chunk_size"]:
+    return [answer]
+
+  # Imported here: langchain_text_splitters pulls in langchain_core, which commands that only load an index never need
+  from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+  splitter = RecursiveCharacterTextSplitter(
+    chunk_size=config["chunk_size"],
+    chunk_overlap=config["chunk_overlap"],
+    separators=["\n\n", "\n", ". ", " ", ""],
+  )
+  return splitter.split_text(answer) or [answer]
+
+
+def make_passages(faqs: List[Dict], config: Dict, first_row: int = 0) -> List[Dict]:
+  """
+  Passage records ({"faq": parent row, "text": chunk}) for FAQs stored from `first_row` on.
+  Questions of collapsed duplicates (see dedup.collapse) get an `alias` passage each, so
+  their phrasing still finds the canonical FAQ.
+  """
+  passages = []
+  for offset, faq in enumerate(faqs):
+    passages.extend({"faq": first_row + offset, "text": chunk} for chunk in split_answer(faq["answer"], config))
+    passages.extend(
+      {"faq": first_row + offset, "text": alias["question"], "alias": True} for alias in faq.get("aliases", [])
+    )
+  return passages
+
+
+def passage_text(faq: Dict, passage: Dict) -> str:
+  """Text that gets embedded for a passage; the FAQ title gives every chunk its topic"""
+  return f"{faq['question']} {passage['text']}"
@@ -1,16 +1,100 @@
 import argparse
+import asyncio
+import contextlib
+import json
 import os
-from rag_service import RAGService
-from faq_processor import FAQProcessor
+import sys
+import time
+from faq_processor import RETRIEVAL_MODES, FAQProcessor
+from extract_faq import DEFAULT_PARSER
+from ann_index import INDEX_TYPES, STORAGE_TYPES, index_config
+from chunking import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_SIZE, chunking_config
+from encoders import ENCODER_BACKENDS
+from embedding_cache import DEFAULT_CACHE_DIR, EmbeddingCache
+from metrics import REGISTRY
+from reranker import DEFAULT_RERANK_MODEL, CrossEncoderReranker
+from dedup import DEFAULT_JACCARD, DEFAULT_SIMILARITY, dedup_config
+from shards import DEFAULT_SHARDS_DIR, ShardedIndex, load_registry, register_shard, shard_path
+from snapshots import DEFAULT_KEEP, activate, describe, prune
+from benchmark import DEFAULT_BATCH_SIZES, format_report, parse_index_spec, run_benchmark
+from queries import load_queries, synthetic_queries
+
+# Chat messages kept for the conversation summary; older ones would never fit its token budget
+MAX_CHAT_HISTORY = 20
 
 def build_command(args):
     """Build the FAQ index"""
-    processor = FAQProcessor()
-    processor.load_faqs(args.faq_dir)
-    processor.build_index()
+    if args.shard:
+        # A shard is an ordinary index saved under the shards directory and listed in its registry
+        os.makedirs(args.shards_dir, exist_ok=True)
+        args.output = shard_path(args.shards_dir, args.shard)
+    processor = FAQProcessor(
+        encoder_backend=args.backend, encoder_threads=args.threads, encode_workers=args.encode_workers,
+        embedding_cache=None if args.no_embedding_cache else EmbeddingCache(args.embedding_cache),
+    )
+    processor.keep_snapshots = args.keep_snapshots
+    index_options = dict(
+        index_type=args.index_type, nlist=args.nlist, pq_m=args.pq_m, pq_bits=args.pq_bits,
+        hnsw_m=args.hnsw_m, ef_construction=args.ef_construction, nprobe=args.nprobe, ef_search=args.ef_search,
+        storage=args.storage, rerank=args.rerank,
+    )
+    chunk_options = dict(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    fast_path_queries = load_queries(args.fast_path) if args.fast_path else None
+    generate = None
+    if args.pregenerate_answers and not (fast_path_queries or args.incremental):
+        print("❌ --pregenerate-answers needs --fast-path calibration queries")
+        return
+    if args.pregenerate_answers:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            print("❌ --pregenerate-answers needs the OPENAI_API_KEY environment variable")
+            return
+        from langchain_openai import ChatOpenAI
+        from rag_service import faq_answer_generator
+        generate = faq_answer_generator(ChatOpenAI(model_name="gpt-4o", temperature=0, openai_api_key=api_key))
+
+    if args.incremental:
+        # Used only when there is no index yet; an existing index keeps its saved settings
+        processor.index_config = index_config(**index_options)
+        processor.chunking = chunking_config(**chunk_options)
+        processor.dedup = dedup_config(args.dedup_similarity, args.dedup_jaccard) if args.dedup else None
+        # The fast path is refreshed before the update is saved, so it publishes one snapshot
+        processor.update_index(
+            args.faq_dir, args.output, workers=args.workers, parser=args.parser,
+            fast_path_queries=fast_path_queries, fast_path_precision=args.fast_path_precision, generate=generate,
+        )
+        register_built_shard(processor, args)
+        print("✅ FAQ index is up to date!")
+        return
+
+    processor.load_faqs(args.faq_dir, workers=args.workers, parser=args.parser)
+    if args.dedup:
+        report = processor.deduplicate(args.dedup_similarity, args.dedup_jaccard)
+        print_dedup_report(report, args.dedup_report)
+    processor.build_index(**index_options, **chunk_options)
+    if fast_path_queries:
+        processor.build_fast_path(fast_path_queries, args.fast_path_precision or 0.98, generate)
     processor.save_index(args.output)
+    register_built_shard(processor, args)
     print("✅ FAQ index built and saved!")
 
+def print_dedup_report(report, path=None):
+    """Show the collapsed clusters, and write them to `path` as JSON"""
+    for cluster in report:
+        print(f"   🔗 {cluster['canonical']['question']}")
+        for alias in cluster['aliases']:
+            print(f"      ≈ {alias['question']}")
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"✓ Cluster report written to {path}")
+
+def register_built_shard(processor, args):
+    if args.shard:
+        tags = dict(tag.split('=', 1) for tag in args.tag) if args.tag else None
+        register_shard(args.shards_dir, args.shard, processor, args.faq_dir, tags)
+        print(f"✓ Registered shard '{args.shard}' in {args.shards_dir}")
+
 def ask_command(args):
     """Ask a single question"""
     api_key = args.api_key or os.getenv("OPENAI_API_KEY")
@@ -18,8 +102,11 @@ def ask_command(args):
         print("❌ Please set OPENAI_API_KEY environment variable or use --api-key")
         return
     
+    # Imported lazily so build/search never pay for the LLM client stack
+    from rag_service import RAGService
+
     try:
-        rag = RAGService(api_key)
+        rag = RAGService(api_key, engine=make_engine(args))
         result = rag.answer_question(args.question)
         
         print(f"\n🤖 Answer: {result['answer']}\n")
@@ -27,10 +114,18 @@ def ask_command(args):
         if result['sources'] and args.show_sources:
             print("📚 Sources:")
             for i, source in enumerate(result['sources'], 1):
-                print(f"{i}. {source['question']} (Score: {source['score']:.3f})")
+                print(f"{i}. {source['question']} ({format_scores(source)})")
                 if args.verbose:
                     print(f"   {source['answer'][:200]}...\n")
         
+        if result.get('fast_path'):
+            print("⚡ Answered from the precomputed FAQ table (no LLM call)")
+        
+        if args.verbose:
+            print("⏱️  Timings:")
+            for stage, stats in REGISTRY.summary()['spans'].items():
+                print(f"   {stage:<24}{stats['mean_ms']:>9.1f} ms")
+        
     except Exception as e:
         print(f"❌ Error: {e}")
 
@@ -41,9 +136,14 @@ def chat_command(args):
         print("❌ Please set OPENAI_API_KEY environment variable or use --api-key")
         return
     
+    from rag_service import RAGService
+
     try:
-        rag = RAGService(api_key)
+        start_metrics_export(args)
+        rag = RAGService(api_key, engine=make_engine(args))
         print("🛢️  Shell FAQ Assistant - Type 'quit' to exit\n")
+        # Earlier turns, so follow-up questions are understood; only a token-bounded summary is sent
+        history = []
         
         while True:
             try:
@@ -56,13 +156,21 @@ def chat_command(args):
                 if not question.strip():
                     continue
                 
-                result = rag.answer_question(question)
-                print(f"\n🤖 {result['answer']}\n")
+                # Tokens are printed as they arrive; sources are known before the first one
+                result = rag.stream_answer(question, history)
+                print("\n🤖 ", end="", flush=True)
+                parts = []
+                for chunk in result['answer_stream']:
+                    parts.append(chunk)
+                    print(chunk, end="", flush=True)
+                print("\n")
+                history += [{"role": "user", "content": question}, {"role": "assistant", "content": "".join(parts)}]
+                del history[:-MAX_CHAT_HISTORY]
                 
                 if result['sources'] and args.show_sources:
                     print("📚 Sources used:")
                     for i, source in enumerate(result['sources'], 1):
-                        print(f"{i}. {source['question']} (Score: {source['score']:.3f})")
+                        print(f"{i}. {source['question']} ({format_scores(source)})")
                     print()
                 
             except KeyboardInterrupt:
@@ -78,13 +186,21 @@ def chat_command(args):
 def search_command(args):
     """Search FAQs directly"""
     try:
-        processor = FAQProcessor()
-        processor.load_index(args.index_file)
+        if args.shards:
+            if args.mode != 'dense' or args.lexical_first:
+                print("❌ --shards searches dense-only; drop --mode and --lexical-first")
+                return
+            processor = make_shards(args)
+        else:
+            processor = FAQProcessor(retrieval_mode=args.mode, lexical_first=args.lexical_first, mmr_lambda=args.mmr)
+            processor.load_index(args.index_file, verify_checksums=args.verify_checksums)
+            processor.set_search_params(nprobe=args.nprobe, ef_search=args.ef_search)
         results = processor.search(args.query, top_k=args.top_k)
         
         print(f"\n🔍 Search results for: {args.query}\n")
         for i, result in enumerate(results, 1):
-            print(f"{i}. {result['question']} (Score: {result['score']:.3f})")
+            shard = f" [{result['shard']}]" if 'shard' in result else ""
+            print(f"{i}. {result['question']} (Score: {result['score']:.3f}){shard}")
             if args.verbose:
                 print(f"   {result['answer'][:150]}...")
             print()
@@ -92,6 +208,263 @@ def search_command(args):
     except Exception as e:
         print(f"❌ Error: {e}")
 
+def search_batch_command(args):
+    """Search FAQs for many questions, streaming JSONL results"""
+    try:
+        processor = FAQProcessor()
+        # Keep stdout clean for the JSONL stream
+        with contextlib.redirect_stdout(sys.stderr):
+            processor.load_index(args.index_file, verify_checksums=args.verify_checksums)
+        processor.set_search_params(nprobe=args.nprobe, ef_search=args.ef_search)
+
+        source = open(args.input, "r", encoding="utf-8") if args.input != '-' else sys.stdin
+        with source:
+            batch = []
+            for line in source:
+                question = line.strip()
+                if question:
+                    batch.append(question)
+                if len(batch) >= args.batch_size:
+                    _emit_batch(processor, batch, args)
+                    batch = []
+            if batch:
+                _emit_batch(processor, batch, args)
+
+    except Exception as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+
+def _emit_batch(processor, questions, args):
+    for question, results in zip(questions, processor.search_batch(questions, top_k=args.top_k, batch_size=args.batch_size)):
+        print(json.dumps({"question": question, "results": results}, ensure_ascii=False))
+    sys.stdout.flush()
+
+def bench_command(args):
+    """Benchmark retrieval quality and speed"""
+    try:
+        # Results caching would turn every repeated query into a dictionary lookup
+        processor = FAQProcessor(cache_size=0, retrieval_mode=args.mode)
+        # Keep stdout clean when the JSON report goes there
+        out = sys.stderr if args.json == '-' else sys.stdout
+        with contextlib.redirect_stdout(out):
+            processor.load_index(args.index_file, verify_checksums=args.verify_checksums)
+            processor.set_search_params(nprobe=args.nprobe, ef_search=args.ef_search)
+            queries = load_queries(args.queries) if args.queries else synthetic_queries(processor.faqs)
+            if args.limit:
+                queries = queries[:args.limit]
+            index_configs = [parse_index_spec(spec) for spec in args.index_types.split(',')] if args.index_types else None
+            batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+
+            report = run_benchmark(processor, queries, index_configs, batch_sizes, top_k=args.top_k)
+            print(f"\n📊 {format_report(report)}\n")
+
+        if args.json == '-':
+            print(json.dumps(report, indent=2))
+        elif args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            print(f"✓ Report written to {args.json}")
+
+    except Exception as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+
+def serve_command(args):
+    """Run the HTTP query server"""
+    api_key = args.api_key or os.getenv("OPENAI_API_KEY")
+    if not api_key and not args.stub_llm:
+        print("❌ Please set OPENAI_API_KEY environment variable, use --api-key, or run with --stub-llm")
+        return
+    
+    from rag_service import RAGService
+    from server import FAQServer, StubChatModel
+
+    def make_rag():
+        engine = make_engine(args, index_path=args.index_file)
+        llm = StubChatModel(latency=args.stub_latency) if args.stub_llm else None
+        return RAGService(
+            api_key, llm=llm, engine=engine,
+            max_batch_size=args.max_batch_size, max_batch_wait=args.max_wait_ms / 1000,
+        )
+
+    server = FAQServer(
+        make_rag, host=args.host, port=args.port, max_pending=args.max_pending,
+        request_timeout=args.timeout, reload_interval=args.reload_interval,
+        idle_timeout=args.idle_timeout,
+    )
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        print("\n👋 Server stopped")
+
+def shards_command(args):
+    """List the registered index shards"""
+    shards = load_registry(args.shards_dir)
+    if not shards:
+        print(f"No shards registered in {args.shards_dir}; build one with: python cli.py build --shard NAME --faq-dir DIR")
+        return
+    
+    print(f"\n🗂️  Shards in {args.shards_dir}\n")
+    for name, entry in shards.items():
+        tags = ", ".join(f"{key}={value}" for key, value in entry['tags'].items())
+        print(f"   {name:<20}{entry['count']:>6} FAQs   {entry['faq_dir']:<30}{tags}")
+
+def snapshots_command(args):
+    """List, roll back or prune the saved versions of an index"""
+    try:
+        if args.activate:
+            activate(args.index_file, args.activate)
+            print(f"✅ {args.index_file} now serves snapshot {args.activate}; running servers switch on their next reload")
+        if args.prune:
+            removed = prune(args.index_file, args.keep)
+            print(f"✓ Removed {len(removed)} old snapshot(s)" + (f": {', '.join(removed)}" if removed else ""))
+
+        snapshots = describe(args.index_file)
+        if not snapshots:
+            print(f"No snapshots of {args.index_file}; build one with: python cli.py build --output {args.index_file}")
+            return
+        print(f"\n📦 Snapshots of {args.index_file}\n")
+        for snapshot in snapshots:
+            marker = "→" if snapshot['current'] else " "
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot['created']))
+            print(f" {marker} {snapshot['version']}   {created}   {snapshot['count']:>6} FAQs "
+                  f"{snapshot['passages']:>7} passages {snapshot['bytes'] / 1e6:>9.1f} MB")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+
+def loadtest_command(args):
+    """Load-test a running server"""
+    from server import load_test
+
+    try:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+        report = asyncio.run(load_test(args.url, questions, args.endpoint, args.requests, args.concurrency))
+        print(json.dumps(report, indent=2))
+    except Exception as e:
+        print(f"❌ Error: {e}")
+
+def parity_command(args):
+    """Check that another encoder backend ranks FAQs like the index's own"""
+    try:
+        processor = FAQProcessor(encoder_threads=args.threads)
+        processor.load_index(args.index_file)
+        print(f"Comparing {args.backend} against {processor.encoder_backend} ({processor.model_name})...")
+        stats = processor.check_encoder_parity(args.backend, threads=args.threads, top_k=args.top_k)
+        
+        print(f"\n🔬 Encoder parity on {len(processor.faqs)} FAQ title queries\n")
+        for name, value in stats.items():
+            print(f"   {name:<34}{value:>10.3f}")
+        if stats['top1_agreement'] >= args.min_agreement:
+            print(f"\n✅ {args.backend} matches the top FAQ for {stats['top1_agreement']:.1%} of queries")
+        else:
+            print(f"\n❌ {args.backend} top-1 agreement {stats['top1_agreement']:.1%} is below {args.min_agreement:.1%}")
+            sys.exit(1)
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+
+def make_engine(args, index_path="faq_index"):
+    """Retrieval engine with the cross-encoder reranker requested on the command line"""
+    from rag_service import RetrievalEngine
+
+    reranker = None
+    if args.cross_encoder:
+        reranker = CrossEncoderReranker(
+            args.cross_encoder, top_k=args.rerank_top_k,
+            budget=args.rerank_budget_ms / 1000, min_score=args.rerank_min_score,
+        )
+    shards = make_shards(args) if args.shards else None
+    return RetrievalEngine(
+        index_path=index_path, reranker=reranker, rerank_candidates=args.rerank_candidates, shards=shards,
+        mmr_lambda=args.mmr, verify_checksums=args.verify_checksums,
+        retrieval_mode=args.mode, lexical_first=args.lexical_first,
+    )
+
+def make_shards(args):
+    """Sharded index over the shards named on the command line ('all' for every registered shard)"""
+    names = None if args.shards == 'all' else args.shards.split(',')
+    return ShardedIndex(
+        args.shards_dir, names, shard_timeout=args.shard_timeout, max_loaded=args.max_loaded_shards,
+        verify_checksums=args.verify_checksums, mmr_lambda=args.mmr,
+    )
+
+def format_scores(source):
+    """Retrieval score, plus the cross-encoder's when the source was reranked"""
+    scores = f"Score: {source['score']:.3f}"
+    if 'rerank_score' in source:
+        scores += f", rerank: {source['rerank_score']:.3f}"
+    return scores
+
+def start_metrics_export(args):
+    """Expose pipeline metrics as requested on the command line"""
+    if args.metrics_port:
+        REGISTRY.serve_prometheus(args.metrics_port, args.metrics_host)
+        print(f"📈 Metrics at http://{args.metrics_host}:{args.metrics_port}/metrics")
+    if args.metrics_log:
+        REGISTRY.start_json_log(args.metrics_log, args.metrics_interval)
+
+def add_metrics_arguments(subparser):
+    """Stage latency, token and cache metrics export"""
+    subparser.add_argument('--metrics-port', type=int, default=None,
+                           help='Serve Prometheus metrics on this port at /metrics')
+    subparser.add_argument('--metrics-host', default='127.0.0.1',
+                           help='Interface the metrics endpoint binds to; 0.0.0.0 exposes it to the network '
+                                '(default: 127.0.0.1)')
+    subparser.add_argument('--metrics-log', default=None,
+                           help='Append a JSON metrics summary to this file periodically')
+    subparser.add_argument('--metrics-interval', type=float, default=60.0,
+                           help='Seconds between JSON metrics summaries (default: 60)')
+
+def add_rerank_arguments(subparser):
+    """Optional cross-encoder pass choosing the FAQs sent to the LLM"""
+    subparser.add_argument('--cross-encoder', nargs='?', const=DEFAULT_RERANK_MODEL, default=None, metavar='MODEL',
+                           help=f'Rerank retrieved FAQs with a cross-encoder (default model: {DEFAULT_RERANK_MODEL})')
+    subparser.add_argument('--rerank-candidates', type=int, default=10,
+                           help='FAQs retrieved for the cross-encoder to score (default: 10)')
+    subparser.add_argument('--rerank-top-k', type=int, default=2,
+                           help='FAQs kept after reranking (default: 2)')
+    subparser.add_argument('--rerank-budget-ms', type=float, default=150.0,
+                           help='No new scoring batch starts after this many milliseconds (default: 150)')
+    subparser.add_argument('--rerank-min-score', type=float, default=None,
+                           help='Drop reranked FAQs scoring below this, keeping at least the best')
+    add_diversity_argument(subparser)
+
+def add_retrieval_mode_arguments(subparser):
+    """Dense, lexical or hybrid retrieval"""
+    subparser.add_argument('--mode', default='dense', choices=RETRIEVAL_MODES,
+                           help='Dense (FAISS), lexical (BM25) or fused rrf/weighted ranking (default: dense)')
+    subparser.add_argument('--lexical-first', action='store_true',
+                           help='Skip the embedding when the BM25 match is decisive')
+
+def add_diversity_argument(subparser):
+    """Maximal marginal relevance over dense results"""
+    subparser.add_argument('--mmr', type=float, default=None, metavar='LAMBDA',
+                           help='Diversify results by MMR; 1 ranks by relevance only, lower values penalize '
+                                'FAQs similar to ones already picked (e.g. 0.7)')
+
+def add_shard_arguments(subparser):
+    """Search a set of named index shards instead of a single index"""
+    subparser.add_argument('--shards', default=None,
+                           help='Comma-separated shards to search, or "all" (default: the single index)')
+    subparser.add_argument('--shards-dir', default=DEFAULT_SHARDS_DIR,
+                           help=f'Directory holding the shards and their registry (default: {DEFAULT_SHARDS_DIR})')
+    subparser.add_argument('--shard-timeout', type=float, default=2.0,
+                           help='Seconds to wait for each search on the shards; slower ones are left out (default: 2)')
+    subparser.add_argument('--max-loaded-shards', type=int, default=None,
+                           help='Keep at most this many shards loaded, dropping the least recently used')
+
+def add_verify_argument(subparser):
+    """Full snapshot integrity check on load"""
+    subparser.add_argument('--verify-checksums', action='store_true',
+                           help='Hash every index file against its snapshot manifest on load, not just sizes '
+                                '(reads the whole index)')
+
+def add_search_param_arguments(subparser):
+    """Query-time knobs for approximate indexes"""
+    subparser.add_argument('--nprobe', type=int, default=None,
+                           help='IVF: inverted lists probed per query (default: saved value or nlist/8)')
+    subparser.add_argument('--ef-search', type=int, default=None,
+                           help='HNSW: candidate list size per query (default: saved value or 16)')
+
 def main():
     parser = argparse.ArgumentParser(
         description="Shell FAQ Assistant - Simple CLI with RAG capabilities",
@@ -99,9 +472,26 @@ def main():
         epilog="""
 Examples:
   python cli.py build                                    # Build FAQ index
+  python cli.py build --incremental                      # Re-embed only changed FAQ files
+  python cli.py build --index-type hnsw --ef-search 64   # Approximate (HNSW) index
+  python cli.py build --storage int8                     # 4x smaller vectors, reranked at full precision
   python cli.py ask "How do I download the Shell app?"  # Ask a question
   python cli.py chat --show-sources                     # Interactive chat with sources
+  python cli.py chat --cross-encoder                     # Send only the 1-2 best reranked FAQs to the LLM
   python cli.py search "shell app" --top-k 5           # Search FAQs directly
+  python cli.py search "V-Power" --mode rrf              # Hybrid BM25 + dense search
+  python cli.py build --dedup --dedup-report dups.json   # Collapse near-duplicate FAQs
+  python cli.py search "pay at pump" --mmr 0.7           # Diversified results
+  python cli.py search-batch questions.txt > hits.jsonl  # Bulk search, one question per line
+  python cli.py bench --index-types flat,hnsw --json bench.json  # Recall/latency benchmark
+  python cli.py build --backend onnx-int8 --threads 4    # Quantized ONNX encoder
+  python cli.py build --encode-workers 4                 # Encode on 4 processes
+  python cli.py parity --backend onnx-int8               # Rankings match the torch encoder?
+  python cli.py serve --stub-llm                         # HTTP server without an OpenAI key
+  python cli.py loadtest questions.txt --concurrency 32  # Load-test a running server
+  python cli.py build --shard fleet --faq-dir shell-fleet/faq/ --tag product=fleet  # Build one index shard
+  python cli.py search "fuel card" --shards retail,fleet # Search several shards in parallel
+  python cli.py snapshots --activate v000002             # Roll the index back to an earlier build
         """
     )
     
@@ -111,8 +501,70 @@ Examples:
     build_parser = subparsers.add_parser('build', help='Build the FAQ index')
     build_parser.add_argument('--faq-dir', default='shell-retail/faq/', 
                              help='Directory containing FAQ HTML files (default: shell-retail/faq/)')
-    build_parser.add_argument('--output', default='faq_index.pkl',
-                             help='Output file for the index (default: faq_index.pkl)')
+    build_parser.add_argument('--output', default='faq_index',
+                             help='Path prefix for the index files (default: faq_index)')
+    build_parser.add_argument('--shard', default=None, metavar='NAME',
+                             help='Build the named shard under --shards-dir instead of --output, and register it')
+    build_parser.add_argument('--shards-dir', default=DEFAULT_SHARDS_DIR,
+                             help=f'Directory holding the shards and their registry (default: {DEFAULT_SHARDS_DIR})')
+    build_parser.add_argument('--tag', action='append', default=None, metavar='KEY=VALUE',
+                             help='Shard tag such as market=uk or product=ev (repeatable)')
+    build_parser.add_argument('--incremental', action='store_true',
+                             help='Only re-embed added or modified FAQ files, using the saved manifest')
+    build_parser.add_argument('--workers', type=int, default=None,
+                             help='Processes used to parse FAQ HTML files (default: all CPU cores)')
+    build_parser.add_argument('--parser', default=DEFAULT_PARSER, choices=['lxml', 'html.parser'],
+                             help=f'BeautifulSoup parser backend (default: {DEFAULT_PARSER})')
+    build_parser.add_argument('--index-type', default='flat', choices=INDEX_TYPES,
+                             help='FAISS index type: exact flat scan or approximate IVF/HNSW (default: flat)')
+    build_parser.add_argument('--nlist', type=int, default=None,
+                             help='IVF: number of inverted lists (default: ~4*sqrt(N))')
+    build_parser.add_argument('--pq-m', type=int, default=8,
+                             help='IVF-PQ: sub-quantizers, must divide the embedding dimension (default: 8)')
+    build_parser.add_argument('--pq-bits', type=int, default=8,
+                             help='IVF-PQ: bits per sub-quantizer code (default: 8)')
+    build_parser.add_argument('--hnsw-m', type=int, default=32,
+                             help='HNSW: graph neighbours per node (default: 32)')
+    build_parser.add_argument('--ef-construction', type=int, default=40,
+                             help='HNSW: candidate list size while building the graph (default: 40)')
+    build_parser.add_argument('--storage', default='float32', choices=STORAGE_TYPES,
+                             help='Flat index: vector encoding, fp16/int8/binary trade recall for memory (default: float32)')
+    build_parser.add_argument('--rerank', type=int, default=4,
+                             help='Compressed indexes: rescore rerank*k candidates at full precision, 0 to disable (default: 4)')
+    build_parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                             help=f'Characters per indexed passage, 0 for one passage per FAQ (default: {DEFAULT_CHUNK_SIZE})')
+    build_parser.add_argument('--chunk-overlap', type=int, default=DEFAULT_CHUNK_OVERLAP,
+                             help=f'Characters shared by consecutive passages (default: {DEFAULT_CHUNK_OVERLAP})')
+    build_parser.add_argument('--dedup', action='store_true',
+                             help='Collapse near-duplicate FAQs into one canonical entry with aliases')
+    build_parser.add_argument('--dedup-similarity', type=float, default=DEFAULT_SIMILARITY,
+                             help=f'Embedding cosine similarity for near-duplicates (default: {DEFAULT_SIMILARITY})')
+    build_parser.add_argument('--dedup-jaccard', type=float, default=DEFAULT_JACCARD,
+                             help=f'MinHash content similarity for near-duplicates (default: {DEFAULT_JACCARD})')
+    build_parser.add_argument('--dedup-report', default=None,
+                             help='Write the collapsed clusters to this JSON file')
+    build_parser.add_argument('--fast-path', default=None, metavar='QUERIES',
+                             help='Build the table of answers served without an LLM call, calibrated on this '
+                                  'held-out JSONL of {"query", "relevant": [filenames]} (FAQ titles are not used)')
+    build_parser.add_argument('--fast-path-precision', type=float, default=None,
+                             help='Precision the fast-path score gate is calibrated to '
+                                  '(default: 0.98, or the existing index\'s with --incremental)')
+    build_parser.add_argument('--pregenerate-answers', action='store_true',
+                             help='Have GPT-4o write the fast-path answers instead of using FAQ text (needs OPENAI_API_KEY)')
+    build_parser.add_argument('--backend', default=None, choices=ENCODER_BACKENDS,
+                             help='Encoder runtime: PyTorch, ONNX Runtime, or ONNX with int8 weights '
+                                  '(default: torch, or the existing index\'s with --incremental)')
+    build_parser.add_argument('--threads', type=int, default=None,
+                             help='Encoder intra-op threads (default: runtime default)')
+    build_parser.add_argument('--encode-workers', type=int, default=None,
+                             help='Encode passages on this many processes, splitting the CPU cores (default: 1)')
+    build_parser.add_argument('--embedding-cache', default=DEFAULT_CACHE_DIR,
+                             help=f'Directory of embeddings reused across builds, keyed by model and text (default: {DEFAULT_CACHE_DIR})')
+    build_parser.add_argument('--no-embedding-cache', action='store_true',
+                             help='Encode every passage, without reading or adding to the embedding cache')
+    build_parser.add_argument('--keep-snapshots', type=int, default=DEFAULT_KEEP,
+                             help=f'Saved index versions to keep for rollback, 0 to keep all (default: {DEFAULT_KEEP})')
+    add_search_param_arguments(build_parser)
     
     # Ask command
     ask_parser = subparsers.add_parser('ask', help='Ask a single question')
@@ -121,23 +573,142 @@ Examples:
     ask_parser.add_argument('--show-sources', action='store_true', 
                            help='Show sources used for the answer')
     ask_parser.add_argument('--verbose', action='store_true',
-                           help='Show detailed source information')
+                           help='Show detailed source information and per-stage timings')
+    add_rerank_arguments(ask_parser)
+    add_retrieval_mode_arguments(ask_parser)
+    add_shard_arguments(ask_parser)
+    add_verify_argument(ask_parser)
     
     # Chat command
     chat_parser = subparsers.add_parser('chat', help='Interactive chat')
     chat_parser.add_argument('--api-key', help='OpenAI API key (overrides OPENAI_API_KEY env var)')
     chat_parser.add_argument('--show-sources', action='store_true',
                             help='Show sources used for each answer')
+    add_rerank_arguments(chat_parser)
+    add_retrieval_mode_arguments(chat_parser)
+    add_shard_arguments(chat_parser)
+    add_verify_argument(chat_parser)
+    add_metrics_arguments(chat_parser)
     
     # Search command
     search_parser = subparsers.add_parser('search', help='Search FAQs directly')
     search_parser.add_argument('query', help='Search query')
     search_parser.add_argument('--top-k', type=int, default=5,
                               help='Number of results to return (default: 5)')
-    search_parser.add_argument('--index-file', default='faq_index.pkl',
-                              help='Index file to use (default: faq_index.pkl)')
+    search_parser.add_argument('--index-file', default='faq_index',
+                              help='Path prefix of the index to use (default: faq_index)')
     search_parser.add_argument('--verbose', action='store_true',
                               help='Show detailed results')
+    add_retrieval_mode_arguments(search_parser)
+    add_search_param_arguments(search_parser)
+    add_diversity_argument(search_parser)
+    add_shard_arguments(search_parser)
+    add_verify_argument(search_parser)
+    
+    # Search-batch command
+    search_batch_parser = subparsers.add_parser('search-batch', help='Search FAQs for many questions (JSONL output)')
+    search_batch_parser.add_argument('input', nargs='?', default='-',
+                                    help='File with one question per line (default: stdin)')
+    search_batch_parser.add_argument('--top-k', type=int, default=5,
+                                    help='Number of results per question (default: 5)')
+    search_batch_parser.add_argument('--batch-size', type=int, default=64,
+                                    help='Questions encoded and searched together (default: 64)')
+    search_batch_parser.add_argument('--index-file', default='faq_index',
+                                    help='Path prefix of the index to use (default: faq_index)')
+    add_search_param_arguments(search_batch_parser)
+    add_verify_argument(search_batch_parser)
+    
+    # Bench command
+    bench_parser = subparsers.add_parser('bench', help='Measure retrieval recall, MRR, latency and throughput')
+    bench_parser.add_argument('--queries', default=None,
+                             help='JSONL labelled queries, {"query": ..., "relevant": filename(s)} (default: derived from FAQ titles)')
+    bench_parser.add_argument('--index-file', default='faq_index',
+                             help='Path prefix of the index to use (default: faq_index)')
+    bench_parser.add_argument('--index-types', default=None,
+                             help='Comma-separated TYPE[:STORAGE] to re-index and compare, e.g. flat,hnsw,flat:int8 (default: as saved)')
+    bench_parser.add_argument('--batch-sizes', default=','.join(map(str, DEFAULT_BATCH_SIZES)),
+                             help=f"Comma-separated search_batch sizes (default: {','.join(map(str, DEFAULT_BATCH_SIZES))})")
+    bench_parser.add_argument('--top-k', type=int, default=5,
+                             help='Cutoff for recall and MRR (default: 5)')
+    bench_parser.add_argument('--mode', default='dense', choices=RETRIEVAL_MODES,
+                             help='Retrieval mode for the single-query pass (default: dense)')
+    bench_parser.add_argument('--limit', type=int, default=None,
+                             help='Only use the first N queries')
+    bench_parser.add_argument('--json', default=None,
+                             help="Write the machine-readable report to this file, '-' for stdout")
+    add_search_param_arguments(bench_parser)
+    add_verify_argument(bench_parser)
+    
+    # Parity command
+    parity_parser = subparsers.add_parser('parity', help='Check an encoder backend ranks FAQs like the index\'s own')
+    parity_parser.add_argument('--backend', default='onnx-int8', choices=ENCODER_BACKENDS,
+                              help='Encoder backend to check (default: onnx-int8)')
+    parity_parser.add_argument('--threads', type=int, default=None,
+                              help='Encoder intra-op threads for both backends (default: runtime default)')
+    parity_parser.add_argument('--index-file', default='faq_index',
+                              help='Path prefix of the reference index (default: faq_index)')
+    parity_parser.add_argument('--top-k', type=int, default=5,
+                              help='Ranking depth compared (default: 5)')
+    parity_parser.add_argument('--min-agreement', type=float, default=0.95,
+                              help='Lowest acceptable top-1 agreement (default: 0.95)')
+    
+    # Serve command
+    serve_parser = subparsers.add_parser('serve', help='Run an HTTP server with /search and /answer endpoints')
+    serve_parser.add_argument('--host', default='127.0.0.1',
+                             help='Interface to listen on (default: 127.0.0.1)')
+    serve_parser.add_argument('--port', type=int, default=8000,
+                             help='Port to listen on (default: 8000)')
+    serve_parser.add_argument('--index-file', default='faq_index',
+                             help='Path prefix of the index to serve (default: faq_index)')
+    serve_parser.add_argument('--api-key', help='OpenAI API key (overrides OPENAI_API_KEY env var)')
+    serve_parser.add_argument('--stub-llm', action='store_true',
+                             help='Answer with a canned stub instead of GPT-4o, for local runs and load tests')
+    serve_parser.add_argument('--stub-latency', type=float, default=0.0,
+                             help='Seconds the stub LLM takes per answer (default: 0)')
+    serve_parser.add_argument('--max-batch-size', type=int, default=32,
+                             help='Most concurrent queries encoded and searched together (default: 32)')
+    serve_parser.add_argument('--max-wait-ms', type=float, default=5.0,
+                             help='How long a query waits for others to batch with (default: 5)')
+    serve_parser.add_argument('--max-pending', type=int, default=256,
+                             help='Requests in flight before new ones get 503 (default: 256)')
+    serve_parser.add_argument('--timeout', type=float, default=30.0,
+                             help='Seconds before a request fails with 504 (default: 30)')
+    serve_parser.add_argument('--idle-timeout', type=float, default=15.0,
+                             help='Seconds a connection may take to send a request before it is closed (default: 15)')
+    serve_parser.add_argument('--reload-interval', type=float, default=30.0,
+                             help='Seconds between checks for a newly built index, 0 to disable (default: 30)')
+    add_rerank_arguments(serve_parser)
+    add_retrieval_mode_arguments(serve_parser)
+    add_shard_arguments(serve_parser)
+    add_verify_argument(serve_parser)
+    
+    # Loadtest command
+    loadtest_parser = subparsers.add_parser('loadtest', help='Send concurrent requests to a running server')
+    loadtest_parser.add_argument('questions', help='File with one question per line')
+    loadtest_parser.add_argument('--url', default='http://127.0.0.1:8000',
+                                help='Server base URL (default: http://127.0.0.1:8000)')
+    loadtest_parser.add_argument('--endpoint', default='answer', choices=['answer', 'search'],
+                                help='Endpoint to exercise (default: answer)')
+    loadtest_parser.add_argument('--requests', type=int, default=200,
+                                help='Total requests to send (default: 200)')
+    loadtest_parser.add_argument('--concurrency', type=int, default=16,
+                                help='Requests in flight at once (default: 16)')
+    
+    # Shards command
+    shards_parser = subparsers.add_parser('shards', help='List the registered index shards')
+    shards_parser.add_argument('--shards-dir', default=DEFAULT_SHARDS_DIR,
+                              help=f'Directory holding the shards and their registry (default: {DEFAULT_SHARDS_DIR})')
+    
+    # Snapshots command
+    snapshots_parser = subparsers.add_parser('snapshots', help='List, roll back or prune saved index versions')
+    snapshots_parser.add_argument('--index-file', default='faq_index',
+                                 help='Path prefix of the index (default: faq_index)')
+    snapshots_parser.add_argument('--activate', default=None, metavar='VERSION',
+                                 help='Serve this saved version, e.g. to roll back a bad build')
+    snapshots_parser.add_argument('--prune', action='store_true',
+                                 help='Delete old versions beyond --keep')
+    snapshots_parser.add_argument('--keep', type=int, default=DEFAULT_KEEP,
+                                 help=f'Versions kept by --prune (default: {DEFAULT_KEEP})')
     
     args = parser.parse_args()
     
@@ -154,6 +725,20 @@ Examples:
         chat_command(args)
     elif args.command == 'search':
         search_command(args)
+    elif args.command == 'search-batch':
+        search_batch_command(args)
+    elif args.command == 'bench':
+        bench_command(args)
+    elif args.command == 'parity':
+        parity_command(args)
+    elif args.command == 'serve':
+        serve_command(args)
+    elif args.command == 'loadtest':
+        loadtest_command(args)
+    elif args.command == 'shards':
+        shards_command(args)
+    elif args.command == 'snapshots':
+        snapshots_command(args)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,148 @@
+import re
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from metrics import DEFAULT_TOKEN_MODEL, token_encoding
+
+# Identical on every request so provider-side prompt caching can reuse it; nothing per-question goes here
+SYSTEM_PROMPT = """You are a helpful Shell customer service assistant. Use the FAQ information provided with each customer question to answer it accurately and helpfully.
+
+Please provide a clear, helpful answer based on the FAQ information. If the FAQs don't contain enough information, politely say so and suggest contacting Shell support directly.
+
+When a conversation summary is included, use it to understand follow-up questions, but answer only from the FAQ information."""
+
+# Rough tokens per character when tiktoken's encoding can't be loaded
+CHARS_PER_TOKEN = 4
+# Questions this short after an earlier turn are treated as follow-ups when retrieving
+FOLLOW_UP_WORDS = 6
+
+
+class ContextBuilder:
+  """Packs FAQ passages and a rolling conversation summary into a fixed prompt token budget.
+
+  The system message is constant, so it forms a cacheable prompt prefix. The
+  user message holds the conversation summary (at most `history_tokens`), then
+  as many FAQ passages as fit in the rest of `max_prompt_tokens`: each FAQ's
+  best passage in score order first, then their runners-up.
+  """
+
+  def __init__(
+    self,
+    max_prompt_tokens: int = 1500,
+    history_tokens: int = 300,
+    recent_turns: int = 2,
+    model: str = DEFAULT_TOKEN_MODEL,
+  ):
+    """
+    The last `recent_turns` exchanges are summarized with the start of the answer;
+    older ones by their question only. Without tiktoken, token counts are estimated.
+    """
+    self.max_prompt_tokens = max_prompt_tokens
+    self.history_tokens = history_tokens
+    self.recent_turns = recent_turns
+    self.model = model
+
+  def count(self, text: str) -> int:
+    encoding = token_encoding(self.model)
+    return len(encoding.encode(text)) if encoding else -(-len(text) // CHARS_PER_TOKEN)
+
+  def truncate(self, text: str, max_tokens: int) -> str:
+    """`text` cut to at most `max_tokens`, with an ellipsis when anything was cut"""
+    if max_tokens <= 0:
+      return ""
+    if self.count(text) <= max_tokens:
+      return text
+    encoding = token_encoding(self.model)
+    if encoding:
+      return encoding.decode(encoding.encode(text)[: max_tokens - 1]) + "…"
+    return text[: (max_tokens - 1) * CHARS_PER_TOKEN] + "…"
+
+  def build(self, question: str, faqs: Sequence[Dict], history: Optional[Sequence[Dict]] = None) -> List[BaseMessage]:
+    """
+    Prompt messages for `question`. `history` holds earlier {"role": "user"/"assistant",
+    "content"} chat messages, oldest first.
+    """
+    summary = self.summarize(history or [])
+    framing = self._user_message(question, "", summary)
+    budget = self.max_prompt_tokens - self.count(SYSTEM_PROMPT) - self.count(framing)
+    context = self.pack(faqs, budget)
+    return [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=self._user_message(question, context, summary))]
+
+  def pack(self, faqs: Sequence[Dict], budget: int) -> str:
+    """FAQ context within `budget` tokens. The best FAQ's first passage is truncated rather than left out."""
+    units = []  # (passage rank within its FAQ, FAQ rank, text)
+    for rank, faq in enumerate(faqs):
+      for depth, passage in enumerate(faq.get("passages") or [faq["answer"]]):
+        units.append((depth, rank, passage))
+    units.sort(key=lambda unit: unit[:2])
+
+    chosen: Dict[int, List[str]] = {}
+    for depth, rank, passage in units:
+      if depth and rank not in chosen:
+        continue  # Runner-up passages only extend an FAQ that made it in
+      # A new FAQ costs its header; further passages their separator
+      header = f"FAQ {len(chosen) + 1}:\nQ: {faqs[rank]['question']}\nA: " if rank not in chosen else " ... "
+      cost = self.count(header) + self.count(passage) + (2 if rank not in chosen and chosen else 0)
+      if cost > budget:
+        if chosen:
+          continue
+        passage = self.truncate(passage, budget - self.count(header))
+        if not passage:
+          break
+        cost = budget
+      chosen.setdefault(rank, []).append(passage)
+      budget -= cost
+
+    return "\n\n".join(
+      f"FAQ {n}:\nQ: {faqs[rank]['question']}\nA: {' ... '.join(passages)}"
+      for n, (rank, passages) in enumerate(sorted(chosen.items()), 1)
+    )
+
+  def summarize(self, history: Sequence[Dict]) -> str:
+    """Compressed rolling summary of `history`, newest turns kept first when over `history_tokens`"""
+    turns = self._turns(history)
+    lines = []
+    budget = self.history_tokens
+    for age, (question, answer) in enumerate(reversed(turns)):
+      line = f"- Customer: {self.truncate(question, 60)}"
+      if age < self.recent_turns and answer:
+        line += f"\n  Assistant: {self.truncate(self._first_sentences(answer), 80)}"
+      cost = self.count(line) + 1
+      if cost > budget:
+        break
+      lines.append(line)
+      budget -= cost
+    return "\n".join(reversed(lines))
+
+  def retrieval_query(self, question: str, history: Optional[Sequence[Dict]] = None) -> str:
+    """Search text for `question`: short follow-ups carry the previous question's terms along"""
+    turns = self._turns(history or [])
+    if turns and len(question.split()) <= FOLLOW_UP_WORDS:
+      return f"{turns[-1][0]} {question}"
+    return question
+
+  @staticmethod
+  def _turns(history: Sequence[Dict]) -> List[tuple]:
+    """(question, answer) pairs from chat messages; answer is "" for an unanswered question"""
+    turns = []
+    for message in history:
+      if message["role"] == "user":
+        turns.append((message["content"], ""))
+      elif message["role"] == "assistant" and turns and not turns[-1][1]:
+        turns[-1] = (turns[-1][0], message["content"])
+    return turns
+
+  @staticmethod
+  def _first_sentences(text: str, count: int = 2) -> str:
+    return " ".join(re.split(r"(?<=[.!?])\s+", " ".join(text.split()))[:count])
+
+  @staticmethod
+  def _user_message(question: str, context: str, summary: str) -> str:
+    conversation = f"Conversation so far:\n{summary}\n\n" if summary else ""
+    return f"""{conversation}Context from Shell FAQs:
+{context}
+
+Customer Question: {question}
+
+Answer:"""
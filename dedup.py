@@ -0,0 +1,89 @@
+import re
+import zlib
+from typing import Dict, List, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+# Near-duplicate gates: both must pass for two FAQs to be collapsed
+DEFAULT_SIMILARITY = 0.9  # Cosine similarity of the FAQ embeddings
+DEFAULT_JACCARD = 0.5  # Estimated Jaccard similarity of the extracted content's word shingles
+
+NUM_PERMUTATIONS = 64
+SHINGLE_WORDS = 3
+_PRIME = (1 << 31) - 1  # Keeps a * x + b within uint64 for 31-bit hashes
+
+
+def dedup_config(similarity: float = DEFAULT_SIMILARITY, jaccard: float = DEFAULT_JACCARD) -> Dict:
+  """Near-duplicate settings saved with an index, so full rebuilds collapse the same way"""
+  return {"similarity": similarity, "jaccard": jaccard}
+
+
+def minhash_signatures(
+  texts: Sequence[str], num_perm: int = NUM_PERMUTATIONS, shingle: int = SHINGLE_WORDS
+) -> np.ndarray:
+  """(n, num_perm) MinHash signatures of each text's word shingles; equal columns estimate Jaccard similarity"""
+  rng = np.random.default_rng(0)  # Fixed permutations, so signatures are comparable across calls
+  a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+  b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+
+  signatures = np.full((len(texts), num_perm), _PRIME, dtype=np.uint64)
+  for row, text in enumerate(texts):
+    words = re.findall(r"\w+", text.lower())
+    shingles = {" ".join(words[i : i + shingle]) for i in range(max(len(words) - shingle + 1, 1))}
+    hashes = np.array([zlib.crc32(s.encode("utf-8")) % _PRIME for s in shingles], dtype=np.uint64)
+    signatures[row] = ((np.outer(hashes, a) + b) % _PRIME).min(axis=0)
+  return signatures
+
+
+def find_clusters(
+  embeddings: np.ndarray, texts: Sequence[str], similarity: float = DEFAULT_SIMILARITY, jaccard: float = DEFAULT_JACCARD
+) -> List[List[int]]:
+  """
+  Groups of near-duplicate rows (two or more each). Candidate pairs come from a FAISS
+  range search over the L2-normalized `embeddings`; a pair is linked when the MinHash
+  estimate of its `texts` also clears `jaccard`. Links are closed transitively.
+  """
+  index = faiss.IndexFlatIP(embeddings.shape[1])
+  index.add(np.ascontiguousarray(embeddings, dtype=np.float32))
+  limits, _, neighbours = index.range_search(np.ascontiguousarray(embeddings, dtype=np.float32), similarity)
+  signatures = minhash_signatures(texts)
+
+  parent = list(range(len(texts)))
+
+  def root(i: int) -> int:
+    while parent[i] != i:
+      parent[i] = parent[parent[i]]
+      i = parent[i]
+    return i
+
+  for i in range(len(texts)):
+    for j in neighbours[limits[i] : limits[i + 1]]:
+      if j > i and np.mean(signatures[i] == signatures[j]) >= jaccard:
+        parent[root(int(j))] = root(i)
+
+  groups: Dict[int, List[int]] = {}
+  for i in range(len(texts)):
+    groups.setdefault(root(i), []).append(i)
+  return [members for members in groups.values() if len(members) > 1]
+
+
+def collapse(faqs: List[Dict], clusters: List[List[int]]) -> Tuple[List[Dict], List[Dict]]:
+  """
+  FAQs with each cluster reduced to one canonical entry (the one with the longest answer)
+  carrying the others as `aliases` ({"question", "filename"}), plus a report per cluster.
+  """
+  dropped = set()
+  canonical_faqs = {}
+  report = []
+  for members in clusters:
+    keep = max(members, key=lambda row: (len(faqs[row]["answer"]), -row))
+    aliases = [{"question": faqs[row]["question"], "filename": faqs[row]["filename"]} for row in members if row != keep]
+    canonical_faqs[keep] = {**faqs[keep], "aliases": faqs[keep].get("aliases", []) + aliases}
+    dropped.update(row for row in members if row != keep)
+    report.append(
+      {"canonical": {"question": faqs[keep]["question"], "filename": faqs[keep]["filename"]}, "aliases": aliases}
+    )
+
+  kept = [canonical_faqs.get(row, faq) for row, faq in enumerate(faqs) if row not in dropped]
+  return kept, report
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = "embedding_cache"
+# Segment files per encoder before they are merged into one
+MAX_SEGMENTS = 16
+
+
+def text_key(text: str) -> bytes:
+  """Content address of an encoded text"""
+  return hashlib.sha1(text.encode("utf-8")).hexdigest().encode("ascii")
+
+
+class EmbeddingCache:
+  """Content-addressed store of build-time embeddings on disk, shared by every build.
+
+  Vectors are kept per encoder (model and backend, whose vectors differ) and keyed
+  by a hash of the exact text encoded, so a rebuild only encodes texts it has never
+  seen, whatever else changed: chunking, dedup, index type or output path. Each
+  store() adds a segment (<id>.npy vectors, then <id>.keys.npy, which publishes
+  them); beyond `max_segments` they are merged into one.
+  """
+
+  def __init__(self, root: str = DEFAULT_CACHE_DIR, max_segments: int = MAX_SEGMENTS):
+    self.root = root
+    self.max_segments = max_segments
+
+  def _directory(self, model_name: str, backend: str) -> Path:
+    return Path(self.root) / f"{model_name.replace('/', '__')}-{backend}"
+
+  @staticmethod
+  def _segments(directory: Path) -> List[str]:
+    return sorted(path.name[: -len(".keys.npy")] for path in directory.glob("*.keys.npy"))
+
+  def lookup(self, model_name: str, backend: str, keys: Sequence[bytes]) -> Dict[bytes, np.ndarray]:
+    """Cached vectors for those of `keys` (see text_key) encoded before"""
+    directory = self._directory(model_name, backend)
+    wanted = set(keys)
+    found: Dict[bytes, np.ndarray] = {}
+    for segment in self._segments(directory):
+      try:
+        segment_keys = np.load(directory / f"{segment}.keys.npy")
+        vectors = np.load(directory / f"{segment}.npy", mmap_mode="r")
+      except FileNotFoundError:
+        continue  # Merged away by another build since listing
+      for row, key in enumerate(segment_keys.tolist()):
+        if key in wanted and key not in found:
+          found[key] = np.array(vectors[row])
+    return found
+
+  def store(self, model_name: str, backend: str, keys: Sequence[bytes], vectors: np.ndarray) -> None:
+    """Add vectors for `keys` as a new segment"""
+    if not len(keys):
+      return
+    directory = self._directory(model_name, backend)
+    directory.mkdir(parents=True, exist_ok=True)
+    self._write_segment(directory, np.array(keys, dtype="S40"), np.asarray(vectors, dtype=np.float32))
+    if len(self._segments(directory)) > self.max_segments:
+      self._merge(directory)
+
+  @staticmethod
+  def _write_segment(directory: Path, keys: np.ndarray, vectors: np.ndarray) -> str:
+    segment = uuid.uuid4().hex
+    for suffix, array in ((".npy", vectors), (".keys.npy", keys)):
+      path = directory / f"{segment}{suffix}"
+      with open(f"{path}.tmp", "wb") as f:
+        np.save(f, array)
+      os.replace(f"{path}.tmp", path)
+    return segment
+
+  def _merge(self, directory: Path) -> None:
+    """Rewrite all segments as one, keeping the first vector stored for each key"""
+    segments = self._segments(directory)
+    keys = np.concatenate([np.load(directory / f"{segment}.keys.npy") for segment in segments])
+    vectors = np.concatenate([np.load(directory / f"{segment}.npy") for segment in segments])
+    _, first = np.unique(keys, return_index=True)
+    first.sort()
+    self._write_segment(directory, keys[first], vectors[first])
+    for segment in segments:
+      # Keys first, so a concurrent lookup never sees a segment without its vectors
+      for suffix in (".keys.npy", ".npy"):
+        (directory / f"{segment}{suffix}").unlink(missing_ok=True)
@@ -0,0 +1,144 @@
+import os
+import platform
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+  from sentence_transformers import SentenceTransformer
+
+# "onnx" runs the exported fp32 graph on ONNX Runtime; "onnx-int8" adds dynamic int8 weight quantization
+ENCODER_BACKENDS = ("torch", "onnx", "onnx-int8")
+DEFAULT_BACKEND = "torch"
+ONNX_EXPORT_DIR = "onnx_models"
+QUANTIZED_FILE_SUFFIX = "qint8"
+
+
+class EncoderMismatchError(ValueError):
+  """An index was built by a different encoder model or backend than the one asked to search it"""
+
+
+def load_encoder(
+  model_name: str, backend: str = DEFAULT_BACKEND, threads: Optional[int] = None, export_dir: str = ONNX_EXPORT_DIR
+) -> "SentenceTransformer":
+  """
+  SentenceTransformer for `model_name` on the given backend. ONNX backends need
+  `pip install "optimum[onnxruntime]"`; the int8 model is exported and quantized
+  once into `export_dir` and reused afterwards. `threads` caps intra-op threads.
+  """
+  if backend not in ENCODER_BACKENDS:
+    raise ValueError(f"Unknown encoder backend '{backend}', expected one of {', '.join(ENCODER_BACKENDS)}")
+
+  from sentence_transformers import SentenceTransformer
+
+  if backend == "torch":
+    if threads:
+      import torch
+
+      torch.set_num_threads(threads)
+    return SentenceTransformer(model_name)
+
+  model_kwargs = {"provider": "CPUExecutionProvider"}
+  if threads:
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    model_kwargs["session_options"] = options
+
+  if backend == "onnx":
+    return SentenceTransformer(model_name, backend="onnx", model_kwargs=model_kwargs)
+
+  local_dir = Path(export_dir) / model_name.replace("/", "__")
+  quantized_file = f"onnx/model_{QUANTIZED_FILE_SUFFIX}.onnx"
+  if not (local_dir / quantized_file).exists():
+    _export_quantized(model_name, local_dir)
+  return SentenceTransformer(str(local_dir), backend="onnx", model_kwargs={**model_kwargs, "file_name": quantized_file})
+
+
+def encode_parallel(model: "SentenceTransformer", texts: List[str], workers: int, batch_size: int = 32) -> np.ndarray:
+  """
+  Encode `texts` (unnormalized) on a pool of `workers` CPU processes, each given an
+  equal share of the cores. Chunks are handed out in input order, so length-sorted
+  input gives every worker batches of similar length to pad.
+  """
+  previous = os.environ.get("OMP_NUM_THREADS")
+  # Read by each spawned worker's runtime as it starts
+  os.environ["OMP_NUM_THREADS"] = str(max((os.cpu_count() or 1) // workers, 1))
+  try:
+    pool = model.start_multi_process_pool(["cpu"] * workers)
+  finally:
+    if previous is None:
+      del os.environ["OMP_NUM_THREADS"]
+    else:
+      os.environ["OMP_NUM_THREADS"] = previous
+
+  try:
+    # A few chunks per worker, so none sits idle while another finishes a long one
+    chunk_size = max(-(-len(texts) // (4 * workers)), 1)
+    return model.encode(texts, pool=pool, batch_size=batch_size, chunk_size=chunk_size)
+  finally:
+    model.stop_multi_process_pool(pool)
+
+
+def _export_quantized(model_name: str, local_dir: Path) -> None:
+  """Export the model to ONNX and write a dynamically int8-quantized copy next to it"""
+  from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+  print(f"Exporting {model_name} to ONNX with int8 quantization in {local_dir}...")
+  model = SentenceTransformer(model_name, backend="onnx")
+  model.save(str(local_dir))
+  # Weights-only quantization; activations are quantized on the fly per batch
+  target = "arm64" if platform.machine().lower() in ("arm64", "aarch64") else "avx2"
+  export_dynamic_quantized_onnx_model(model, target, str(local_dir), file_suffix=QUANTIZED_FILE_SUFFIX)
+
+
+def parity_check(
+  reference_encode: Callable[[List[str]], np.ndarray],
+  candidate_encode: Callable[[List[str]], np.ndarray],
+  documents: List[str],
+  document_groups: List[int],
+  queries: List[str],
+  top_k: int = 5,
+) -> Dict[str, float]:
+  """
+  How closely a candidate encoder ranks documents like the reference one. Documents
+  (e.g. passages) are grouped (e.g. by parent FAQ) before comparing top-k group
+  rankings per query. Both encoders must return L2-normalized rows.
+  """
+  groups = np.asarray(document_groups)
+  stats: Dict[str, float] = {}
+  embeddings, rankings = [], []
+  for name, encode in (("reference", reference_encode), ("candidate", candidate_encode)):
+    start = time.perf_counter()
+    query_embeddings = encode(queries)
+    stats[f"{name}_queries_per_second"] = len(queries) / (time.perf_counter() - start)
+    document_embeddings = encode(documents)
+    embeddings.append(np.vstack([query_embeddings, document_embeddings]))
+    rankings.append(_rank_groups(query_embeddings @ document_embeddings.T, groups, top_k))
+
+  reference, candidate = embeddings
+  reference_ranks, candidate_ranks = rankings
+  stats["top1_agreement"] = float(np.mean([r[0] == c[0] for r, c in zip(reference_ranks, candidate_ranks)]))
+  stats[f"overlap_at_{top_k}"] = float(
+    np.mean([len(set(r) & set(c)) / len(r) for r, c in zip(reference_ranks, candidate_ranks)])
+  )
+  stats["min_cosine"] = float(np.min(np.sum(reference * candidate, axis=1)))
+  stats["mean_cosine"] = float(np.mean(np.sum(reference * candidate, axis=1)))
+  return stats
+
+
+def _rank_groups(scores: np.ndarray, groups: np.ndarray, top_k: int) -> List[List[int]]:
+  """Top-k groups per query row, each group scored by its best document"""
+  ranked = []
+  for row in scores:
+    best: Dict[int, float] = {}
+    for doc in np.argsort(-row, kind="stable"):
+      best.setdefault(int(groups[doc]), float(row[doc]))
+      if len(best) == top_k:
+        break
+    ranked.append(list(best))
+  return ranked
@@ -1,113 +1,1048 @@
+import hashlib
+import json
 import pickle
+import shutil
+import threading
 from pathlib import Path
-from typing import Dict, List
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple
 
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
-from extract_faq import extract_all_faqs
+from ann_index import (
+  INDEX_OPTIONS,
+  apply_search_params,
+  binarize,
+  bytes_per_vector,
+  create_index,
+  index_config,
+  is_compressed,
+  measure_recall,
+  mmap_io_flags,
+)
+from bm25 import BM25Index
+from chunking import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_SIZE, chunking_config, make_passages, passage_text
+from dedup import DEFAULT_JACCARD, DEFAULT_SIMILARITY, collapse, dedup_config, find_clusters
+from embedding_cache import EmbeddingCache, text_key
+from encoders import DEFAULT_BACKEND, EncoderMismatchError, encode_parallel, load_encoder, parity_check
+from extract_faq import DEFAULT_PARSER, NO_CONTENT, iter_faq_files, iter_faqs
+from fast_path import FastPathTable
+from faq_store import FAQStore
+from metrics import REGISTRY, Metrics
+from query_cache import QueryCache
+from snapshots import (
+  DEFAULT_KEEP,
+  SNAPSHOT_FILES,
+  SnapshotIntegrityError,
+  current_snapshot,
+  index_prefix,
+  publish,
+  stage,
+  verify,
+)
+
+if TYPE_CHECKING:
+  from sentence_transformers import SentenceTransformer
+
+INDEX_FORMAT_VERSION = 4
+
+# FAISS candidates fetched per requested FAQ, so that several passages of one FAQ do not crowd out others
+PASSAGE_OVERSAMPLE = 4
+# FAQs considered per requested FAQ when results are diversified (mmr_lambda)
+MMR_CANDIDATES = 3
+
+# Fewer build-time texts than this are encoded in-process even with encode_workers
+MIN_POOL_TEXTS = 256
+
+RETRIEVAL_MODES = ("dense", "lexical", "rrf", "weighted")
+# Candidates taken from each ranking per requested FAQ before fusion
+FUSION_CANDIDATES = 3
+RRF_K = 60
 
 
 class FAQProcessor:
   """Simple FAQ processor using FAISS for vector search"""
 
-  def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+  def __init__(
+    self,
+    model_name: str = "all-MiniLM-L6-v2",
+    cache_size: int = 1024,
+    cache_ttl: float = 3600.0,
+    retrieval_mode: str = "dense",
+    lexical_first: bool = False,
+    fusion_weight: float = 0.5,
+    lexical_margin: float = 1.5,
+    metrics: Optional[Metrics] = None,
+    encoder_backend: Optional[str] = None,
+    encoder_threads: Optional[int] = None,
+    mmr_lambda: Optional[float] = None,
+    embedding_cache: Optional[EmbeddingCache] = None,
+    encode_workers: Optional[int] = None,
+  ):
+    """
+    retrieval_mode picks dense (FAISS), lexical (BM25) or fused rankings ("rrf" or
+    "weighted", where fusion_weight is the dense share). With lexical_first, a
+    decisive BM25 match (best hit contains every query term and outscores the
+    runner-up by lexical_margin) is returned without encoding the query.
+    Stage latencies go to `metrics` (default: the process-wide metrics.REGISTRY).
+
+    encoder_backend is one of encoders.ENCODER_BACKENDS; None means whatever a loaded
+    index was built with (torch for new builds). encoder_threads caps encoder threads.
+
+    With mmr_lambda (0-1), dense results are picked by maximal marginal relevance from
+    a wider candidate set; lower values favour FAQs unlike those already picked.
+
+    Index builds take vectors for texts encoded before from `embedding_cache`, and
+    with encode_workers > 1 encode the rest on that many processes.
+    """
+    if retrieval_mode not in RETRIEVAL_MODES:
+      raise ValueError(f"Unknown retrieval mode '{retrieval_mode}', expected one of {', '.join(RETRIEVAL_MODES)}")
+
     self.model_name = model_name
-    self.model = SentenceTransformer(self.model_name)
-    self.faqs: List[Dict] = []
-    self.embeddings: np.ndarray = None
-    self.index: faiss.IndexFlatIP = None  # Inner product for cosine similarity
+    self.encoder_backend = encoder_backend
+    self.encoder_threads = encoder_threads
+    self.retrieval_mode = retrieval_mode
+    self.lexical_first = lexical_first
+    self.fusion_weight = fusion_weight
+    self.lexical_margin = lexical_margin
+    self.mmr_lambda = mmr_lambda
+    self.embedding_cache = embedding_cache
+    self.encode_workers = encode_workers
+    self._model: Optional["SentenceTransformer"] = None  # Built on first encode, see `model`
+    self._model_lock = threading.Lock()
+    self.faqs: Sequence[Dict] = []  # A list while building, an mmap-backed FAQStore after load_index
+    self.passages: Sequence[Dict] = []  # Index rows: {"faq": parent row in self.faqs, "text": chunk}
+    self.chunking: Dict = chunking_config()
+    self.dedup: Optional[Dict] = None  # Near-duplicate settings the FAQs were collapsed with, see deduplicate
+    # Full-precision passage vectors. Not kept for a float32 flat index, which already holds them (see _vectors)
+    self.embeddings: Optional[np.ndarray] = None
+    self.index: faiss.Index = None  # Inner product for cosine similarity
+    self.index_config: Dict = index_config()  # FAISS index type and parameters, saved with the index
+    self.lexical_index: Optional[BM25Index] = None  # BM25 over whole FAQs, rows aligned with self.faqs
+    self.fast_path: Optional[FastPathTable] = None  # Calibrated ready-made answers, see build_fast_path
     self.is_indexed = False
+    self.file_manifest: Dict[str, Dict] = {}  # filename -> content hash, mtime, size
+    self.keep_snapshots = DEFAULT_KEEP  # Index versions kept on disk by save_index, see snapshots.prune
+    self.index_version = 0  # Bumped whenever the index changes; part of the results cache key
+    self.query_cache = QueryCache(cache_size, cache_ttl) if cache_size else None
+    self.metrics = metrics or REGISTRY
+    if self.query_cache:
+      for name in ("embedding", "results"):
+        self.metrics.register_gauge(
+          f"query_{name}_cache_hit_rate", lambda name=name: self.query_cache.stats()[name]["hit_rate"]
+        )
+
+  @property
+  def model(self) -> "SentenceTransformer":
+    """Sentence encoder, constructed on first use so index-only code paths never import torch"""
+    if self._model is None:
+      with self._model_lock:
+        if self._model is None:
+          self._model = load_encoder(self.model_name, self.encoder_backend or DEFAULT_BACKEND, self.encoder_threads)
+    return self._model
+
+  def warm_up(self) -> threading.Thread:
+    """Start loading the encoder in a background thread so it overlaps with other startup work"""
+    thread = threading.Thread(target=self._load_model, name="faq-model-warmup", daemon=True)
+    thread.start()
+    return thread
+
+  def share_encoder(self, other: "FAQProcessor") -> None:
+    """Reuse another processor's encoder rather than loading a second copy of the same model"""
+    # A backend of None loads the default one, see `model`
+    if (other.model_name, other.encoder_backend or DEFAULT_BACKEND) == (
+      self.model_name, self.encoder_backend or DEFAULT_BACKEND
+    ):
+      self._model = other.model
+
+  def _load_model(self) -> None:
+    try:
+      self.model
+    except Exception as e:
+      # The next encode retries the load and surfaces the error to the caller
+      print(f"Background model load failed: {e}")
+
+  def _index_changed(self) -> None:
+    self.index_version += 1
+    if self.query_cache:
+      self.query_cache.clear_results()
+
+  def _encode_passages(self, passages: List[Dict], show_progress_bar: bool = False) -> np.ndarray:
+    # Combine question and passage for better retrieval
+    texts = [passage_text(self.faqs[passage["faq"]], passage) for passage in passages]
+    return self._encode_corpus(texts, show_progress_bar=show_progress_bar)
+
+  def _encode_corpus(self, texts: List[str], show_progress_bar: bool = False) -> np.ndarray:
+    """Build-time encoding: cached vectors are reused and only texts not seen before are encoded"""
+    if self.embedding_cache is None:
+      return self._encode_sorted(texts, show_progress_bar)
+
+    backend = self.encoder_backend or DEFAULT_BACKEND
+    keys = [text_key(text) for text in texts]
+    found = self.embedding_cache.lookup(self.model_name, backend, keys)
+    cached = sum(key in found for key in keys)
+    self.metrics.increment("embedding_cache_hits_total", cached)
+    self.metrics.increment("embedding_cache_misses_total", len(keys) - cached)
+    if cached:
+      print(f"✓ Reused {cached} of {len(texts)} embeddings from {self.embedding_cache.root}")
+
+    # One row per distinct unseen text; repeated texts are encoded once
+    missing = list({key: i for i, key in enumerate(keys) if key not in found}.values())
+
+    if missing:
+      encoded = self._encode_sorted([texts[i] for i in missing], show_progress_bar)
+      self.embedding_cache.store(self.model_name, backend, [keys[i] for i in missing], encoded)
+      found.update(zip((keys[i] for i in missing), encoded))
+    return np.vstack([found[key] for key in keys]).astype(np.float32)
+
+  def _encode_sorted(self, texts: List[str], show_progress_bar: bool = False) -> np.ndarray:
+    """Encode longest texts first so each batch pads little, on a process pool when encode_workers > 1"""
+    order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+    ordered = [texts[i] for i in order]
+    with self.metrics.span("build.encode"):
+      if self.encode_workers and self.encode_workers > 1 and len(texts) >= MIN_POOL_TEXTS:
+        print(f"Encoding {len(texts)} texts on {self.encode_workers} processes...")
+        embeddings = self._normalize(encode_parallel(self.model, ordered, self.encode_workers))
+      else:
+        embeddings = self._encode(ordered, show_progress_bar=show_progress_bar)
+    result = np.empty_like(embeddings)
+    result[order] = embeddings
+    return result
+
+  @staticmethod
+  def _file_state(html_file: Path) -> Dict:
+    """Content hash and stat info used to detect changed FAQ files"""
+    stat = html_file.stat()
+    digest = hashlib.sha256(html_file.read_bytes()).hexdigest()
+    return {"sha256": digest, "mtime": stat.st_mtime, "size": stat.st_size}
+
+  @staticmethod
+  def _index_paths(filepath: str) -> Dict[str, str]:
+    """Files making up a saved index. A legacy `.pkl` path is treated as its prefix."""
+    prefix = index_prefix(filepath)
+    return {
+      "meta": f"{prefix}.meta.json",
+      "embeddings": f"{prefix}.npy",
+      "faiss": f"{prefix}.faiss",
+      "faqs": f"{prefix}.faqs.bin",
+      "offsets": f"{prefix}.faqs.offsets.npy",
+      "passages": f"{prefix}.passages.bin",
+      "passage_offsets": f"{prefix}.passages.offsets.npy",
+      "bm25": f"{prefix}.bm25.npz",
+      "manifest": f"{prefix}.manifest.json",
+      "fast_path": f"{prefix}.fastpath.json",
+      "legacy": f"{prefix}.pkl",
+    }
+
+  @classmethod
+  def _published_paths(cls, filepath: str) -> Dict[str, str]:
+    """Files of the index currently published at `filepath`: its current snapshot, else the flat files"""
+    snapshot = current_snapshot(filepath)
+    return cls._index_paths(str(snapshot / SNAPSHOT_FILES) if snapshot else filepath)
+
+  @classmethod
+  def index_exists(cls, filepath: str = "faq_index") -> bool:
+    paths = cls._published_paths(filepath)
+    return Path(paths["meta"]).exists() or Path(paths["legacy"]).exists()
+
+  @classmethod
+  def index_backend(cls, filepath: str = "faq_index") -> Optional[str]:
+    """Encoder backend of the index published at `filepath`, read from its meta; None without one"""
+    try:
+      with open(cls._published_paths(filepath)["meta"], "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    except FileNotFoundError:
+      return None
+    return meta.get("encoder_backend", DEFAULT_BACKEND)
+
+  def _encode(self, texts: List[str], show_progress_bar: bool = False, batch_size: int = 32) -> np.ndarray:
+    """Encode texts into L2-normalized float32 embeddings"""
+    embeddings = self.model.encode(texts, show_progress_bar=show_progress_bar, batch_size=batch_size)
+    return self._normalize(embeddings)
+
+  @staticmethod
+  def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    # Normalize for cosine similarity
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings.astype(np.float32)
 
-  def load_faqs(self, faq_directory: str = "shell-retail/faq/") -> None:
+  def load_faqs(
+    self, faq_directory: str = "shell-retail/faq/", workers: Optional[int] = None, parser: str = DEFAULT_PARSER
+  ) -> None:
     """Load and process FAQs from HTML files"""
     print(f"Loading FAQs from {faq_directory}...")
-    raw_faqs = extract_all_faqs(faq_directory)
 
-    # Convert to our format
+    # Convert to our format as records stream in from the extraction pool
+    faq_path = Path(faq_directory)
     self.faqs = []
-    for faq in raw_faqs:
+    self.file_manifest = {}
+    self.dedup = None
+    for faq in iter_faqs(faq_directory, workers=workers, parser=parser):
       self.faqs.append({"question": faq["title"], "answer": faq["content"], "filename": faq["filename"]})
+      self.file_manifest[faq["filename"]] = self._file_state(faq_path / faq["filename"])
 
     print(f"Loaded {len(self.faqs)} FAQs")
 
-  def build_index(self) -> None:
-    """Build FAISS index from FAQ embeddings"""
+  def deduplicate(self, similarity: float = DEFAULT_SIMILARITY, jaccard: float = DEFAULT_JACCARD) -> List[Dict]:
+    """
+    Collapse near-duplicate loaded FAQs into one canonical entry each, keeping the others'
+    questions as aliases (see dedup.find_clusters). Run before build_index; returns
+    a {"canonical", "aliases"} report per collapsed cluster.
+    """
     if not self.faqs:
       raise ValueError("No FAQs loaded. Call load_faqs() first.")
 
+    # Pages without extracted content would all look alike
+    rows = [row for row, faq in enumerate(self.faqs) if faq["answer"] != NO_CONTENT]
+    print("Finding near-duplicate FAQs...")
+    embeddings = self._encode_corpus([f"{self.faqs[row]['question']} {self.faqs[row]['answer']}" for row in rows])
+    clusters = find_clusters(embeddings, [self.faqs[row]["answer"] for row in rows], similarity, jaccard)
+    self.faqs, report = collapse(list(self.faqs), [[rows[i] for i in members] for members in clusters])
+    self.dedup = dedup_config(similarity, jaccard)
+
+    collapsed = sum(len(cluster["aliases"]) for cluster in report)
+    print(f"Collapsed {collapsed} near-duplicate FAQs into {len(report)} canonical entries")
+    return report
+
+  def build_index(
+    self,
+    index_type: str = "flat",
+    nlist: Optional[int] = None,
+    pq_m: int = 8,
+    pq_bits: int = 8,
+    hnsw_m: int = 32,
+    ef_construction: int = 40,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    storage: str = "float32",
+    rerank: int = 4,
+    chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+  ) -> None:
+    """
+    Build FAISS index from FAQ embeddings. Each FAQ is split into overlapping passages of
+    about `chunk_size` characters (None: one passage per FAQ) and every passage is indexed.
+    See ann_index.index_config for the index options.
+    """
+    if not self.faqs:
+      raise ValueError("No FAQs loaded. Call load_faqs() first.")
+
+    self.index_config = index_config(
+      index_type, nlist, pq_m, pq_bits, hnsw_m, ef_construction, nprobe, ef_search, storage, rerank
+    )
+    self.chunking = chunking_config(chunk_size, chunk_overlap)
+    self.passages = make_passages(self.faqs, self.chunking)
+    self.fast_path = None  # Calibrated against the previous index; see build_fast_path
+
     print("Generating embeddings...")
-    # Combine question and answer for better retrieval
-    texts = [f"{faq['question']} {faq['answer']}" for faq in self.faqs]
+    self.embeddings = self._encode_passages(self.passages, show_progress_bar=True)
 
-    # Generate embeddings
-    embeddings = self.model.encode(texts, show_progress_bar=True)
+    self._build_lexical_index()
+    self._build_faiss_index()
+    print(f"Built FAISS index with {len(self.faqs)} FAQs ({len(self.passages)} passages)")
 
-    # Normalize for cosine similarity
-    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
-    self.embeddings = embeddings.astype(np.float32)
+  def _build_faiss_index(self) -> None:
+    """(Re)build self.index from the passage vectors using self.index_config"""
+    config = self.index_config
+    vectors = self._vectors()
+    self.index = create_index(vectors, config)
 
-    # Build FAISS index
-    dimension = self.embeddings.shape[1]
-    self.index = faiss.IndexFlatIP(dimension)  # Inner product for normalized vectors = cosine similarity
-    self.index.add(self.embeddings)
+    # Approximate and compressed indexes record what they give up against exact float32 search
+    config["bytes_per_vector"] = bytes_per_vector(config, vectors.shape[1])
+    for key in ("recall_at_10", "recall_at_10_without_rerank"):
+      config.pop(key, None)
+    if config["type"] != "flat" or is_compressed(config):
+      config["recall_at_10"] = measure_recall(self._index_search, vectors, k=10)
+      report = f"recall@10 vs exact float32 search: {config['recall_at_10']:.3f}"
+      if is_compressed(config) and config.get("rerank"):
+        config["recall_at_10_without_rerank"] = measure_recall(
+          lambda queries, k: self._index_search(queries, k, rerank=False), vectors, k=10
+        )
+        report += f" ({config['recall_at_10_without_rerank']:.3f} before rerank)"
+      print(
+        f"{config['type']}/{config.get('storage', 'float32')} index: "
+        f"{config['bytes_per_vector']:g} bytes/vector (float32: {4 * vectors.shape[1]}), {report}"
+      )
 
     self.is_indexed = True
-    print(f"Built FAISS index with {len(self.faqs)} FAQs")
+    self._release_embeddings()
+    self._index_changed()
+
+  def reindex(self, config: Dict) -> None:
+    """Rebuild the FAISS index with another index_config, reusing the stored passage vectors"""
+    if not self.is_indexed:
+      raise ValueError("Index not built. Call build_index() first.")
+
+    self.embeddings = np.array(self._vectors(), dtype=np.float32)  # Owned copy; the old index goes away
+    self.index_config = config
+    self._build_faiss_index()
+
+  def _holds_vectors(self) -> bool:
+    """Whether self.index stores the exact float32 vectors, making self.embeddings redundant"""
+    return self.index_config["type"] == "flat" and self.index_config.get("storage", "float32") == "float32"
+
+  def _vectors(self) -> np.ndarray:
+    """Full-precision passage vectors, read straight out of a float32 flat index when possible"""
+    if self.embeddings is None and self.index is not None and self._holds_vectors():
+      # Zero-copy view of the index's storage
+      return faiss.rev_swig_ptr(self.index.get_xb(), self.index.ntotal * self.index.d).reshape(
+        self.index.ntotal, self.index.d
+      )
+    return self.embeddings
+
+  def _release_embeddings(self) -> None:
+    if self._holds_vectors():
+      self.embeddings = None
+
+  def build_fast_path(
+    self, queries: Sequence[Dict], precision: float = 0.98, generate: Optional[Callable[[Dict], str]] = None
+  ) -> None:
+    """
+    Calibrate the score gate for answering without the LLM on held-out labelled `queries`
+    and collect an answer per FAQ (see fast_path.FastPathTable). Saved with the index;
+    recalibrated on the same queries by update_index.
+    """
+    if not self.is_indexed:
+      raise ValueError("Index not built. Call build_index() first.")
+    if not queries:
+      raise ValueError("The fast path needs labelled calibration queries")
+
+    self.fast_path = FastPathTable.build(self, queries, precision, generate, previous=self.fast_path)
+    calibration = self.fast_path.calibration
+    if calibration["threshold"] is None:
+      print(f"Fast path disabled: no score gate reaches {precision:.0%} precision")
+    else:
+      print(
+        f"Fast path: score >= {calibration['threshold']:.3f} and margin >= {calibration['margin']:.2f} "
+        f"covers {calibration['coverage']:.0%} of calibration queries at {calibration['precision']:.1%} precision"
+      )
+
+  def _refresh_fast_path(
+    self, queries: Optional[Sequence[Dict]], precision: Optional[float], generate: Optional[Callable[[Dict], str]]
+  ) -> None:
+    """Build the fast path on new `queries`, or recalibrate the saved one on its own queries"""
+    if queries is None:
+      if self.fast_path is None:
+        return
+      queries = self.fast_path.queries
+      precision = precision or self.fast_path.calibration["target_precision"]
+    self.build_fast_path(queries, precision or 0.98, generate)
+
+  def _build_lexical_index(self) -> None:
+    self.lexical_index = BM25Index.build(
+      [
+        " ".join([faq["question"], *(alias["question"] for alias in faq.get("aliases", [])), faq["answer"]])
+        for faq in self.faqs
+      ]
+    )
+
+  def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    """Tune query-time accuracy/speed of IVF (nprobe) and HNSW (ef_search) indexes"""
+    if nprobe is not None:
+      self.index_config["nprobe"] = nprobe
+    if ef_search is not None:
+      self.index_config["ef_search"] = ef_search
+    if self.index is not None:
+      apply_search_params(self.index, self.index_config)
+      self._index_changed()
+
+  def update_index(
+    self,
+    faq_directory: str = "shell-retail/faq/",
+    filepath: str = "faq_index",
+    workers: Optional[int] = None,
+    parser: str = DEFAULT_PARSER,
+    fast_path_queries: Optional[Sequence[Dict]] = None,
+    fast_path_precision: Optional[float] = None,
+    generate: Optional[Callable[[Dict], str]] = None,
+  ) -> Dict[str, int]:
+    """
+    Incrementally refresh a saved index, re-embedding only added or modified FAQ files.
+    With `fast_path_queries` the fast path is (re)built on them; otherwise a saved one is
+    recalibrated when FAQs changed. Either way the result is published as one snapshot.
+    """
+    fast_path = (fast_path_queries, fast_path_precision, generate)
+    manifest_path = Path(self._published_paths(filepath)["manifest"])
+    if not self.index_exists(filepath) or not manifest_path.exists():
+      print("No existing index manifest found, doing a full build...")
+      return self._full_rebuild(faq_directory, filepath, workers, parser, *fast_path)
+
+    # The index is patched in place, so it needs owned (not memory-mapped) buffers
+    try:
+      self.load_index(filepath, mmap=False)
+    except EncoderMismatchError as e:
+      print(f"{e}, doing a full build...")
+      return self._full_rebuild(faq_directory, filepath, workers, parser, *fast_path)
+    self.faqs = list(self.faqs)
+    self.passages = list(self.passages)
+    self.embeddings = np.array(self._vectors())  # Owned copy to patch alongside the index
+    with open(manifest_path, "r", encoding="utf-8") as f:
+      manifest = json.load(f)
+
+    previous = manifest.get("files", {})
+    rows_consistent = all(
+      0 <= entry["row"] < len(self.faqs) and self.faqs[entry["row"]]["filename"] == entry.get("alias_of", name)
+      for name, entry in previous.items()
+    )
+    if manifest.get("model_name") != self.model_name or not self.is_indexed or not rows_consistent:
+      print("Index manifest is stale or was built with a different model, doing a full build...")
+      return self._full_rebuild(faq_directory, filepath, workers, parser, *fast_path)
+
+    # Diff the directory against the manifest. Files whose mtime and size are
+    # unchanged are trusted without hashing; otherwise the content hash decides.
+    current_files = {html_file.name: html_file for html_file in sorted(Path(faq_directory).glob("*.html"))}
+    file_manifest = {}
+    added, modified = [], []
+    for name, html_file in current_files.items():
+      old = previous.get(name)
+      stat = html_file.stat()
+      if old and old["mtime"] == stat.st_mtime and old["size"] == stat.st_size:
+        file_manifest[name] = {key: old[key] for key in ("sha256", "mtime", "size")}
+        continue
+
+      state = self._file_state(html_file)
+      file_manifest[name] = state
+      if old is None:
+        added.append(name)
+      elif old["sha256"] != state["sha256"]:
+        modified.append(name)
+
+    deleted = [name for name in previous if name not in current_files]
+    stats = {
+      "added": len(added),
+      "modified": len(modified),
+      "deleted": len(deleted),
+      "unchanged": len(current_files) - len(added) - len(modified),
+    }
+    if not (added or modified or deleted) and fast_path_queries is None and generate is None:
+      # Publishing an identical snapshot would reload every watcher and push out rollback points
+      print(f"Index is up to date: {stats['unchanged']} unchanged, nothing published")
+      return stats
 
-  def search(self, query: str, top_k: int = 3) -> List[Dict]:
-    """Search for relevant FAQs"""
+    # A changed member of a collapsed cluster may no longer be a duplicate, so cluster afresh.
+    # Added files are indexed as they are; the next full build deduplicates them.
+    clustered = {name for name, entry in previous.items() if "alias_of" in entry}
+    clustered |= {previous[name]["alias_of"] for name in clustered}
+    if clustered.intersection(deleted + modified):
+      print("A near-duplicate FAQ changed, doing a full build...")
+      return self._full_rebuild(faq_directory, filepath, workers, parser, *fast_path)
+
+    # Parse only the files that changed; files that fail to parse are left out of the manifest
+    changed = [current_files[name] for name in added + modified]
+    new_faqs = [
+      {"question": faq["title"], "answer": faq["content"], "filename": faq["filename"]}
+      for faq in iter_faq_files(changed, workers=workers, parser=parser)
+    ]
+    parsed = {faq["filename"] for faq in new_faqs}
+    for name in added + modified:
+      if name not in parsed:
+        file_manifest.pop(name)
+
+    # Drop passage rows for deleted and modified files. IndexFlat compacts ids on
+    # removal, which keeps FAISS rows aligned with self.passages.
+    # Approximate indexes cannot renumber ids on removal, so they are retrained from the
+    # patched embeddings instead; either way only the changed FAQs are re-encoded.
+    patch_in_place = self._holds_vectors()
+    stale_rows = np.array(sorted(previous[name]["row"] for name in deleted + modified), dtype=np.int64)
+    if len(stale_rows):
+      parents = np.array([passage["faq"] for passage in self.passages], dtype=np.int64)
+      stale_passages = np.flatnonzero(np.isin(parents, stale_rows))
+      if patch_in_place:
+        self.index.remove_ids(stale_passages)
+      keep = np.setdiff1d(np.arange(len(self.passages)), stale_passages)
+      # Parent rows shift down by the number of removed FAQs before them
+      shift = np.searchsorted(stale_rows, parents[keep])
+      self.passages = [
+        {**self.passages[i], "faq": int(parents[i] - offset)} for i, offset in zip(keep, shift)
+      ]
+      self.embeddings = self.embeddings[keep]
+      stale = set(stale_rows.tolist())
+      self.faqs = [faq for row, faq in enumerate(self.faqs) if row not in stale]
+
+    if new_faqs:
+      new_passages = make_passages(new_faqs, self.chunking, first_row=len(self.faqs))
+      self.faqs.extend(new_faqs)
+      print(f"Generating embeddings for {len(new_faqs)} changed FAQs ({len(new_passages)} passages)...")
+      new_embeddings = self._encode_passages(new_passages)
+      if patch_in_place:
+        self.index.add(new_embeddings)
+      self.passages.extend(new_passages)
+      self.embeddings = np.vstack([self.embeddings, new_embeddings])
+
+    self.file_manifest = file_manifest
+    # BM25 needs no encoder, so it is simply rebuilt from the patched FAQ list
+    self._build_lexical_index()
+    if patch_in_place:
+      self._release_embeddings()
+      self._index_changed()
+    elif len(stale_rows) or new_faqs:
+      self._build_faiss_index()
+    if fast_path_queries is not None or len(stale_rows) or new_faqs:
+      # Changed FAQs get their own text as the ready-made answer unless `generate` is given
+      self._refresh_fast_path(fast_path_queries, fast_path_precision, generate)
+    self.save_index(filepath)
+
+    print(
+      f"Updated index: {stats['added']} added, {stats['modified']} modified, "
+      f"{stats['deleted']} deleted, {stats['unchanged']} unchanged"
+    )
+    return stats
+
+  def _full_rebuild(
+    self,
+    faq_directory: str,
+    filepath: str,
+    workers: Optional[int],
+    parser: str,
+    fast_path_queries: Optional[Sequence[Dict]] = None,
+    fast_path_precision: Optional[float] = None,
+    generate: Optional[Callable[[Dict], str]] = None,
+  ) -> Dict[str, int]:
+    dedup = self.dedup
+    self.load_faqs(faq_directory, workers=workers, parser=parser)
+    if dedup:
+      self.deduplicate(**dedup)
+    config = self.index_config
+    previous_fast_path = self.fast_path
+    self.build_index(
+      index_type=config["type"],
+      **{key: config[key] for key in INDEX_OPTIONS if key in config},
+      **self.chunking,
+    )
+    self.fast_path = previous_fast_path  # Generated answers for unchanged FAQs carry over
+    self._refresh_fast_path(fast_path_queries, fast_path_precision, generate)
+    self.save_index(filepath)
+    return {"added": len(self.faqs), "modified": 0, "deleted": 0, "unchanged": 0}
+
+  def search(
+    self, query: str, top_k: int = 3, mode: Optional[str] = None, query_embedding: Optional[np.ndarray] = None
+  ) -> List[Dict]:
+    """
+    Search for relevant FAQs. `mode` overrides the processor's retrieval_mode; a
+    `query_embedding` computed beforehand (see embed_queries) spares the encode.
+    """
     if not self.is_indexed:
       raise ValueError("Index not built. Call build_index() first.")
 
+    mode = mode or self.retrieval_mode
+    cache = self.query_cache
+    cache_key = (self.index_version, mode, self.lexical_first)
+    with self.metrics.span("search.total"):
+      if cache:
+        cached = cache.get_results(cache_key, query, top_k)
+        if cached is not None:
+          return cached
+
+      results = self._search(query, top_k, mode, query_embedding)
+      if cache:
+        cache.put_results(cache_key, query, top_k, results)
+      return results
+
+  def lexical_results(self, query: str, top_k: int = 3) -> Optional[List[Dict]]:
+    """
+    Results when BM25 alone settles `query` (lexical mode, or a decisive lexical-first
+    hit), found without encoding it; None when the query needs the dense index.
+    """
+    if not self.is_indexed:
+      raise ValueError("Index not built. Call build_index() first.")
+    if self.retrieval_mode != "lexical" and not self.lexical_first:
+      return None
+
+    lexical_hits, decisive = self._lexical_hits(query, top_k)
+    if self.retrieval_mode == "lexical" or decisive:
+      return self._hits_to_results(lexical_hits[:top_k], "lexical")
+    return None
+
+  def _lexical_hits(self, query: str, top_k: int) -> Tuple[List, bool]:
+    """BM25 (row, score, passages) hits, and whether the best one is decisive for lexical_first"""
+    with self.metrics.span("search.lexical"):
+      doc_ids, scores, coverage = self.lexical_index.search(query, top_k * FUSION_CANDIDATES)
+    lexical_hits = [(int(row), float(score), []) for row, score in zip(doc_ids, scores)]
+    decisive = len(scores) > 0 and coverage[0] == 1.0
+    decisive = decisive and (len(scores) == 1 or scores[0] >= self.lexical_margin * scores[1])
+    return lexical_hits, decisive
+
+  def _search(self, query: str, top_k: int, mode: str, query_embedding: Optional[np.ndarray] = None) -> List[Dict]:
+    lexical_hits = None
+    if mode != "dense" or self.lexical_first:
+      lexical_hits, decisive = self._lexical_hits(query, top_k)
+      if mode == "lexical" or (self.lexical_first and decisive):
+        return self._hits_to_results(lexical_hits[:top_k], "lexical")
+
     # Generate query embedding
-    query_embedding = self.model.encode([query])
-    query_embedding = query_embedding / np.linalg.norm(query_embedding, axis=1, keepdims=True)
-    query_embedding = query_embedding.astype(np.float32)
+    if query_embedding is None:
+      query_embedding = self.embed_query(query)
 
-    # Search
-    scores, indices = self.index.search(query_embedding, top_k)
+    # Search passages, then fold them into their parent FAQs
+    candidates = self._dense_candidates(top_k) if mode == "dense" else top_k * FUSION_CANDIDATES
+    with self.metrics.span("search.faiss"):
+      scores, indices = self._index_search(query_embedding, candidates * PASSAGE_OVERSAMPLE)
+    with self.metrics.span("search.merge"):
+      dense_hits = self._aggregate_passages(scores[0], indices[0], candidates)
+      if mode == "dense":
+        return self._hits_to_results(self._diversify(dense_hits, top_k), self._dense_ranking())
+
+      return self._hits_to_results(self._fuse(dense_hits, lexical_hits, mode)[:top_k], mode)
+
+  def _fuse(self, dense_hits: List, lexical_hits: List, mode: str) -> List:
+    """Combine dense and lexical (row, score, passages) rankings, best first"""
+    fused: Dict[int, float] = {}
+    passages = {row: hit_passages for row, _, hit_passages, *_ in lexical_hits + dense_hits}
+    if mode == "rrf":
+      for hits in (dense_hits, lexical_hits):
+        for rank, (row, *_) in enumerate(hits):
+          fused[row] = fused.get(row, 0.0) + 1.0 / (RRF_K + rank + 1)
+    else:
+      # Cosine scores are already in [-1, 1]; BM25 is scaled by the best lexical score
+      max_lexical = max((score for _, score, _ in lexical_hits), default=0.0) or 1.0
+      for row, score, *_ in dense_hits:
+        fused[row] = fused.get(row, 0.0) + self.fusion_weight * score
+      for row, score, _ in lexical_hits:
+        fused[row] = fused.get(row, 0.0) + (1 - self.fusion_weight) * score / max_lexical
+
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    return [(row, score, passages[row]) for row, score in ranked]
+
+  def _dense_candidates(self, top_k: int) -> int:
+    """FAQs to fetch for `top_k` dense results; more when they are diversified"""
+    return top_k * MMR_CANDIDATES if self.mmr_lambda is not None else top_k
+
+  def _dense_ranking(self) -> str:
+    return "mmr" if self.mmr_lambda is not None else "dense"
+
+  def _diversify(self, hits: List, top_k: int) -> List:
+    """
+    Maximal marginal relevance over (row, score, passages, best passage id) hits: each pick
+    balances its score against its similarity to the FAQs already picked, compared by best
+    passage vectors. Without mmr_lambda, the top_k hits as ranked.
+    """
+    if self.mmr_lambda is None or len(hits) <= 1:
+      return hits[:top_k]
+
+    vectors = np.asarray(self._vectors()[[hit[3] for hit in hits]], dtype=np.float32)
+    similarity = vectors @ vectors.T
+    scores = np.array([hit[1] for hit in hits], dtype=np.float32)
+    chosen = [0]
+    redundancy = similarity[0].copy()  # Highest similarity of each hit to any chosen one
+    while len(chosen) < min(top_k, len(hits)):
+      gain = self.mmr_lambda * scores - (1 - self.mmr_lambda) * redundancy
+      gain[chosen] = -np.inf
+      best = int(np.argmax(gain))
+      chosen.append(best)
+      redundancy = np.maximum(redundancy, similarity[best])
+    return [hits[i] for i in chosen]
+
+  def embed_query(self, query: str) -> np.ndarray:
+    """Normalized (1, dim) embedding for a query, reused for repeated questions"""
+    cache = self.query_cache
+    query_embedding = cache.get_embedding(query) if cache else None
+    if query_embedding is None:
+      with self.metrics.span("search.encode"):
+        query_embedding = self._encode([query])
+      if cache:
+        cache.put_embedding(query, query_embedding)
+    return query_embedding
+
+  def search_batch(self, queries: List[str], top_k: int = 3, batch_size: int = 64) -> List[List[Dict]]:
+    """Search for relevant FAQs for many queries, one encode and one FAISS search per batch"""
+    if not self.is_indexed:
+      raise ValueError("Index not built. Call build_index() first.")
 
-    # Format results
     results = []
-    for score, idx in zip(scores[0], indices[0]):
-      if idx < len(self.faqs):  # Valid index
-        result = self.faqs[idx].copy()
-        result["score"] = float(score)
-        results.append(result)
+    for start in range(0, len(queries), batch_size):
+      batch = queries[start : start + batch_size]
+      results.extend(self.search_embeddings(self._encode(batch, batch_size=batch_size), top_k))
 
     return results
 
-  def save_index(self, filepath: str = "faq_index.pkl") -> None:
-    """Save the processor state"""
-    data = {"faqs": self.faqs, "embeddings": self.embeddings, "model_name": self.model_name}
+  def embed_queries(self, queries: List[str]) -> np.ndarray:
+    """Normalized (n, dim) embeddings for several queries; cache misses are encoded in one call"""
+    cache = self.query_cache
+    cached = [cache.get_embedding(query) if cache else None for query in queries]
+    missing = [i for i, embedding in enumerate(cached) if embedding is None]
+    if missing:
+      with self.metrics.span("search.encode_batch"):
+        encoded = self._encode([queries[i] for i in missing], batch_size=len(missing))
+      for row, i in enumerate(missing):
+        cached[i] = encoded[row : row + 1]
+        if cache:
+          cache.put_embedding(queries[i], cached[i])
 
-    with open(filepath, "wb") as f:
-      pickle.dump(data, f)
+    return np.vstack(cached)
+
+  def search_embeddings(self, query_embeddings: np.ndarray, top_k: int = 3) -> List[List[Dict]]:
+    """Search with already-encoded, normalized query embeddings, one FAISS call for all rows"""
+    if not self.is_indexed:
+      raise ValueError("Index not built. Call build_index() first.")
+
+    query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+    with self.metrics.span("search.faiss_batch"):
+      scores, indices = self._index_search(query_embeddings, self._dense_candidates(top_k) * PASSAGE_OVERSAMPLE)
+    return [
+      self._format_results(row_scores, row_indices, top_k) for row_scores, row_indices in zip(scores, indices)
+    ]
+
+  def _index_search(self, query_embeddings: np.ndarray, k: int, rerank: bool = True):
+    """FAISS passage search; compressed indexes over-fetch and rerank on full-precision vectors"""
+    config = self.index_config
+    fetch = k
+    if rerank and is_compressed(config) and config.get("rerank"):
+      fetch = min(k * config["rerank"], self.index.ntotal)
+
+    if config.get("storage") == "binary":
+      distances, indices = self.index.search(binarize(query_embeddings), fetch)
+      # Map Hamming distance onto a cosine-like [-1, 1] score
+      scores = 1.0 - 2.0 * distances.astype(np.float32) / self.index.d
+    else:
+      scores, indices = self.index.search(query_embeddings, fetch)
+
+    if fetch == k:
+      return scores, indices
+    return self._rerank(query_embeddings, indices, k)
+
+  def _rerank(self, query_embeddings: np.ndarray, candidates: np.ndarray, k: int):
+    """Exact inner products for candidate rows only; with mmap'd embeddings just those rows are read"""
+    vectors = self._vectors()
+    scores = np.full((len(query_embeddings), k), -np.inf, dtype=np.float32)
+    indices = np.full((len(query_embeddings), k), -1, dtype=np.int64)
+    for row, (query, ids) in enumerate(zip(query_embeddings, candidates)):
+      ids = ids[ids >= 0]
+      exact = vectors[ids] @ query
+      best = np.argsort(-exact, kind="stable")[:k]
+      scores[row, : len(best)] = exact[best]
+      indices[row, : len(best)] = ids[best]
+    return scores, indices
+
+  def _format_results(
+    self, scores: np.ndarray, indices: np.ndarray, top_k: int, max_passages: int = 2
+  ) -> List[Dict]:
+    """Turn one row of FAISS passage hits into FAQ result dicts"""
+    hits = self._aggregate_passages(scores, indices, self._dense_candidates(top_k), max_passages)
+    return self._hits_to_results(self._diversify(hits, top_k), self._dense_ranking())
+
+  def _aggregate_passages(
+    self, scores: np.ndarray, indices: np.ndarray, top_k: int, max_passages: int = 2
+  ) -> List:
+    """
+    Fold passage hits into (faq row, score, passages, best passage id) tuples, best first. A FAQ
+    scores as its best passage and keeps its best `max_passages` passages (alias questions excluded).
+    """
+    hits: Dict[int, tuple] = {}
+    for score, idx in zip(scores, indices):
+      if not 0 <= idx < len(self.passages):  # FAISS pads missing hits with -1
+        continue
+
+      passage = self.passages[idx]
+      hit = hits.get(passage["faq"])
+      if hit is None:
+        if len(hits) == top_k:
+          continue
+        hit = hits[passage["faq"]] = (passage["faq"], float(score), [], int(idx))
+      if len(hit[2]) < max_passages and not passage.get("alias"):
+        hit[2].append(passage["text"])
+
+    # Hits arrive best first, so insertion order is score order
+    return list(hits.values())
+
+  def _hits_to_results(self, hits: List, ranking: str = "dense") -> List[Dict]:
+    """Result dicts; `ranking` names how they were ranked: by cosine ("dense", "mmr"), BM25 ("lexical") or fused"""
+    results = []
+    for row, score, passages, *_ in hits:
+      result = self.faqs[row].copy()
+      result["score"] = score
+      result["passages"] = passages
+      result["ranking"] = ranking
+      results.append(result)
+    return results
+
+  def save_index(self, filepath: str = "faq_index") -> None:
+    """
+    Save the processor state as a new snapshot of the index at `filepath` (see snapshots).
+    Files are written to a fresh directory and published by one atomic pointer swap, so
+    readers load either the previous index or this one, never a mix, and processes that
+    have the previous index memory-mapped keep reading it.
+    """
+    prefix = index_prefix(filepath)
+    staging = stage(prefix)
+    try:
+      self._write_index(self._index_paths(str(staging / SNAPSHOT_FILES)))
+      info = {
+        "format": INDEX_FORMAT_VERSION,
+        "model_name": self.model_name,
+        "count": len(self.faqs),
+        "passages": len(self.passages),
+      }
+      version = publish(prefix, staging, info, keep=self.keep_snapshots)
+    except BaseException:
+      shutil.rmtree(staging, ignore_errors=True)
+      raise
+
+    print(f"Saved index to {filepath} (snapshot {version})")
+
+  def _write_index(self, paths: Dict[str, str]) -> None:
+    # Embeddings as a raw .npy and FAQ text as an offset-indexed store, both mmap-able on load
+    with open(paths["embeddings"], "wb") as f:
+      np.save(f, np.ascontiguousarray(self._vectors(), dtype=np.float32))
+    FAQStore.write(list(self.faqs), paths["faqs"], paths["offsets"])
+    FAQStore.write(list(self.passages), paths["passages"], paths["passage_offsets"])
+    if self.lexical_index is not None:
+      self.lexical_index.save(paths["bm25"])
+    if self.fast_path is not None:
+      self.fast_path.save(paths["fast_path"])
 
     # Save FAISS index separately
     if self.index:
-      faiss.write_index(self.index, filepath.replace(".pkl", ".faiss"))
+      if self.index_config.get("storage") == "binary":
+        faiss.write_index_binary(self.index, paths["faiss"])
+      else:
+        faiss.write_index(self.index, paths["faiss"])
+
+    # Per-file manifest used by update_index
+    if self.file_manifest:
+      rows = {faq["filename"]: i for i, faq in enumerate(self.faqs)}
+      files = {name: {**state, "row": rows[name]} for name, state in self.file_manifest.items() if name in rows}
+      # Files collapsed into another FAQ point at its row
+      aliases = {alias["filename"]: i for i, faq in enumerate(self.faqs) for alias in faq.get("aliases", [])}
+      files.update(
+        {
+          name: {**state, "row": aliases[name], "alias_of": self.faqs[aliases[name]]["filename"]}
+          for name, state in self.file_manifest.items()
+          if name in aliases
+        }
+      )
+      with open(paths["manifest"], "w", encoding="utf-8") as f:
+        json.dump({"model_name": self.model_name, "files": files}, f, indent=2)
+
+    meta = {
+      "format": INDEX_FORMAT_VERSION,
+      "model_name": self.model_name,
+      "encoder_backend": self.encoder_backend or DEFAULT_BACKEND,
+      "count": len(self.faqs),
+      "passages": len(self.passages),
+      "chunking": self.chunking,
+      "dedup": self.dedup,
+      "index": self.index_config,
+    }
+    with open(paths["meta"], "w", encoding="utf-8") as f:
+      json.dump(meta, f, indent=2)
+
+  def load_index(self, filepath: str = "faq_index", mmap: bool = True, verify_checksums: bool = False) -> None:
+    """
+    Load the processor state. With mmap=True vectors and FAQ text stay on disk and are paged in on demand.
+    A snapshot's file sizes are checked against its manifest first, and every index's parts must agree
+    on FAQ and passage counts; SnapshotIntegrityError otherwise. verify_checksums also hashes every file,
+    which reads the whole index (checksums are verified once when a snapshot is published).
+    """
+    snapshot = current_snapshot(filepath)
+    if snapshot is not None:
+      verify(snapshot, checksums=verify_checksums)
+    paths = self._index_paths(str(snapshot / SNAPSHOT_FILES) if snapshot else filepath)
+    if not Path(paths["meta"]).exists() and Path(paths["legacy"]).exists():
+      self._load_legacy_index(paths)
+    else:
+      with open(paths["meta"], "r", encoding="utf-8") as f:
+        meta = json.load(f)
+      if meta.get("format") != INDEX_FORMAT_VERSION:
+        raise ValueError(
+          f"Unsupported index format {meta.get('format')} in {paths['meta']}; rebuild it with `python cli.py build`"
+        )
+      self._check_encoder(meta, paths["meta"])
+
+      self.faqs = FAQStore(paths["faqs"], paths["offsets"])
+      self.passages = FAQStore(paths["passages"], paths["passage_offsets"])
+      self.chunking = meta["chunking"]
+      self.dedup = meta.get("dedup")
+      self.lexical_index = BM25Index.load(paths["bm25"])
+      self.fast_path = FastPathTable.load(paths["fast_path"]) if Path(paths["fast_path"]).exists() else None
+
+      # Load FAISS index
+      self.index_config = meta.get("index") or index_config()
+      if Path(paths["faiss"]).exists():
+        io_flags = mmap_io_flags(self.index_config["type"]) if mmap else 0
+        if self.index_config.get("storage") == "binary":
+          self.index = faiss.read_index_binary(paths["faiss"], io_flags)
+        else:
+          self.index = faiss.read_index(paths["faiss"], io_flags)
+        apply_search_params(self.index, self.index_config)
+        self.is_indexed = True
+
+      # Full-precision vectors are only needed when the index does not hold them (reranking, retraining)
+      self.embeddings = None
+      if not (self.is_indexed and self._holds_vectors()):
+        self.embeddings = np.load(paths["embeddings"], mmap_mode="r" if mmap else None)
+      self._check_rows(meta, paths["meta"])
 
-    print(f"Saved index to {filepath}")
+    manifest_path = Path(paths["manifest"])
+    self.file_manifest = {}
+    if manifest_path.exists():
+      with open(manifest_path, "r", encoding="utf-8") as f:
+        files = json.load(f).get("files", {})
+      self.file_manifest = {name: {key: entry[key] for key in ("sha256", "mtime", "size")} for name, entry in files.items()}
 
-  def load_index(self, filepath: str = "faq_index.pkl") -> None:
-    """Load the processor state"""
-    with open(filepath, "rb") as f:
+    self._index_changed()
+    print(f"Loaded index from {filepath}")
+
+  def _check_rows(self, meta: Dict, path: str) -> None:
+    """Refuse an index whose files were not written together"""
+    counts = {"FAQ store": (len(self.faqs), meta["count"]), "passage store": (len(self.passages), meta["passages"])}
+    if self.index is not None:
+      counts["FAISS index"] = (self.index.ntotal, meta["passages"])
+    if self.embeddings is not None:
+      counts["embeddings"] = (len(self.embeddings), meta["passages"])
+    for part, (rows, expected) in counts.items():
+      if rows != expected:
+        raise SnapshotIntegrityError(f"{path}: {part} has {rows} rows, expected {expected}")
+
+  def _check_encoder(self, meta: Dict, path: str) -> None:
+    """Refuse an index whose vectors came from another encoder; adopt its backend if none was chosen"""
+    saved_model = meta.get("model_name", self.model_name)
+    saved_backend = meta.get("encoder_backend", DEFAULT_BACKEND)  # Indexes predating backends used torch
+    if saved_model != self.model_name:
+      raise EncoderMismatchError(f"{path} was built with model '{saved_model}', not '{self.model_name}'")
+    if self.encoder_backend is None:
+      # Waits for a warm-up load in progress, which used the default backend
+      with self._model_lock:
+        if saved_backend != DEFAULT_BACKEND:
+          self._model = None
+        self.encoder_backend = saved_backend
+    elif saved_backend != self.encoder_backend:
+      raise EncoderMismatchError(
+        f"{path} was built with the '{saved_backend}' encoder backend, not '{self.encoder_backend}'"
+      )
+
+  def check_encoder_parity(self, backend: str, threads: Optional[int] = None, top_k: int = 5) -> Dict[str, float]:
+    """
+    Compare another encoder backend with this processor's on the loaded FAQs: agreement of
+    top-k FAQ rankings for title queries, embedding cosine, and query encoding speed.
+    """
+    candidate = FAQProcessor(
+      self.model_name, cache_size=0, metrics=Metrics(), encoder_backend=backend, encoder_threads=threads
+    )
+    # Load both models before anything is timed
+    self.model
+    candidate.model
+    texts = [passage_text(self.faqs[passage["faq"]], passage) for passage in self.passages]
+    groups = [passage["faq"] for passage in self.passages]
+    queries = [faq["question"] for faq in self.faqs]
+    return parity_check(self._encode, candidate._encode, texts, groups, queries, top_k)
+
+  def _load_legacy_index(self, paths: Dict[str, str]) -> None:
+    """Read an index saved by the pickle-based format"""
+    with open(paths["legacy"], "rb") as f:
       data = pickle.load(f)
 
     self.faqs = data["faqs"]
     self.embeddings = data["embeddings"]
+    self.index_config = index_config()
+    # Legacy indexes embedded each whole FAQ as one row
+    self.chunking = chunking_config(None)
+    self.passages = make_passages(self.faqs, self.chunking)
+    self._build_lexical_index()
 
-    # Load FAISS index
-    index_path = filepath.replace(".pkl", ".faiss")
-    if Path(index_path).exists():
-      self.index = faiss.read_index(index_path)
+    if Path(paths["faiss"]).exists():
+      self.index = faiss.read_index(paths["faiss"])
       self.is_indexed = True
 
-    print(f"Loaded index from {filepath}")
-
 
 if __name__ == "__main__":
   processor = FAQProcessor()
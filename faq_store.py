@@ -0,0 +1,48 @@
+import json
+from collections.abc import Sequence
+from typing import Dict, List
+
+import numpy as np
+
+
+class FAQStore(Sequence):
+  """Read-only FAQ records in a memory-mapped, offset-indexed file.
+
+  Records are UTF-8 JSON blobs laid end to end in `data_path`; `offsets_path`
+  holds n + 1 int64 byte offsets. Opening the store maps both files and decodes
+  nothing, so load time does not grow with the corpus and processes reading the
+  same files share one page-cached copy.
+  """
+
+  def __init__(self, data_path: str, offsets_path: str):
+    self.offsets = np.load(offsets_path, mmap_mode="r")
+    # np.memmap refuses zero-length files
+    self._data = np.memmap(data_path, dtype=np.uint8, mode="r") if self.offsets[-1] > 0 else np.empty(0, np.uint8)
+
+  def __len__(self) -> int:
+    return len(self.offsets) - 1
+
+  def __getitem__(self, idx):
+    if isinstance(idx, slice):
+      return [self[i] for i in range(*idx.indices(len(self)))]
+
+    if idx < 0:
+      idx += len(self)
+    if not 0 <= idx < len(self):
+      raise IndexError("FAQ index out of range")
+
+    start, end = int(self.offsets[idx]), int(self.offsets[idx + 1])
+    return json.loads(self._data[start:end].tobytes().decode("utf-8"))
+
+  @staticmethod
+  def write(faqs: List[Dict], data_path: str, offsets_path: str) -> None:
+    """Serialize FAQ records into the data/offsets file pair"""
+    offsets = np.zeros(len(faqs) + 1, dtype=np.int64)
+    with open(data_path, "wb") as f:
+      for i, faq in enumerate(faqs):
+        blob = json.dumps(faq, ensure_ascii=False).encode("utf-8")
+        f.write(blob)
+        offsets[i + 1] = offsets[i] + len(blob)
+
+    with open(offsets_path, "wb") as f:
+      np.save(f, offsets)
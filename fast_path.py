@@ -0,0 +1,131 @@
+import hashlib
+import json
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from extract_faq import NO_CONTENT
+
+# Margins tried during calibration; the one admitting the most traffic at the target precision wins
+CANDIDATE_MARGINS = (0.0, 0.02, 0.05, 0.1, 0.15, 0.2)
+
+
+def content_hash(faq: Dict) -> str:
+  return hashlib.sha256(f"{faq['question']}\n{faq['answer']}".encode("utf-8")).hexdigest()
+
+
+def calibrate(samples: List[Tuple[float, float, bool]], precision: float) -> Dict:
+  """
+  Pick the (threshold, margin) gate that covers the most (score, margin, correct)
+  samples while keeping the fraction of correct top hits at or above `precision`.
+  """
+  best = {"threshold": None, "margin": None, "coverage": 0.0, "precision": None}
+  for margin in CANDIDATE_MARGINS:
+    admitted = sorted((score, correct) for score, gap, correct in samples if gap >= margin)
+    admitted.reverse()  # Highest score first
+    hits = 0
+    for count, (score, correct) in enumerate(admitted, 1):
+      hits += correct
+      # Only cut between distinct scores, so the threshold admits exactly this prefix
+      if count < len(admitted) and admitted[count][0] == score:
+        continue
+      coverage = count / len(samples)
+      if hits / count >= precision and coverage > best["coverage"]:
+        best = {"threshold": score, "margin": margin, "coverage": coverage, "precision": hits / count}
+  return best
+
+
+class FastPathTable:
+  """Ready-made answers per FAQ, served without an LLM call when retrieval is confident.
+
+  A question takes the fast path when its top hit scores at least `threshold`
+  and beats the runner-up by `margin`. Both are calibrated at build time on a
+  held-out set of labelled queries. FAQ titles make a poor set: every indexed
+  passage embeds its title, so they match far more confidently than real
+  questions do. Entries carry the FAQ's content hash, so an edited FAQ never
+  gets an answer written for its old text.
+  """
+
+  def __init__(
+    self,
+    answers: Dict[str, Dict],
+    threshold: Optional[float],
+    margin: Optional[float],
+    calibration: Dict,
+    queries: Sequence[Dict] = (),
+  ):
+    self.answers = answers  # filename -> {"answer", "source": "faq" or "generated", "sha256"}
+    self.threshold = threshold
+    self.margin = margin
+    self.calibration = calibration
+    self.queries = list(queries)  # The calibration set, kept to recalibrate after FAQ changes
+
+  @classmethod
+  def build(
+    cls,
+    processor,
+    queries: Sequence[Dict],
+    precision: float = 0.98,
+    generate: Optional[Callable[[Dict], str]] = None,
+    previous: Optional["FastPathTable"] = None,
+  ) -> "FastPathTable":
+    """
+    Calibrate on a dense-indexed processor with labelled `queries` ({"query", "relevant":
+    [filenames]}, see queries.load_queries) and collect answers: the FAQ text itself, or
+    `generate(faq)` when given. Generated answers in `previous` are kept for unchanged FAQs.
+    """
+    if processor.mmr_lambda is not None:
+      raise ValueError("Calibrate the fast path without mmr_lambda; it gates the undiversified ranking")
+    results = processor.search_batch([query["query"] for query in queries], top_k=2)
+    samples = []
+    for query, hits in zip(queries, results):
+      if hits:
+        runner_up = hits[1]["score"] if len(hits) > 1 else -1.0
+        samples.append((hits[0]["score"], hits[0]["score"] - runner_up, hits[0]["filename"] in query["relevant"]))
+    calibration = {"target_precision": precision, "queries": len(samples), **calibrate(samples, precision)}
+
+    answers = {}
+    for faq in processor.faqs:
+      if not faq["answer"].strip() or faq["answer"] == NO_CONTENT:
+        continue  # Nothing worth serving; such questions go to the LLM
+      digest = content_hash(faq)
+      reused = previous.answers.get(faq["filename"]) if previous else None
+      if reused and reused["sha256"] == digest and (reused["source"] == "generated" or not generate):
+        answers[faq["filename"]] = reused
+      elif generate:
+        answers[faq["filename"]] = {"answer": generate(faq), "source": "generated", "sha256": digest}
+      else:
+        answers[faq["filename"]] = {"answer": faq["answer"], "source": "faq", "sha256": digest}
+
+    return cls(answers, calibration["threshold"], calibration["margin"], calibration, queries)
+
+  def match(self, results: Sequence[Dict]) -> Optional[Dict]:
+    """
+    The fast-path entry for a ranked result list, if the top hit clears the gate. The gate
+    is calibrated on the plain dense ranking, so BM25, fused and MMR-diversified rankings
+    (whose runner-up is picked for novelty, not score) never take the fast path.
+    """
+    if self.threshold is None or not results or results[0].get("ranking") != "dense":
+      return None
+    top = results[0]
+    runner_up = results[1]["score"] if len(results) > 1 else -1.0
+    if top["score"] < self.threshold or top["score"] - runner_up < self.margin:
+      return None
+    entry = self.answers.get(top.get("filename"))
+    if entry is None or entry["sha256"] != content_hash(top):
+      return None
+    return entry
+
+  def save(self, path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+      json.dump(
+        {"calibration": self.calibration, "queries": self.queries, "answers": self.answers},
+        f,
+        ensure_ascii=False,
+        indent=2,
+      )
+
+  @classmethod
+  def load(cls, path: str) -> "FastPathTable":
+    with open(path, "r", encoding="utf-8") as f:
+      data = json.load(f)
+    calibration = data["calibration"]
+    return cls(data["answers"], calibration["threshold"], calibration["margin"], calibration, data["queries"])
@@ -0,0 +1,166 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Deque, Dict, Iterator, Optional
+
+import numpy as np
+import tiktoken
+
+DEFAULT_TOKEN_MODEL = "gpt-4o"
+
+
+class Metrics:
+  """Thread-safe latency spans, counters and gauges for the retrieval and answer pipeline.
+
+  Spans keep their `window` most recent durations for percentiles, plus
+  all-time count and sum. Gauges are callables read at export time, e.g. a
+  cache's current hit rate.
+  """
+
+  def __init__(self, window: int = 1024):
+    self.window = window
+    self._lock = threading.Lock()
+    self._recent: Dict[str, Deque[float]] = {}
+    self._totals: Dict[str, list] = {}  # name -> [count, sum of seconds]
+    self._counters: Dict[str, float] = {}
+    self._gauges: Dict[str, Callable[[], float]] = {}
+
+  @contextmanager
+  def span(self, name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.observe(name, time.perf_counter() - start)
+
+  def observe(self, name: str, seconds: float) -> None:
+    with self._lock:
+      if name not in self._recent:
+        self._recent[name] = deque(maxlen=self.window)
+        self._totals[name] = [0, 0.0]
+      self._recent[name].append(seconds)
+      self._totals[name][0] += 1
+      self._totals[name][1] += seconds
+
+  def increment(self, name: str, value: float = 1) -> None:
+    with self._lock:
+      self._counters[name] = self._counters.get(name, 0) + value
+
+  def counter(self, name: str) -> float:
+    with self._lock:
+      return self._counters.get(name, 0)
+
+  def register_gauge(self, name: str, fn: Callable[[], float]) -> None:
+    with self._lock:
+      self._gauges[name] = fn
+
+  def reset(self) -> None:
+    with self._lock:
+      self._recent.clear()
+      self._totals.clear()
+      self._counters.clear()
+
+  def summary(self) -> Dict:
+    """Per-span count/mean/p50/p95/p99 in milliseconds, counters and current gauge values"""
+    with self._lock:
+      recent = {name: np.array(durations) * 1000 for name, durations in self._recent.items()}
+      totals = {name: list(total) for name, total in self._totals.items()}
+      counters = dict(self._counters)
+      gauges = dict(self._gauges)
+
+    spans = {}
+    for name, ms in recent.items():
+      count, total = totals[name]
+      spans[name] = {
+        "count": count,
+        "mean_ms": total * 1000 / count,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+      }
+    return {"spans": spans, "counters": counters, "gauges": {name: float(fn()) for name, fn in gauges.items()}}
+
+  def prometheus_text(self, prefix: str = "faq_") -> str:
+    """Prometheus text exposition format: spans as summaries, counters and gauges by name"""
+    summary = self.summary()
+    lines = [f"# TYPE {prefix}stage_seconds summary"]
+    with self._lock:
+      totals = {name: list(total) for name, total in self._totals.items()}
+    for name, stats in summary["spans"].items():
+      for quantile in ("50", "95", "99"):
+        lines.append(
+          f'{prefix}stage_seconds{{stage="{name}",quantile="0.{quantile}"}} {stats[f"p{quantile}_ms"] / 1000:.6f}'
+        )
+      lines.append(f'{prefix}stage_seconds_count{{stage="{name}"}} {totals[name][0]}')
+      lines.append(f'{prefix}stage_seconds_sum{{stage="{name}"}} {totals[name][1]:.6f}')
+    for name, value in summary["counters"].items():
+      lines += [f"# TYPE {prefix}{name} counter", f"{prefix}{name} {value:g}"]
+    for name, value in summary["gauges"].items():
+      lines += [f"# TYPE {prefix}{name} gauge", f"{prefix}{name} {value:g}"]
+    return "\n".join(lines) + "\n"
+
+  def serve_prometheus(self, port: int = 9100, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve prometheus_text() at /metrics from a daemon thread; local-only unless `host` says otherwise"""
+    metrics = self
+
+    class Handler(BaseHTTPRequestHandler):
+      def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+          self.send_error(404)
+          return
+        body = metrics.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, format, *args):
+        pass  # Scrapes would otherwise flood the console
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+  def start_json_log(self, path: str, interval: float = 60.0) -> threading.Event:
+    """Append a JSON summary line to `path` every `interval` seconds; set the returned event to stop"""
+    stop = threading.Event()
+
+    def run():
+      while not stop.wait(interval):
+        with open(path, "a", encoding="utf-8") as f:
+          f.write(json.dumps({"time": time.time(), **self.summary()}) + "\n")
+
+    threading.Thread(target=run, name="metrics-log", daemon=True).start()
+    return stop
+
+
+# Process-wide registry shared by FAQProcessor and RAGService unless they are given their own
+REGISTRY = Metrics()
+
+
+_encodings: Dict[str, object] = {}  # model -> tiktoken encoding, None once loading has failed
+
+
+def token_encoding(model: str = DEFAULT_TOKEN_MODEL):
+  """tiktoken encoding for `model`, or None when unavailable (its BPE file is fetched on first use)"""
+  if model not in _encodings:
+    try:
+      try:
+        _encodings[model] = tiktoken.encoding_for_model(model)
+      except KeyError:
+        _encodings[model] = tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+      _encodings[model] = None
+      print(f"⚠️  Token counting disabled: {e}")
+
+  return _encodings[model]
+
+
+def count_tokens(text: str, model: str = DEFAULT_TOKEN_MODEL) -> Optional[int]:
+  """tiktoken token count, or None when the encoding is unavailable"""
+  encoding = token_encoding(model)
+  return len(encoding.encode(text)) if encoding else None
@@ -0,0 +1,39 @@
+import json
+import re
+from typing import Dict, List, Sequence
+
+# Dropped from FAQ titles to make keyword-style queries
+STOPWORDS = {
+  "a", "an", "the", "i", "my", "me", "you", "your", "we", "it", "is", "are", "am", "be", "can", "do", "does",
+  "did", "how", "what", "where", "when", "why", "which", "who", "will", "should", "could", "would", "if", "of",
+  "to", "for", "in", "on", "at", "by", "with", "and", "or", "there", "this", "that", "from", "get", "have", "has",
+}
+
+
+def synthetic_queries(faqs: Sequence[Dict]) -> List[Dict]:
+  """
+  Labelled queries derived from FAQ titles: the title itself and a keyword
+  version without stopwords, each expecting the FAQ it came from.
+  """
+  queries = []
+  for faq in faqs:
+    title = faq["question"].strip()
+    relevant = [faq["filename"]]
+    queries.append({"query": title, "relevant": relevant, "kind": "title"})
+
+    keywords = [word for word in re.findall(r"[\w+'-]+", title.lower()) if word not in STOPWORDS]
+    if keywords and " ".join(keywords) != title.lower():
+      queries.append({"query": " ".join(keywords), "relevant": relevant, "kind": "keywords"})
+  return queries
+
+
+def load_queries(path: str) -> List[Dict]:
+  """JSONL of {"query": ..., "relevant": filename or [filenames]}"""
+  queries = []
+  with open(path, "r", encoding="utf-8") as f:
+    for line in f:
+      if line.strip():
+        record = json.loads(line)
+        relevant = record["relevant"]
+        queries.append({**record, "relevant": [relevant] if isinstance(relevant, str) else list(relevant)})
+  return queries
@@ -0,0 +1,68 @@
+import threading
+from typing import Dict, Hashable, List, Optional
+
+import numpy as np
+from cachetools import TTLCache
+
+
+class QueryCache:
+  """Bounded, TTL-expiring cache of query embeddings and top-k search results.
+
+  Embeddings only depend on the encoder, so they are keyed on the normalized
+  query alone. Results also depend on the index and are keyed on the caller's
+  index version, which makes a rebuilt index miss every stale entry.
+  """
+
+  def __init__(self, maxsize: int = 1024, ttl: float = 3600.0):
+    self._embeddings: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+    self._results: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+    self._lock = threading.Lock()  # cachetools caches are not thread-safe
+    self.hits = {"embedding": 0, "results": 0}
+    self.misses = {"embedding": 0, "results": 0}
+
+  @staticmethod
+  def normalize(query: str) -> str:
+    """Collapse whitespace and case; the default encoder is uncased"""
+    return " ".join(query.split()).casefold()
+
+  def get_embedding(self, query: str) -> Optional[np.ndarray]:
+    return self._get(self._embeddings, "embedding", self.normalize(query))
+
+  def put_embedding(self, query: str, embedding: np.ndarray) -> None:
+    with self._lock:
+      self._embeddings[self.normalize(query)] = embedding
+
+  def get_results(self, index_version: Hashable, query: str, top_k: int) -> Optional[List[Dict]]:
+    results = self._get(self._results, "results", (index_version, self.normalize(query), top_k))
+    # Hand out copies so callers can annotate results without touching the cache
+    return None if results is None else [result.copy() for result in results]
+
+  def put_results(self, index_version: Hashable, query: str, top_k: int, results: List[Dict]) -> None:
+    with self._lock:
+      self._results[(index_version, self.normalize(query), top_k)] = [result.copy() for result in results]
+
+  def clear_results(self) -> None:
+    with self._lock:
+      self._results.clear()
+
+  def stats(self) -> Dict[str, Dict[str, float]]:
+    """Hit/miss counters and hit rate per cache"""
+    with self._lock:
+      stats = {}
+      for name in ("embedding", "results"):
+        total = self.hits[name] + self.misses[name]
+        stats[name] = {
+          "hits": self.hits[name],
+          "misses": self.misses[name],
+          "hit_rate": self.hits[name] / total if total else 0.0,
+        }
+      return stats
+
+  def _get(self, cache: TTLCache, name: str, key: Hashable):
+    with self._lock:
+      value = cache.get(key)
+      if value is None:
+        self.misses[name] += 1
+      else:
+        self.hits[name] += 1
+      return value
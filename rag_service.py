@@ -1,71 +1,435 @@
+import asyncio
 import os
-from typing import Dict
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
-from langchain.schema import HumanMessage
+import numpy as np
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
 from langchain_openai import ChatOpenAI
 
+from answer_cache import AnswerCache
+from batching import MicroBatcher
+from context_builder import ContextBuilder
 from faq_processor import FAQProcessor
+from metrics import DEFAULT_TOKEN_MODEL, REGISTRY, Metrics, count_tokens
+from reranker import CrossEncoderReranker
+from shards import ShardedIndex
+from snapshots import SnapshotWatcher, published_version
 
+# FAQs sent to the LLM without a reranker
+CONTEXT_FAQS = 3
 
-class RAGService:
-  """Simple RAG service for Shell FAQ answering"""
+NO_RESULTS_ANSWER = (
+  "I couldn't find relevant information to answer your question. Please contact Shell customer support directly."
+)
+
+
+class RetrievalEngine:
+  """Retrieval state shared by every RAGService in a process: encoder, FAISS/BM25 index,
+  optional cross-encoder reranker and answer cache.
 
-  def __init__(self, openai_api_key: str = None):
-    self.api_key = openai_api_key or os.getenv("OPENAI_API_KEY")
-    if not self.api_key:
-      raise ValueError("OpenAI API key required")
+  Searches may run concurrently from any number of threads. A newly published
+  index snapshot is picked up by `refresh` (or periodically, see `watch`), which
+  loads it into a fresh FAQProcessor (sharing the loaded encoder) and swaps it
+  in; searches already running finish on the previous one.
+  """
+
+  def __init__(
+    self,
+    index_path: str = "faq_index",
+    answer_cache_path: Optional[str] = "answer_cache.sqlite",
+    metrics: Optional[Metrics] = None,
+    reranker: Optional[CrossEncoderReranker] = None,
+    rerank_candidates: int = 10,
+    shards: Optional[ShardedIndex] = None,
+    mmr_lambda: Optional[float] = None,
+    verify_checksums: bool = False,
+    retrieval_mode: str = "dense",
+    lexical_first: bool = False,
+  ):
+    """
+    With a `reranker`, `rerank_candidates` FAQs are retrieved per question and the
+    reranker picks the few that go to the LLM; otherwise the top CONTEXT_FAQS do.
+    With `shards`, questions are answered from those instead of the index at `index_path`.
+    `mmr_lambda` diversifies retrieved FAQs (see FAQProcessor). With `verify_checksums`,
+    every (re)load hashes the whole index snapshot instead of only checking file sizes.
+    `retrieval_mode` and `lexical_first` choose dense, BM25 or fused retrieval (see FAQProcessor);
+    shards are searched dense-only and diversified by their own mmr_lambda.
+    """
+    if shards is not None and (retrieval_mode != "dense" or lexical_first):
+      raise ValueError("Sharded search is dense-only; use retrieval_mode='dense' without lexical_first")
+    if shards is not None and mmr_lambda != shards.mmr_lambda:
+      raise ValueError("Shards are diversified per shard; pass mmr_lambda to the ShardedIndex instead")
+    self.index_path = index_path
+    self.metrics = metrics or REGISTRY
+    self.reranker = reranker
+    self.mmr_lambda = mmr_lambda
+    self.verify_checksums = verify_checksums
+    self.retrieval_mode = retrieval_mode
+    self.lexical_first = lexical_first
+    self.retrieval_depth = rerank_candidates if reranker else CONTEXT_FAQS
+    self._reload_lock = threading.Lock()
+
+    # Answers are reused for near-identical questions over the same FAQs; pass None to disable
+    self.answer_cache = AnswerCache(answer_cache_path) if answer_cache_path else None
+    if self.answer_cache:
+      self.metrics.register_gauge("answer_cache_hit_rate", lambda: self.answer_cache.stats()["hit_rate"])
+    self.metrics.register_gauge(
+      "fast_path_rate",
+      lambda: self.metrics.counter("fast_path_answers_total") / max(self.metrics.counter("questions_total"), 1),
+    )
 
-    self.llm = ChatOpenAI(model_name="gpt-4o", temperature=0, openai_api_key=self.api_key)
+    if shards is not None:
+      # Shards load on first use and refresh themselves one by one
+      self.faq_processor = shards
+      self.faq_processor.warm_up()
+    else:
+      self.faq_processor = self._new_processor()
+      # Overlap the encoder load with index loading
+      self.faq_processor.warm_up()
+      self._load_or_build()
+    self._published = self._published_marker()
 
-    self.faq_processor = FAQProcessor()
+  def _new_processor(self) -> FAQProcessor:
+    # The index's own backend, so warm-ups and shared encoders match what load_index will need
+    return FAQProcessor(
+      metrics=self.metrics, mmr_lambda=self.mmr_lambda, retrieval_mode=self.retrieval_mode,
+      lexical_first=self.lexical_first, encoder_backend=FAQProcessor.index_backend(self.index_path),
+    )
 
-    # Load or build index
+  def _load_or_build(self) -> None:
+    """Load the index at index_path, or build and save one from the default FAQ directory"""
     try:
-      self.faq_processor.load_index()
+      self.faq_processor.load_index(self.index_path, verify_checksums=self.verify_checksums)
       print("✅ Loaded existing FAQ index")
     except FileNotFoundError:
       print("Building new FAQ index...")
       self.faq_processor.load_faqs()
       self.faq_processor.build_index()
-      self.faq_processor.save_index()
+      self.faq_processor.save_index(self.index_path)
       print("✅ Built and saved FAQ index")
 
-  def answer_question(self, question: str) -> Dict:
-    """Answer a question using RAG"""
-    # Retrieve relevant FAQs
-    relevant_faqs = self.faq_processor.search(question, top_k=3)
+  def _published_marker(self) -> Optional[str]:
+    return published_version(self.index_path)
 
-    if not relevant_faqs:
-      return {
-        "answer": "I couldn't find relevant information to answer your question. Please contact Shell customer support directly.",
-        "sources": [],
-      }
+  def refresh(self) -> bool:
+    """Swap in the index on disk if a newer one was published; True when it did. Cheap when nothing changed."""
+    if isinstance(self.faq_processor, ShardedIndex):
+      return self.faq_processor.refresh()
+    marker = self._published_marker()
+    if marker is None or marker == self._published:
+      return False
+    # One thread reloads; the others keep serving the current index meanwhile
+    if not self._reload_lock.acquire(blocking=False):
+      return False
+
+    try:
+      fresh = self._new_processor()
+      fresh.share_encoder(self.faq_processor)
+      fresh.load_index(self.index_path, verify_checksums=self.verify_checksums)
+      self.faq_processor, self._published = fresh, marker
+      print(f"✅ Reloaded FAQ index from {self.index_path}")
+      return True
+    except Exception as e:
+      print(f"❌ Failed to reload FAQ index, keeping the current one: {e}")
+      return False
+    finally:
+      self._reload_lock.release()
 
-    # Format context
-    context = "\n\n".join(
-      [f"FAQ {i + 1}:\nQ: {faq['question']}\nA: {faq['answer']}" for i, faq in enumerate(relevant_faqs)]
+  def watch(self, interval: float = 5.0) -> SnapshotWatcher:
+    """Check for a newly published index every `interval` seconds in the background; stop() the result to end it"""
+    return SnapshotWatcher(self.refresh, interval).start()
+
+
+class RAGService:
+  """Simple RAG service for Shell FAQ answering"""
+
+  def __init__(
+    self,
+    openai_api_key: str = None,
+    answer_cache_path: Optional[str] = "answer_cache.sqlite",
+    llm: Optional[BaseChatModel] = None,
+    max_concurrent_llm_calls: int = 8,
+    executor: Optional[Executor] = None,
+    metrics: Optional[Metrics] = None,
+    engine: Optional[RetrievalEngine] = None,
+    max_batch_size: int = 32,
+    max_batch_wait: float = 0.005,
+    fast_path: bool = True,
+    max_prompt_tokens: int = 1500,
+    history_tokens: int = 300,
+  ):
+    """
+    Pass a shared `engine` to reuse one encoder and index across services (e.g. one per
+    user session with its own API key); otherwise this service loads its own.
+    With `fast_path`, confidently matched questions are answered from the index's
+    precomputed table (see FAQProcessor.build_fast_path) without calling the LLM.
+    Prompts are packed into `max_prompt_tokens`, of which conversation history
+    (passed per question, see ContextBuilder) takes at most `history_tokens`.
+    """
+    if llm is None:
+      self.api_key = openai_api_key or os.getenv("OPENAI_API_KEY")
+      if not self.api_key:
+        raise ValueError("OpenAI API key required")
+      llm = ChatOpenAI(model_name="gpt-4o", temperature=0, openai_api_key=self.api_key)
+    else:
+      self.api_key = openai_api_key
+    self.llm = llm
+    self.use_fast_path = fast_path
+    self.token_model = getattr(llm, "model_name", None) or DEFAULT_TOKEN_MODEL
+    self.context_builder = ContextBuilder(max_prompt_tokens, history_tokens, model=self.token_model)
+
+    # Retrieval state may be shared; the LLM client and its API key never are
+    self.engine = engine or RetrievalEngine(answer_cache_path=answer_cache_path, metrics=metrics)
+    # Stage latencies, token counts and cache hit rates; shared with the FAQ processor
+    self.metrics = self.engine.metrics
+
+    # Async path: blocking retrieval runs on this executor, concurrent queries share one
+    # encode and one FAISS search, and outbound LLM calls are capped per event loop
+    self.executor = executor or ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag-retrieval")
+    self.max_concurrent_llm_calls = max_concurrent_llm_calls
+    self._llm_semaphores: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+    self._search_batcher = MicroBatcher(
+      self._search_batch, max_batch_size=max_batch_size, max_wait=max_batch_wait, executor=self.executor
     )
 
-    # Create prompt
-    prompt = f"""You are a helpful Shell customer service assistant. Use the following FAQ information to answer the customer's question accurately and helpfully.
+  @property
+  def faq_processor(self) -> Union[FAQProcessor, ShardedIndex]:
+    # Read on every use so a refreshed engine index takes effect immediately
+    return self.engine.faq_processor
 
-Context from Shell FAQs:
-{context}
+  @property
+  def answer_cache(self) -> Optional[AnswerCache]:
+    return self.engine.answer_cache
 
-Customer Question: {question}
+  def answer_question(self, question: str, history: Optional[Sequence[Dict]] = None) -> Dict:
+    """
+    Answer a question using RAG. `history` holds the conversation's earlier
+    {"role": "user"/"assistant", "content"} messages, oldest first.
+    """
+    with self.metrics.span("answer.total"):
+      self.metrics.increment("questions_total")
+      relevant_faqs, query_embedding, cached_answer, fast_answer = self._retrieve(question, history)
 
-Please provide a clear, helpful answer based on the FAQ information. If the FAQs don't contain enough information, politely say so and suggest contacting Shell support directly.
+      if not relevant_faqs:
+        return {"answer": NO_RESULTS_ANSWER, "sources": []}
+      if fast_answer is not None:
+        return fast_answer
+      if cached_answer is not None:
+        return {"answer": cached_answer, "sources": relevant_faqs, "question": question, "cached": True}
 
-Answer:"""
+      with self.metrics.span("answer.prompt"):
+        messages = self.context_builder.build(question, relevant_faqs, history)
 
-    # Generate response
+      # Generate response
+      try:
+        with self.metrics.span("answer.llm"):
+          response = self.llm.invoke(messages)
+        answer = response.content
+      except Exception as e:
+        answer = self._error_answer(e)
+      else:
+        self._record_llm_usage(messages, answer)
+        if self.answer_cache and query_embedding is not None:
+          self.answer_cache.store(relevant_faqs, query_embedding, question, answer)
+
+      return {"answer": answer, "sources": relevant_faqs, "question": question, "cached": False}
+
+  def stream_answer(self, question: str, history: Optional[Sequence[Dict]] = None) -> Dict:
+    """
+    Streaming variant of answer_question. Retrieval runs before this returns, so
+    `sources` is available immediately; `answer_stream` yields text chunks as the
+    LLM generates them.
+    """
+    self.metrics.increment("questions_total")
+    relevant_faqs, query_embedding, cached_answer, fast_answer = self._retrieve(question, history)
+
+    if not relevant_faqs:
+      return {"answer_stream": iter([NO_RESULTS_ANSWER]), "sources": []}
+    if fast_answer is not None:
+      answer = fast_answer.pop("answer")
+      return {**fast_answer, "answer_stream": iter([answer])}
+    if cached_answer is not None:
+      return {"answer_stream": iter([cached_answer]), "sources": relevant_faqs, "question": question, "cached": True}
+
+    with self.metrics.span("answer.prompt"):
+      messages = self.context_builder.build(question, relevant_faqs, history)
+    return {
+      "answer_stream": self._stream_llm(messages, question, relevant_faqs, query_embedding),
+      "sources": relevant_faqs,
+      "question": question,
+      "cached": False,
+    }
+
+  def _retrieve(self, question: str, history: Optional[Sequence[Dict]] = None):
+    """
+    Relevant FAQs, the query embedding (when the answer cache needs it), any cached answer,
+    and the fast-path result when retrieval is confident enough to skip the LLM.
+    Answers within a conversation may lean on earlier turns, so they bypass the answer cache.
+    """
+    query = self.context_builder.retrieval_query(question, history)
+    # Retrieve relevant FAQs
+    with self.metrics.span("answer.retrieve"):
+      relevant_faqs = self.faq_processor.search(query, top_k=self.engine.retrieval_depth)
+
+    # Gate on the bi-encoder ranking the fast path was calibrated on (see FastPathTable.match),
+    # then narrow the context
+    fast_answer = self._fast_path_answer(question, relevant_faqs) if query == question else None
+    if fast_answer is None:
+      relevant_faqs = self._select_context(query, relevant_faqs)
+
+    query_embedding, cached_answer = None, None
+    if relevant_faqs and fast_answer is None and self.answer_cache and not history:
+      with self.metrics.span("answer.cache_lookup"):
+        query_embedding = self.faq_processor.embed_query(question)
+        cached_answer = self.answer_cache.lookup(relevant_faqs, query_embedding)
+
+    return relevant_faqs, query_embedding, cached_answer, fast_answer
+
+  def _fast_path_answer(self, question: str, relevant_faqs: List[Dict]) -> Optional[Dict]:
+    """Result built from the precomputed answer table, if the top FAQ clears its confidence gate"""
+    table = self.faq_processor.fast_path if self.use_fast_path else None
+    entry = table.match(relevant_faqs) if table else None
+    if entry is None:
+      return None
+
+    self.metrics.increment("fast_path_answers_total")
+    return {"answer": entry["answer"], "sources": relevant_faqs[:1], "question": question, "cached": False, "fast_path": True}
+
+  def _select_context(self, question: str, candidates: List[Dict]) -> List[Dict]:
+    """FAQs to put in the prompt: the reranker's picks, or the top CONTEXT_FAQS as retrieved"""
+    reranker = self.engine.reranker
+    return reranker.rerank(question, candidates) if reranker else candidates[:CONTEXT_FAQS]
+
+  def _stream_llm(
+    self, messages: List[BaseMessage], question: str, relevant_faqs: List[Dict], query_embedding: Optional[np.ndarray]
+  ) -> Iterator[str]:
+    parts = []
+    start = time.perf_counter()
     try:
-      response = self.llm.invoke([HumanMessage(content=prompt)])
+      for chunk in self.llm.stream(messages):
+        if chunk.content:
+          if not parts:
+            self.metrics.observe("answer.llm_first_token", time.perf_counter() - start)
+          parts.append(chunk.content)
+          yield chunk.content
+    except Exception as e:
+      yield self._error_answer(e)
+      return
+    # Includes the time the consumer spends between chunks
+    self.metrics.observe("answer.llm", time.perf_counter() - start)
+    self._record_llm_usage(messages, "".join(parts))
+
+    # Only complete answers are cached
+    if self.answer_cache and query_embedding is not None:
+      self.answer_cache.store(relevant_faqs, query_embedding, question, "".join(parts))
+
+  async def aanswer_question(self, question: str, history: Optional[Sequence[Dict]] = None) -> Dict:
+    """Async variant of answer_question, safe to run many times concurrently on one event loop"""
+    loop = asyncio.get_running_loop()
+    self.metrics.increment("questions_total")
+    query = self.context_builder.retrieval_query(question, history)
+
+    # Concurrent questions are encoded and searched together; the SQLite cache runs off-loop
+    with self.metrics.span("answer.retrieve"):
+      query_embedding, relevant_faqs = await self.asearch(query, top_k=self.engine.retrieval_depth)
+
+    if not relevant_faqs:
+      return {"answer": NO_RESULTS_ANSWER, "sources": []}
+    fast_answer = self._fast_path_answer(question, relevant_faqs) if query == question else None
+    if fast_answer is not None:
+      return fast_answer
+    if self.engine.reranker:
+      relevant_faqs = await loop.run_in_executor(self.executor, self._select_context, query, relevant_faqs)
+
+    if self.answer_cache and not history:
+      with self.metrics.span("answer.cache_lookup"):
+        if query_embedding is None:  # Settled by BM25 without encoding
+          query_embedding = await loop.run_in_executor(self.executor, self.faq_processor.embed_query, question)
+        cached_answer = await loop.run_in_executor(
+          self.executor, self.answer_cache.lookup, relevant_faqs, query_embedding
+        )
+      if cached_answer is not None:
+        return {"answer": cached_answer, "sources": relevant_faqs, "question": question, "cached": True}
+
+    messages = self.context_builder.build(question, relevant_faqs, history)
+
+    try:
+      async with self._llm_semaphore():
+        with self.metrics.span("answer.llm"):
+          response = await self.llm.ainvoke(messages)
       answer = response.content
     except Exception as e:
-      answer = f"I apologize, but I'm having trouble processing your question right now. Error: {str(e)}"
+      answer = self._error_answer(e)
+    else:
+      self._record_llm_usage(messages, answer)
+      if self.answer_cache and not history:
+        await loop.run_in_executor(
+          self.executor, self.answer_cache.store, relevant_faqs, query_embedding, question, answer
+        )
+
+    return {"answer": answer, "sources": relevant_faqs, "question": question, "cached": False}
+
+  def _record_llm_usage(self, messages: List[BaseMessage], answer: str) -> None:
+    self.metrics.increment("llm_calls_total")
+    prompt_tokens = count_tokens("\n".join(message.content for message in messages), self.token_model)
+    if prompt_tokens is not None:
+      self.metrics.increment("llm_prompt_tokens_total", prompt_tokens)
+      self.metrics.increment("llm_completion_tokens_total", count_tokens(answer, self.token_model))
+
+  async def asearch(self, question: str, top_k: int = 3) -> Tuple[Optional[np.ndarray], List[Dict]]:
+    """
+    Query embedding and top-k FAQs; concurrent calls share one encode and one FAISS search.
+    The embedding is None when BM25 settled the question without encoding it.
+    """
+    return await self._search_batcher.submit((question, top_k))
+
+  def _search_batch(self, requests: List[Tuple[str, int]]) -> List[Tuple[Optional[np.ndarray], List[Dict]]]:
+    processor = self.faq_processor
+    questions = [question for question, _ in requests]
+    # One search at the largest requested depth; shallower requests take a prefix
+    top_k = max(top_k for _, top_k in requests)
+    if isinstance(processor, FAQProcessor) and (processor.retrieval_mode != "dense" or processor.lexical_first):
+      # BM25 settles what it can unencoded; the rest are encoded together, then ranked query by query
+      results = [processor.lexical_results(question, top_k) for question in questions]
+      pending = [i for i, hits in enumerate(results) if hits is None]
+      embeddings: List[Optional[np.ndarray]] = [None] * len(questions)
+      if pending:
+        encoded = processor.embed_queries([questions[i] for i in pending])
+        for row, i in enumerate(pending):
+          embeddings[i] = encoded[row : row + 1]
+          results[i] = processor.search(questions[i], top_k, query_embedding=embeddings[i])
+    else:
+      encoded = processor.embed_queries(questions)
+      embeddings = [encoded[i : i + 1] for i in range(len(questions))]
+      results = processor.search_embeddings(encoded, top_k)
+    return [(embeddings[i], hits[:top_k]) for i, ((_, top_k), hits) in enumerate(zip(requests, results))]
+
+  def _llm_semaphore(self) -> asyncio.Semaphore:
+    # asyncio primitives belong to one loop, so keep one limiter per running loop
+    loop = asyncio.get_running_loop()
+    if loop not in self._llm_semaphores:
+      self._llm_semaphores = {
+        known: semaphore for known, semaphore in self._llm_semaphores.items() if not known.is_closed()
+      }
+      self._llm_semaphores[loop] = asyncio.Semaphore(self.max_concurrent_llm_calls)
+    return self._llm_semaphores[loop]
+
+  @staticmethod
+  def _error_answer(error: Exception) -> str:
+    return f"I apologize, but I'm having trouble processing your question right now. Error: {str(error)}"
+
+
+def faq_answer_generator(llm: BaseChatModel) -> Callable[[Dict], str]:
+  """LLM-written answer to an FAQ's own title, for pre-generating FAQProcessor.build_fast_path answers"""
+
+  def generate(faq: Dict) -> str:
+    return llm.invoke(ContextBuilder().build(faq["question"], [faq])).content
 
-    return {"answer": answer, "sources": relevant_faqs, "question": question}
+  return generate
 
 
 if __name__ == "__main__":
@@ -0,0 +1,118 @@
+import hashlib
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
+
+from cachetools import LRUCache
+
+from metrics import REGISTRY, Metrics
+from query_cache import QueryCache
+
+if TYPE_CHECKING:
+  from sentence_transformers import CrossEncoder
+
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class CrossEncoderReranker:
+  """Rescores bi-encoder candidates with a cross-encoder, keeping only the best few.
+
+  Candidates are scored in bi-encoder order, `batch_size` pairs at a time. A new
+  batch is only started while the `budget` (seconds) lasts and while the previous
+  batch still changed the top `top_k`; later candidates rarely overtake once it
+  stops doing so. Unscored candidates are dropped. Scores are cached per
+  (normalized query, FAQ text), so repeated questions cost nothing to rerank.
+  """
+
+  def __init__(
+    self,
+    model_name: str = DEFAULT_RERANK_MODEL,
+    top_k: int = 2,
+    batch_size: int = 8,
+    budget: float = 0.15,
+    min_score: Optional[float] = None,
+    cache_size: int = 8192,
+    metrics: Optional[Metrics] = None,
+  ):
+    """
+    min_score drops candidates the cross-encoder scores below it (in the model's own
+    units, e.g. logits for the ms-marco models); the best candidate is always kept.
+    """
+    self.model_name = model_name
+    self.top_k = top_k
+    self.batch_size = batch_size
+    self.budget = budget
+    self.min_score = min_score
+    self._model: Optional["CrossEncoder"] = None
+    self._model_lock = threading.Lock()
+    self._scores: LRUCache = LRUCache(maxsize=cache_size)
+    self._cache_lock = threading.Lock()  # cachetools caches are not thread-safe
+    self.hits = 0
+    self.misses = 0
+    self.metrics = metrics or REGISTRY
+    self.metrics.register_gauge("rerank_cache_hit_rate", lambda: self.hits / max(self.hits + self.misses, 1))
+
+  @property
+  def model(self) -> "CrossEncoder":
+    """Cross-encoder, constructed on first use"""
+    if self._model is None:
+      with self._model_lock:
+        if self._model is None:
+          from sentence_transformers import CrossEncoder
+
+          self._model = CrossEncoder(self.model_name)
+    return self._model
+
+  @staticmethod
+  def document(faq: Dict) -> str:
+    """Text scored against the query: the FAQ question and its best-matching passages"""
+    return f"{faq['question']}\n{' ... '.join(faq.get('passages') or [faq['answer']])}"
+
+  def rerank(self, query: str, candidates: Sequence[Dict]) -> List[Dict]:
+    """Best `top_k` candidates by cross-encoder score, each with a `rerank_score` added"""
+    if not candidates:
+      return []
+
+    with self.metrics.span("rerank.total"):
+      normalized = QueryCache.normalize(query)
+      keys = [
+        (normalized, hashlib.sha1(self.document(faq).encode("utf-8")).hexdigest()) for faq in candidates
+      ]
+      with self._cache_lock:
+        scores = [self._scores.get(key) for key in keys]
+        cached = sum(score is not None for score in scores)
+        self.hits += cached
+        self.misses += len(scores) - cached
+
+      pending = [i for i, score in enumerate(scores) if score is None]
+      deadline = time.perf_counter() + self.budget
+      top = self._top(scores)
+      for start in range(0, len(pending), self.batch_size):
+        if start and time.perf_counter() >= deadline:
+          self.metrics.increment("rerank_budget_exhausted_total")
+          break
+        batch = pending[start : start + self.batch_size]
+        with self.metrics.span("rerank.predict"):
+          predicted = self.model.predict([(query, self.document(candidates[i])) for i in batch])
+        with self._cache_lock:
+          for i, score in zip(batch, predicted):
+            scores[i] = self._scores[keys[i]] = float(score)
+        self.metrics.increment("rerank_pairs_scored_total", len(batch))
+
+        previous, top = top, self._top(scores)
+        if start and top == previous:
+          break  # Early cutoff: this batch could not displace any of the current best
+
+      results = []
+      for i in top:
+        if results and self.min_score is not None and scores[i] < self.min_score:
+          break
+        result = candidates[i].copy()
+        result["rerank_score"] = scores[i]
+        results.append(result)
+      return results
+
+  def _top(self, scores: List[Optional[float]]) -> List[int]:
+    """Indexes of the best `top_k` scored candidates, best first; ties keep bi-encoder order"""
+    scored = [i for i, score in enumerate(scores) if score is not None]
+    return sorted(scored, key=lambda i: -scores[i])[: self.top_k]
@@ -0,0 +1,295 @@
+import asyncio
+import json
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from benchmark import latency_summary
+from metrics import REGISTRY
+from rag_service import RAGService
+
+MAX_BODY_BYTES = 1 << 20
+MAX_TOP_K = 50
+
+REASONS = {
+  200: "OK",
+  400: "Bad Request",
+  404: "Not Found",
+  405: "Method Not Allowed",
+  411: "Length Required",
+  413: "Payload Too Large",
+  500: "Internal Server Error",
+  501: "Not Implemented",
+  503: "Service Unavailable",
+  504: "Gateway Timeout",
+}
+
+
+class StubChatModel(BaseChatModel):
+  """Canned-answer chat model for running and load-testing the server without an OpenAI key"""
+
+  latency: float = 0.0  # Simulated generation time, seconds
+
+  @property
+  def _llm_type(self) -> str:
+    return "stub"
+
+  def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+    time.sleep(self.latency)
+    return self._answer(messages)
+
+  async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+    await asyncio.sleep(self.latency)
+    return self._answer(messages)
+
+  @staticmethod
+  def _answer(messages: List[BaseMessage]) -> ChatResult:
+    # Echo the best FAQ's question so answers still follow retrieval
+    match = re.search(r"^Q: (.*)$", messages[-1].content, re.MULTILINE)
+    text = f"(stub answer) See the FAQ: {match.group(1)}" if match else "(stub answer) No FAQ context."
+    return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+
+class HTTPError(Exception):
+  def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+    super().__init__(message)
+    self.status = status
+    self.headers = headers or {}
+
+
+class FAQServer:
+  """Minimal asyncio HTTP/1.1 server keeping one RAGService resident.
+
+  POST /search {"query", "top_k"} and POST /answer {"question", "history"} share the
+  service's micro-batcher, so concurrent requests are encoded and searched
+  together. Beyond `max_pending` requests in flight, new ones get 503 with
+  Retry-After instead of queueing without bound. Connections that take more
+  than `idle_timeout` seconds to send a request are closed. GET /healthz reports
+  liveness, GET /readyz whether the index is loaded, GET /metrics exports
+  Prometheus text.
+  """
+
+  def __init__(
+    self,
+    rag_factory: Callable[[], RAGService],
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    max_pending: int = 256,
+    request_timeout: float = 30.0,
+    reload_interval: float = 30.0,
+    idle_timeout: float = 15.0,
+  ):
+    self.rag_factory = rag_factory
+    self.host = host
+    self.port = port
+    self.max_pending = max_pending
+    self.request_timeout = request_timeout
+    self.reload_interval = reload_interval
+    self.idle_timeout = idle_timeout
+    self.rag: Optional[RAGService] = None
+    self.load_error: Optional[str] = None
+    self._in_flight = 0
+    self._background: set = set()
+
+  async def serve(self) -> None:
+    # Listen right away so liveness probes pass while the model and index load
+    server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+    print(f"🚀 Serving on http://{self.host}:{self.port} (loading index...)")
+    task = asyncio.create_task(self._load())
+    self._background.add(task)
+    async with server:
+      await server.serve_forever()
+
+  async def _load(self) -> None:
+    loop = asyncio.get_running_loop()
+    try:
+      self.rag = await loop.run_in_executor(None, self.rag_factory)
+    except Exception as e:
+      self.load_error = str(e)
+      print(f"❌ Failed to load the RAG service: {e}")
+      return
+    print("✅ Ready")
+
+    # Pick up newly published index snapshots without a restart
+    if self.reload_interval:
+      self.rag.engine.watch(self.reload_interval)
+
+  async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+      while True:
+        # An idle or trickling client must not hold the connection forever
+        request_line, headers = await asyncio.wait_for(self._read_head(reader), self.idle_timeout)
+        if not request_line.strip():
+          break
+
+        body_read = False
+        try:
+          method, target, version = request_line.decode("latin-1").split()
+          body = await asyncio.wait_for(self._read_body(reader, headers), self.idle_timeout)
+          body_read = True
+          status, payload, extra_headers = await self._dispatch(method, target.split("?")[0], body)
+        except HTTPError as e:
+          status, payload, extra_headers = e.status, {"error": str(e)}, e.headers
+          version = "HTTP/1.1"
+        except ValueError:
+          status, payload, extra_headers, version = 400, {"error": "Malformed request"}, {}, "HTTP/1.0"
+
+        # A body left unread would be parsed as the next request, so such connections are closed
+        keep_alive = body_read and version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        self._write_response(writer, status, payload, extra_headers, keep_alive)
+        await writer.drain()
+        if not keep_alive:
+          break
+    except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+      pass
+    finally:
+      writer.close()
+
+  @staticmethod
+  async def _read_head(reader: asyncio.StreamReader) -> Tuple[bytes, Dict[str, str]]:
+    request_line = await reader.readline()
+    headers: Dict[str, str] = {}
+    if not request_line.strip():
+      return request_line, headers
+    while True:
+      line = await reader.readline()
+      if line in (b"\r\n", b"\n", b""):
+        return request_line, headers
+      name, _, value = line.decode("latin-1").partition(":")
+      headers[name.strip().lower()] = value.strip()
+
+  @staticmethod
+  async def _read_body(reader: asyncio.StreamReader, headers: Dict[str, str]) -> bytes:
+    encoding = headers.get("transfer-encoding", "").lower()
+    if encoding == "chunked":
+      raise HTTPError(411, "Chunked request bodies are not supported; send Content-Length")
+    if encoding:
+      raise HTTPError(501, f"Transfer-Encoding '{encoding}' is not supported")
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY_BYTES:
+      raise HTTPError(413, f"Request body exceeds {MAX_BODY_BYTES} bytes")
+    return await reader.readexactly(length) if length else b""
+
+  @staticmethod
+  def _write_response(writer, status: int, payload: Any, headers: Dict[str, str], keep_alive: bool) -> None:
+    if isinstance(payload, str):
+      body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+    else:
+      body, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json"
+
+    head = [
+      f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+      f"Content-Type: {content_type}",
+      f"Content-Length: {len(body)}",
+      f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ] + [f"{name}: {value}" for name, value in headers.items()]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+
+  async def _dispatch(self, method: str, path: str, body: bytes) -> Tuple[int, Any, Dict[str, str]]:
+    if path == "/healthz":
+      return 200, {"status": "ok"}, {}
+    if path == "/readyz":
+      ready = self.rag is not None
+      status = {"ready": ready, "error": self.load_error}
+      if ready:
+        status["faqs"] = len(self.rag.faq_processor.faqs)
+      return (200 if ready else 503), status, {}
+    if path == "/metrics":
+      return 200, REGISTRY.prometheus_text(), {}
+
+    handlers = {"/search": self._search, "/answer": self._answer}
+    if path not in handlers:
+      raise HTTPError(404, f"No route for {path}")
+    if method != "POST":
+      raise HTTPError(405, f"{path} expects POST", {"Allow": "POST"})
+    if self.rag is None:
+      raise HTTPError(503, self.load_error or "Index is still loading", {"Retry-After": "5"})
+    if self._in_flight >= self.max_pending:
+      REGISTRY.increment("http_rejected_total")
+      raise HTTPError(503, "Server overloaded, retry later", {"Retry-After": "1"})
+
+    try:
+      payload = json.loads(body or b"{}")
+    except ValueError:
+      raise HTTPError(400, "Body must be JSON")
+    if not isinstance(payload, dict):
+      raise HTTPError(400, "Body must be a JSON object")
+
+    self._in_flight += 1
+    try:
+      with REGISTRY.span(f"http{path.replace('/', '.')}"):
+        return 200, await asyncio.wait_for(handlers[path](payload), self.request_timeout), {}
+    except asyncio.TimeoutError:
+      raise HTTPError(504, f"No result within {self.request_timeout:g}s")
+    except HTTPError:
+      raise
+    except Exception as e:
+      raise HTTPError(500, str(e))
+    finally:
+      self._in_flight -= 1
+
+  async def _search(self, payload: Dict) -> Dict:
+    query = self._text_field(payload, "query")
+    top_k = payload.get("top_k", 3)
+    # bool is a subclass of int, so JSON true/false would otherwise pass as 1/0
+    if not isinstance(top_k, int) or isinstance(top_k, bool) or not 1 <= top_k <= MAX_TOP_K:
+      raise HTTPError(400, f"'top_k' must be an integer between 1 and {MAX_TOP_K}")
+    _, results = await self.rag.asearch(query, top_k)
+    return {"query": query, "results": results}
+
+  async def _answer(self, payload: Dict) -> Dict:
+    question = self._text_field(payload, "question")
+    history = payload.get("history") or []
+    if not isinstance(history, list) or not all(
+      isinstance(message, dict) and message.get("role") in ("user", "assistant") and isinstance(message.get("content"), str)
+      for message in history
+    ):
+      raise HTTPError(400, "'history' must be a list of {\"role\": \"user\"/\"assistant\", \"content\"} messages")
+    return await self.rag.aanswer_question(question, history)
+
+  @staticmethod
+  def _text_field(payload: Dict, name: str) -> str:
+    value = payload.get(name)
+    if not isinstance(value, str) or not value.strip():
+      raise HTTPError(400, f"'{name}' must be a non-empty string")
+    return value
+
+
+async def load_test(
+  url: str, questions: List[str], endpoint: str = "answer", num_requests: int = 200, concurrency: int = 16
+) -> Dict:
+  """Fire `num_requests` requests at a running server from `concurrency` clients; latency and status summary"""
+  field = "question" if endpoint == "answer" else "query"
+  latencies: List[float] = []
+  statuses: Dict[int, int] = {}
+  counter = iter(range(num_requests))
+
+  async def client(http: httpx.AsyncClient):
+    for i in counter:
+      start = time.perf_counter()
+      try:
+        status = (await http.post(f"/{endpoint}", json={field: questions[i % len(questions)]})).status_code
+      except httpx.HTTPError:
+        status = 0  # Connection-level failure
+      latencies.append(time.perf_counter() - start)
+      statuses[status] = statuses.get(status, 0) + 1
+
+  limits = httpx.Limits(max_connections=concurrency)
+  async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60.0) as http:
+    start = time.perf_counter()
+    await asyncio.gather(*(client(http) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+  return {
+    "endpoint": endpoint,
+    "requests": num_requests,
+    "concurrency": concurrency,
+    "statuses": statuses,
+    "latency": latency_summary(latencies),
+    "rps": num_requests / elapsed,
+  }
@@ -0,0 +1,273 @@
+import heapq
+import json
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence as SequenceABC
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from encoders import DEFAULT_BACKEND, EncoderMismatchError
+from faq_processor import FAQProcessor
+from metrics import REGISTRY, Metrics
+from snapshots import published_version
+
+REGISTRY_FILE = "shards.json"
+DEFAULT_SHARDS_DIR = "faq_shards"
+
+
+def load_registry(root: str = DEFAULT_SHARDS_DIR) -> Dict[str, Dict]:
+  """Shard name -> {"index", "faq_dir", "tags", "model_name", "encoder_backend", "count"}"""
+  path = Path(root) / REGISTRY_FILE
+  if not path.exists():
+    return {}
+  with open(path, "r", encoding="utf-8") as f:
+    return json.load(f)["shards"]
+
+
+def register_shard(
+  root: str, name: str, processor: FAQProcessor, faq_dir: str, tags: Optional[Dict[str, str]] = None
+) -> None:
+  """Record a shard saved at <root>/<name> (see shard_path) in the registry, replacing any entry of that name"""
+  shards = load_registry(root)
+  shards[name] = {
+    "index": shard_path(root, name),
+    "faq_dir": faq_dir,
+    "tags": tags if tags is not None else shards.get(name, {}).get("tags", {}),
+    "model_name": processor.model_name,
+    "encoder_backend": processor.encoder_backend or DEFAULT_BACKEND,
+    "count": len(processor.faqs),
+  }
+  path = Path(root) / REGISTRY_FILE
+  with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+    json.dump({"shards": shards}, f, indent=2)
+  os.replace(f"{path}.tmp", path)
+
+
+def shard_path(root: str, name: str) -> str:
+  return str(Path(root) / name)
+
+
+class ShardedIndex:
+  """Named FAQ indexes, each built and saved on its own, searched together as one.
+
+  A query is encoded once and its FAISS search fans out to the selected
+  shards in parallel. Shards that miss the `shard_timeout` deadline are left
+  out of that answer (and keep loading or searching in the background).
+  Per-shard top-k lists are merged by score, which is only meaningful
+  because every shard holds cosine scores from the same encoder, so fan-out
+  search is dense-only. Shards are loaded on first use; beyond `max_loaded`,
+  the least recently used one is dropped. Offers the search interface
+  RAGService uses from FAQProcessor.
+  """
+
+  def __init__(
+    self,
+    root: str = DEFAULT_SHARDS_DIR,
+    names: Optional[Sequence[str]] = None,
+    shard_timeout: float = 2.0,
+    max_loaded: Optional[int] = None,
+    max_workers: int = 8,
+    metrics: Optional[Metrics] = None,
+    verify_checksums: bool = False,
+    mmr_lambda: Optional[float] = None,
+  ):
+    """
+    `names` picks the shards searched by default (all registered shards when None).
+    With `verify_checksums`, shard loads hash every snapshot file (see FAQProcessor.load_index).
+    `mmr_lambda` diversifies each shard's results (see FAQProcessor) before they are merged.
+    """
+    self.root = root
+    self.shard_timeout = shard_timeout
+    self.max_loaded = max_loaded
+    self.verify_checksums = verify_checksums
+    self.mmr_lambda = mmr_lambda
+    self.metrics = metrics or REGISTRY
+    self.registry = load_registry(root)
+    if not self.registry:
+      raise FileNotFoundError(f"No shards registered in {Path(root) / REGISTRY_FILE}; build one with --shard")
+    self.default_names = self._validate(names) if names else list(self.registry)
+    self._all_by_default = not names
+
+    encoders = {(entry["model_name"], entry["encoder_backend"]) for entry in self.registry.values()}
+    if len(encoders) > 1:
+      raise EncoderMismatchError(f"Shards in {root} were built with different encoders: {sorted(encoders)}")
+    (model_name, backend), = encoders
+    # Encodes queries for every shard; shards themselves only run FAISS searches
+    self.encoder = FAQProcessor(model_name, metrics=self.metrics, encoder_backend=backend)
+
+    self._loaded: "OrderedDict[str, FAQProcessor]" = OrderedDict()
+    self._published: Dict[str, Optional[str]] = {}
+    self._lock = threading.Lock()
+    self._load_locks = {name: threading.Lock() for name in self.registry}
+    self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shard-search")
+    self.metrics.register_gauge("shards_loaded", lambda: len(self._loaded))
+
+  def select(self, **tags: str) -> List[str]:
+    """Names of the shards whose tags match all of `tags`, e.g. select(market="uk", product="ev")"""
+    return [
+      name for name, entry in self.registry.items()
+      if all(entry.get("tags", {}).get(key) == value for key, value in tags.items())
+    ]
+
+  def _validate(self, names: Sequence[str]) -> List[str]:
+    unknown = [name for name in names if name not in self.registry]
+    if unknown:
+      raise ValueError(f"Unknown shard(s) {', '.join(unknown)}; registered: {', '.join(self.registry)}")
+    return list(names)
+
+  def shard(self, name: str) -> FAQProcessor:
+    """The loaded processor for a shard, loading it on first use"""
+    with self._lock:
+      processor = self._loaded.get(name)
+      if processor is not None:
+        self._loaded.move_to_end(name)
+        return processor
+
+    # Per-shard lock: a slow load never blocks searches on shards already loaded
+    with self._load_locks[name]:
+      with self._lock:
+        if name in self._loaded:
+          return self._loaded[name]
+      processor = self._load(name)
+      with self._lock:
+        self._loaded[name] = processor
+        while self.max_loaded and len(self._loaded) > self.max_loaded:
+          evicted, _ = self._loaded.popitem(last=False)
+          self._published.pop(evicted, None)
+      return processor
+
+  def _load(self, name: str) -> FAQProcessor:
+    entry = self.registry[name]
+    processor = FAQProcessor(
+      self.encoder.model_name, cache_size=0, metrics=self.metrics, encoder_backend=self.encoder.encoder_backend,
+      mmr_lambda=self.mmr_lambda,
+    )
+    processor.load_index(entry["index"], verify_checksums=self.verify_checksums)
+    self._published[name] = self._published_marker(name)
+    return processor
+
+  def _published_marker(self, name: str) -> Optional[str]:
+    return published_version(self.registry[name]["index"])
+
+  def refresh(self) -> bool:
+    """Pick up newly registered shards and reload loaded shards republished since; True if anything changed"""
+    changed = False
+    registry = load_registry(self.root)
+    with self._lock:
+      for name in registry.keys() - self.registry.keys():
+        self._load_locks[name] = threading.Lock()
+        if self._all_by_default:
+          self.default_names.append(name)
+        changed = True
+      self.registry = registry
+      stale = [name for name in self._loaded if self._published_marker(name) != self._published.get(name)]
+
+    for name in stale:
+      try:
+        fresh = self._load(name)
+      except Exception as e:
+        print(f"❌ Failed to reload shard {name}, keeping the current one: {e}")
+        continue
+      with self._lock:
+        self._loaded[name] = fresh
+      print(f"✅ Reloaded shard {name}")
+      changed = True
+    return changed
+
+  def warm_up(self):
+    return self.encoder.warm_up()
+
+  def embed_query(self, query: str) -> np.ndarray:
+    return self.encoder.embed_query(query)
+
+  def embed_queries(self, queries: List[str]) -> np.ndarray:
+    return self.encoder.embed_queries(queries)
+
+  def search(self, query: str, top_k: int = 3, shards: Optional[Sequence[str]] = None) -> List[Dict]:
+    """Top-k FAQs for a query across `shards` (default: the index's default selection)"""
+    return self.search_embeddings(self.embed_query(query), top_k, shards)[0]
+
+  def search_batch(
+    self, queries: List[str], top_k: int = 3, batch_size: int = 64, shards: Optional[Sequence[str]] = None
+  ) -> List[List[Dict]]:
+    results = []
+    for start in range(0, len(queries), batch_size):
+      batch = queries[start : start + batch_size]
+      results.extend(self.search_embeddings(self.embed_queries(batch), top_k, shards))
+    return results
+
+  def search_embeddings(
+    self, query_embeddings: np.ndarray, top_k: int = 3, shards: Optional[Sequence[str]] = None
+  ) -> List[List[Dict]]:
+    """Fan the search out to the shards and merge per-query top-k lists by score; each result names its shard"""
+    names = self._validate(shards) if shards is not None else self.default_names
+    with self.metrics.span("search.shards"):
+      futures = {
+        self._executor.submit(self._search_shard, name, query_embeddings, top_k): name for name in names
+      }
+      done, pending = wait(futures, timeout=self.shard_timeout)
+
+    if pending:
+      self.metrics.increment("shard_timeouts_total", len(pending))
+    per_shard = []
+    for future in done:
+      try:
+        per_shard.append(future.result())
+      except Exception as e:
+        self.metrics.increment("shard_errors_total")
+        print(f"⚠️  Shard {futures[future]} failed: {e}")
+
+    with self.metrics.span("search.shard_merge"):
+      return [
+        heapq.nlargest(top_k, (hit for results in per_shard for hit in results[row]), key=lambda hit: hit["score"])
+        for row in range(len(query_embeddings))
+      ]
+
+  def _search_shard(self, name: str, query_embeddings: np.ndarray, top_k: int) -> List[List[Dict]]:
+    results = self.shard(name).search_embeddings(query_embeddings, top_k)
+    for row in results:
+      for result in row:
+        result["shard"] = name
+    return results
+
+  @property
+  def faqs(self) -> "ShardFAQs":
+    return ShardFAQs(self)
+
+  @property
+  def fast_path(self) -> "ShardedIndex":
+    # Each shard's table was calibrated on its own index; match() consults the top hit's shard
+    return self
+
+  def match(self, results: Sequence[Dict]) -> Optional[Dict]:
+    """FastPathTable.match against the table of the shard the top result came from"""
+    if not results:
+      return None
+    with self._lock:
+      processor = self._loaded.get(results[0].get("shard"))
+    table = processor.fast_path if processor else None
+    return table.match(results) if table else None
+
+
+class ShardFAQs(SequenceABC):
+  """Read-only view of the FAQs of every default shard, in shard order; indexing loads shards as needed"""
+
+  def __init__(self, index: ShardedIndex):
+    self.index = index
+    self.counts = [(name, index.registry[name]["count"]) for name in index.default_names]
+
+  def __len__(self) -> int:
+    return sum(count for _, count in self.counts)
+
+  def __getitem__(self, i: int) -> Dict:
+    if i < 0:
+      i += len(self)
+    for name, count in self.counts:
+      if i < count:
+        return self.index.shard(name).faqs[i]
+      i -= count
+    raise IndexError("FAQ index out of range")
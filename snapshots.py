@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# An index saved at prefix P lives in versioned directories under P.snapshots/, each
+# holding the index files as <version>/index.* plus a manifest. P.current names the
+# published version; replacing it is the single atomic step that publishes a build.
+SNAPSHOTS_SUFFIX = ".snapshots"
+POINTER_SUFFIX = ".current"
+MANIFEST_FILE = "manifest.json"
+SNAPSHOT_FILES = "index"  # File prefix inside a snapshot directory
+DEFAULT_KEEP = 3
+
+_VERSION = re.compile(r"^v(\d+)$")
+
+
+class SnapshotIntegrityError(ValueError):
+  """A snapshot's files do not match its manifest, or its parts disagree on row counts"""
+
+
+def index_prefix(filepath: str) -> str:
+  """Path prefix of an index; the legacy `faq_index.pkl` form names the same index as `faq_index`"""
+  return filepath[: -len(".pkl")] if filepath.endswith(".pkl") else filepath
+
+
+def snapshots_dir(prefix: str) -> Path:
+  return Path(f"{index_prefix(prefix)}{SNAPSHOTS_SUFFIX}")
+
+
+def pointer_path(prefix: str) -> Path:
+  return Path(f"{index_prefix(prefix)}{POINTER_SUFFIX}")
+
+
+def current_version(prefix: str) -> Optional[str]:
+  """Published snapshot version of the index at `prefix`, None if it has no snapshots"""
+  try:
+    return pointer_path(prefix).read_text(encoding="utf-8").strip() or None
+  except FileNotFoundError:
+    return None
+
+
+def current_snapshot(prefix: str) -> Optional[Path]:
+  version = current_version(prefix)
+  return snapshots_dir(prefix) / version if version else None
+
+
+def published_version(prefix: str) -> Optional[str]:
+  """
+  Changes whenever a new index is published at `prefix`: the snapshot version, or for
+  indexes saved before snapshots, the mtime of the meta file written last.
+  """
+  version = current_version(prefix)
+  if version:
+    return version
+  meta = Path(f"{index_prefix(prefix)}.meta.json")
+  return str(meta.stat().st_mtime_ns) if meta.exists() else None
+
+
+def versions(prefix: str) -> List[str]:
+  """Published snapshot versions, oldest first"""
+  root = snapshots_dir(prefix)
+  if not root.exists():
+    return []
+  found = [path.name for path in root.iterdir() if _VERSION.match(path.name) and path.is_dir()]
+  return sorted(found, key=lambda name: int(name[1:]))
+
+
+def stage(prefix: str) -> Path:
+  """Empty directory to write a new snapshot's files into before publish()"""
+  staging = snapshots_dir(prefix) / f".staging-{uuid.uuid4().hex}"
+  staging.mkdir(parents=True)
+  return staging
+
+
+def _sha256(path: Path) -> str:
+  digest = hashlib.sha256()
+  with open(path, "rb") as f:
+    for block in iter(lambda: f.read(1 << 20), b""):
+      digest.update(block)
+  return digest.hexdigest()
+
+
+def publish(prefix: str, staging: Path, info: Dict, keep: Optional[int] = DEFAULT_KEEP) -> str:
+  """
+  Checksum the staged files into a manifest (along with `info`), move them to the next
+  version and point the index at it. Versions beyond the newest `keep` are pruned.
+  """
+  files = {
+    path.name: {"size": path.stat().st_size, "sha256": _sha256(path)}
+    for path in sorted(staging.iterdir())
+    if path.is_file()
+  }
+  manifest = {**info, "created": time.time(), "files": files}
+  with open(staging / MANIFEST_FILE, "w", encoding="utf-8") as f:
+    json.dump(manifest, f, indent=2)
+
+  root = snapshots_dir(prefix)
+  while True:
+    existing = versions(prefix)
+    version = f"v{int(existing[-1][1:]) + 1 if existing else 1:06d}"
+    try:
+      staging.rename(root / version)  # Fails if another build took this version meanwhile
+      break
+    except OSError:
+      if not (root / version).exists():
+        raise
+
+  # Hashes are checked here, once, so loads can get by with the cheap size checks
+  verify(root / version, checksums=True)
+  activate(prefix, version)
+  if keep:
+    prune(prefix, keep)
+  return version
+
+
+def activate(prefix: str, version: str) -> None:
+  """Point the index at `version`; readers switch on their next load (also a rollback)"""
+  if not (snapshots_dir(prefix) / version / MANIFEST_FILE).exists():
+    raise FileNotFoundError(f"No snapshot {version} in {snapshots_dir(prefix)}")
+  pointer = pointer_path(prefix)
+  tmp = f"{pointer}.{uuid.uuid4().hex}.tmp"
+  with open(tmp, "w", encoding="utf-8") as f:
+    f.write(f"{version}\n")
+  os.replace(tmp, pointer)
+
+
+def prune(prefix: str, keep: int = DEFAULT_KEEP) -> List[str]:
+  """
+  Delete all but the newest `keep` versions, never the current one. Processes still
+  reading a deleted snapshot keep their open and memory-mapped files.
+  """
+  current = current_version(prefix)
+  stale = [version for version in versions(prefix)[:-keep] if version != current]
+  for version in stale:
+    shutil.rmtree(snapshots_dir(prefix) / version, ignore_errors=True)
+  return stale
+
+
+def read_manifest(directory: Path) -> Dict:
+  with open(directory / MANIFEST_FILE, "r", encoding="utf-8") as f:
+    return json.load(f)
+
+
+def verify(directory: Path, checksums: bool = False) -> Dict:
+  """The snapshot's manifest, after checking every file's size and (with `checksums`) SHA-256"""
+  try:
+    manifest = read_manifest(directory)
+  except FileNotFoundError:
+    raise SnapshotIntegrityError(f"{directory} has no {MANIFEST_FILE}") from None
+
+  for name, expected in manifest["files"].items():
+    path = directory / name
+    if not path.exists():
+      raise SnapshotIntegrityError(f"{path} is missing")
+    if path.stat().st_size != expected["size"]:
+      raise SnapshotIntegrityError(f"{path} is {path.stat().st_size} bytes, expected {expected['size']}")
+    if checksums and _sha256(path) != expected["sha256"]:
+      raise SnapshotIntegrityError(f"{path} does not match its checksum")
+  return manifest
+
+
+def describe(prefix: str) -> List[Dict]:
+  """Manifest summary of each snapshot, oldest first"""
+  current = current_version(prefix)
+  summaries = []
+  for version in versions(prefix):
+    directory = snapshots_dir(prefix) / version
+    try:
+      manifest = read_manifest(directory)
+    except FileNotFoundError:
+      continue
+    summaries.append(
+      {
+        "version": version,
+        "current": version == current,
+        "created": manifest.get("created"),
+        "model_name": manifest.get("model_name"),
+        "count": manifest.get("count"),
+        "passages": manifest.get("passages"),
+        "bytes": sum(entry["size"] for entry in manifest["files"].values()),
+      }
+    )
+  return summaries
+
+
+class SnapshotWatcher:
+  """Calls `refresh` every `interval` seconds on a daemon thread until stopped.
+
+  `refresh` is expected to be cheap when nothing was published (see
+  RetrievalEngine.refresh), and to swap a new index in without blocking readers.
+  """
+
+  def __init__(self, refresh: Callable[[], bool], interval: float = 5.0):
+    self.refresh = refresh
+    self.interval = interval
+    self._stop = threading.Event()
+    self._thread = threading.Thread(target=self._run, name="snapshot-watcher", daemon=True)
+
+  def start(self) -> "SnapshotWatcher":
+    self._thread.start()
+    return self
+
+  def stop(self) -> None:
+    self._stop.set()
+    self._thread.join()
+
+  def _run(self) -> None:
+    while not self._stop.wait(self.interval):
+      try:
+        self.refresh()
+      except Exception as e:
+        print(f"❌ Index refresh failed: {e}")
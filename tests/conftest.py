@@ -0,0 +1,38 @@
+import hashlib
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from faq_processor import FAQProcessor  # noqa: E402
+
+
+class HashEncoder:
+  """Deterministic bag-of-words stand-in for the sentence encoder, so tests run offline"""
+
+  dimension = 64
+
+  def encode(self, texts, show_progress_bar=False, batch_size=32, **kwargs):
+    vectors = np.full((len(texts), self.dimension), 0.01, dtype=np.float32)
+    for row, text in enumerate(texts):
+      for word in re.findall(r"\w+", text.lower()):
+        vectors[row, int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.dimension] += 1.0
+    return vectors
+
+
+@pytest.fixture
+def make_processor():
+  """FAQProcessor factory whose processors share one HashEncoder"""
+  encoder = HashEncoder()
+
+  def make() -> FAQProcessor:
+    processor = FAQProcessor(cache_size=0)
+    processor._model = encoder
+    return processor
+
+  return make
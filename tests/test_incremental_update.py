@@ -0,0 +1,63 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from extract_faq import DEFAULT_PARSER
+
+SAMPLE_FAQS = Path(__file__).resolve().parent.parent / "shell-retail" / "faq"
+
+
+def ranked(results):
+  """Results as comparable (filename, score) pairs; FAQ row numbers differ between the two builds"""
+  return sorted(((result["filename"], round(result["score"], 5)) for result in results), key=lambda hit: (-hit[1], hit[0]))
+
+
+@pytest.fixture
+def faq_dir(tmp_path):
+  directory = tmp_path / "faq"
+  directory.mkdir()
+  for html_file in sorted(SAMPLE_FAQS.glob("*.html"))[:8]:
+    shutil.copy(html_file, directory)
+  return directory
+
+
+def test_incremental_update_matches_full_rebuild(tmp_path, faq_dir, make_processor):
+  index_path = str(tmp_path / "faq_index")
+  make_processor().update_index(str(faq_dir), index_path, workers=1)  # No index yet: full build
+
+  files = sorted(faq_dir.glob("*.html"))
+  added, modified, deleted = sorted(SAMPLE_FAQS.glob("*.html"))[8], files[2], files[5]
+  shutil.copy(added, faq_dir)
+  modified.write_text(modified.read_text(encoding="utf-8").replace("Shell", "Shell Energy"), encoding="utf-8")
+  deleted.unlink()
+
+  incremental = make_processor()
+  stats = incremental.update_index(str(faq_dir), index_path, workers=1)
+  assert stats == {"added": 1, "modified": 1, "deleted": 1, "unchanged": 6}
+
+  full = make_processor()
+  full._full_rebuild(str(faq_dir), str(tmp_path / "full_index"), 1, DEFAULT_PARSER)
+  reloaded = make_processor()
+  reloaded.load_index(index_path)
+
+  assert sorted(faq["filename"] for faq in incremental.faqs) == sorted(faq["filename"] for faq in full.faqs)
+  assert len(incremental.passages) == len(full.passages)
+  modified_faq = next(faq for faq in incremental.faqs if faq["filename"] == modified.name)
+  assert "Shell Energy" in modified_faq["answer"] or "Shell Energy" in modified_faq["question"]
+
+  queries = [faq["question"] for faq in full.faqs] + ["shell app", "fuel card payment", "opening times"]
+  for query in queries:
+    expected = ranked(full.search(query, top_k=5))
+    assert ranked(incremental.search(query, top_k=5)) == expected
+    assert ranked(reloaded.search(query, top_k=5)) == expected
+
+
+def test_incremental_update_without_changes_publishes_nothing(tmp_path, faq_dir, make_processor):
+  index_path = str(tmp_path / "faq_index")
+  make_processor().update_index(str(faq_dir), index_path, workers=1)
+  snapshots = sorted(path.name for path in (tmp_path / "faq_index.snapshots").iterdir())
+
+  stats = make_processor().update_index(str(faq_dir), index_path, workers=1)
+  assert stats == {"added": 0, "modified": 0, "deleted": 0, "unchanged": 8}
+  assert sorted(path.name for path in (tmp_path / "faq_index.snapshots").iterdir()) == snapshots